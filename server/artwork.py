@@ -1,9 +1,13 @@
-from database import get_db_connection, dict_from_row, json_dumps
-from auth import verify_token
+from database import get_db_connection
+from middleware import verify_token
+from catalog_cache import CatalogCache
+from uploads import save_base64_image, UploadError
+from image_variants import pipeline, load_variant_index, srcsets
+from row_model import RowModel, Field, to_str, to_float
+from pagination import ListSpec, Filter, to_number
 import json
 import os
-import base64
-import time
+import binascii
 from decimal import Decimal
 
 # Create the uploads directory if it doesn't exist
@@ -17,8 +21,27 @@ def ensure_uploads_directory():
 # Call this function to ensure directory exists
 ensure_uploads_directory()
 
+# Cached responses for GET /artworks and GET /artworks/{id}
+artwork_cache = CatalogCache('artworks')
+
+def get_cached_artworks():
+    """Return the cache entry (data and JSON body) for the full artwork list"""
+    return artwork_cache.get('all', get_all_artworks)
+
+def get_cached_artwork_page(query):
+    """Return the cache entry for one page of a filtered artwork listing"""
+    return artwork_cache.get(query.key, lambda: get_artwork_page(query))
+
+def get_cached_artwork(artwork_id):
+    """Return the cache entry for a single artwork"""
+    return artwork_cache.get(('artwork', int(artwork_id)), lambda: get_artwork(artwork_id))
+
+def invalidate_artwork_cache():
+    """Call after any write to the artworks table"""
+    artwork_cache.invalidate()
+
 # Function to handle image storage
-def save_image_from_base64(base64_str, name_prefix="artwork"):
+def save_image_from_base64(base64_str):
     """Save a base64 image to the uploads directory and return the path"""
     # Handle empty strings or None values
     if not base64_str:
@@ -29,43 +52,51 @@ def save_image_from_base64(base64_str, name_prefix="artwork"):
         return base64_str
     
     try:
-        # Extract the image data from the base64 string
-        if "," in base64_str:
-            # For format like "data:image/jpeg;base64,/9j/4AAQSk..."
-            image_format, base64_data = base64_str.split(",", 1)
-            if ';base64' not in image_format:
-                print("Warning: Not a valid base64 image format")
-                return None
-        else:
-            # Assume it's just the base64 data
-            base64_data = base64_str
-        
-        try:
-            # Decode the base64 data
-            image_data = base64.b64decode(base64_data)
-        except Exception as e:
-            print(f"Failed to decode base64 data: {e}")
-            return "/static/uploads/placeholder.jpg"
-        
-        # Generate a unique filename based on timestamp
-        timestamp = time.strftime("%Y%m%d%H%M%S")
-        filename = f"{name_prefix}_{timestamp}.jpg"
-        
-        # Save to the uploads directory
-        uploads_dir = os.path.join(os.path.dirname(__file__), "static", "uploads")
-        if not os.path.exists(uploads_dir):
-            os.makedirs(uploads_dir)
-            
-        file_path = os.path.join(uploads_dir, filename)
-        with open(file_path, "wb") as f:
-            f.write(image_data)
-        
-        # Return the URL path to the image (ALWAYS use the standard format)
-        return f"/static/uploads/{filename}"
+        # Decoded in slices straight to a temp file, then renamed into place
+        saved_path = save_base64_image(base64_str)
+        # Resized variants are made in the background; the cached listings
+        # are refreshed once they exist
+        pipeline.submit(saved_path, invalidate_artwork_cache)
+        return saved_path
+    except UploadError as e:
+        print(f"Warning: {e}")
+        return None
+    except binascii.Error as e:
+        print(f"Failed to decode base64 data: {e}")
+        return "/static/uploads/placeholder.jpg"
     except Exception as e:
         print(f"Error saving image: {e}")
         return None
 
+def artwork_image_url(image_url):
+    """Always serve images from /static/ (inline base64 is converted by migrate_images.py)"""
+    if image_url and not image_url.startswith(('/static/', 'data:')):
+        return f"/static/uploads/{os.path.basename(image_url)}"
+    return image_url
+
+# Columns returned by the artwork endpoints; ids are strings to match the frontend
+ARTWORK_MODEL = RowModel('artworks', [
+    Field('id', convert=to_str),
+    Field('title'),
+    Field('artist'),
+    Field('description'),
+    Field('price', convert=to_float),
+    Field('image_url', convert=artwork_image_url),
+    Field('dimensions'),
+    Field('medium'),
+    Field('year'),
+    Field('status'),
+])
+
+# Sorting and filters accepted by GET /artworks (see pagination.py)
+ARTWORK_LIST = ListSpec('artworks', sorts={'created_at': 'desc', 'id': 'desc'}, filters=[
+    Filter('status', 'status', choices=('available', 'sold')),
+    Filter('artist', 'artist'),
+    Filter('medium', 'medium'),
+    Filter('min_price', 'price', '>=', to_number),
+    Filter('max_price', 'price', '<=', to_number),
+])
+
 def get_all_artworks():
     """Get all artworks from the database"""
     connection = get_db_connection()
@@ -75,40 +106,17 @@ def get_all_artworks():
     cursor = connection.cursor()
     
     try:
-        query = """
-        SELECT id, title, artist, description, price, image_url, 
-               dimensions, medium, year, status
+        query = f"""
+        SELECT {ARTWORK_MODEL.select}
         FROM artworks
         ORDER BY created_at DESC
         """
         cursor.execute(query)
-        rows = cursor.fetchall()
+        artworks = ARTWORK_MODEL.to_dicts(cursor, cursor.fetchall())
         
-        artworks = []
-        for row in rows:
-            artwork = dict_from_row(row, cursor)
-            
-            # Convert id to string to match frontend expectations
-            artwork['id'] = str(artwork['id'])
-            
-            # Format image URL if needed - ALWAYS ensure it has the correct prefix
-            if artwork['image_url']:
-                # Handle base64 images
-                if artwork['image_url'].startswith('data:') or 'base64' in artwork['image_url']:
-                    # Save the base64 image to a file and get its path
-                    saved_path = save_image_from_base64(artwork['image_url'])
-                    if saved_path:
-                        # Update the database with the new path
-                        update_artwork_image(artwork['id'], saved_path)
-                        artwork['image_url'] = saved_path
-                        print(f"Converted base64 image to file: {saved_path}")
-                elif not artwork['image_url'].startswith('/static/'):
-                    artwork['image_url'] = f"/static/uploads/{os.path.basename(artwork['image_url'])}"
-                
-                # Log the final image URL for debugging
-                print(f"Final image URL for {artwork['title']}: {artwork['image_url']}")
-                
-            artworks.append(artwork)
+        variant_index = load_variant_index()
+        for artwork in artworks:
+            artwork['image_variants'] = srcsets(artwork['image_url'], variant_index)
         
         return {"artworks": artworks}
     except Exception as e:
@@ -119,26 +127,26 @@ def get_all_artworks():
             cursor.close()
             connection.close()
 
-def update_artwork_image(artwork_id, image_path):
-    """Update the image_url in the database for an artwork"""
+def get_artwork_page(query):
+    """Get one page of artworks for a pagination.PageQuery"""
     connection = get_db_connection()
     if connection is None:
-        return False
+        return {"error": "Database connection failed"}
     
     cursor = connection.cursor()
     
     try:
-        query = """
-        UPDATE artworks
-        SET image_url = %s
-        WHERE id = %s
-        """
-        cursor.execute(query, (image_path, artwork_id))
-        connection.commit()
-        return True
+        cursor.execute(*query.sql(ARTWORK_MODEL.select))
+        artworks, next_cursor = query.page(ARTWORK_MODEL, cursor, cursor.fetchall())
+        
+        variant_index = load_variant_index()
+        for artwork in artworks:
+            artwork['image_variants'] = srcsets(artwork['image_url'], variant_index)
+        
+        return {"artworks": artworks, "nextCursor": next_cursor}
     except Exception as e:
-        print(f"Error updating artwork image: {e}")
-        return False
+        print(f"Error getting artworks: {e}")
+        return {"error": str(e)}
     finally:
         if connection.is_connected():
             cursor.close()
@@ -153,9 +161,8 @@ def get_artwork(artwork_id):
     cursor = connection.cursor()
     
     try:
-        query = """
-        SELECT id, title, artist, description, price, image_url, 
-               dimensions, medium, year, status
+        query = f"""
+        SELECT {ARTWORK_MODEL.select}
         FROM artworks
         WHERE id = %s
         """
@@ -165,23 +172,8 @@ def get_artwork(artwork_id):
         if not row:
             return {"error": "Artwork not found"}
         
-        artwork = dict_from_row(row, cursor)
-        # Convert id to string to match frontend expectations
-        artwork['id'] = str(artwork['id'])
-        
-        # Format image URL if needed
-        if artwork['image_url']:
-            # Handle base64 images
-            if artwork['image_url'].startswith('data:') or 'base64' in artwork['image_url']:
-                # Save the base64 image to a file and get its path
-                saved_path = save_image_from_base64(artwork['image_url'])
-                if saved_path:
-                    # Update the database with the new path
-                    update_artwork_image(artwork['id'], saved_path)
-                    artwork['image_url'] = saved_path
-                    print(f"Converted base64 image to file: {saved_path}")
-            elif not artwork['image_url'].startswith('/static/'):
-                artwork['image_url'] = f"/static/uploads/{os.path.basename(artwork['image_url'])}"
+        artwork = ARTWORK_MODEL.to_dict(cursor, row)
+        artwork['image_variants'] = srcsets(artwork['image_url'], load_variant_index())
         
         return artwork
     except Exception as e:
@@ -279,6 +271,7 @@ def create_artwork(auth_header, artwork_data):
             artwork_data.get("status", "available")
         ))
         connection.commit()
+        invalidate_artwork_cache()
         
         # Return the newly created artwork
         new_artwork_id = cursor.lastrowid
@@ -367,6 +360,7 @@ def update_artwork(auth_header, artwork_id, artwork_data):
         # Check if artwork was found and updated
         if cursor.rowcount == 0:
             return {"error": "Artwork not found"}
+        invalidate_artwork_cache()
         
         # Return the updated artwork
         return get_artwork(artwork_id)
@@ -419,6 +413,7 @@ def delete_artwork(auth_header, artwork_id):
         # Check if artwork was found and deleted
         if cursor.rowcount == 0:
             return {"error": "Artwork not found"}
+        invalidate_artwork_cache()
         
         return {"success": True, "message": "Artwork deleted successfully"}
     except Exception as e:
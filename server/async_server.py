@@ -0,0 +1,271 @@
+import asyncio
+import http.client
+import io
+import signal
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+
+import mpesa_async
+from prefork import notify_ready
+from pool_server import DEFAULT_THREADS, DEFAULT_REQUEST_TIMEOUT, DEFAULT_IDLE_TIMEOUT, bodiless_status
+from serializer import dumps_bytes, loads
+from payment_events import wait_timeout
+from router import Router
+
+# Limits for the asyncio front end
+MAX_HEADER_SIZE = 64 * 1024
+MAX_BODY_SIZE = 20 * 1024 * 1024  # base64 images are posted inline
+
+
+def run_sync_handler(handler_class, server, raw_request, client_address):
+    """Run one request through a BaseHTTPRequestHandler subclass in memory
+
+    The handler reads the request from and writes the response to in-memory
+    buffers, so every existing route works unchanged. Returns the raw HTTP
+    response bytes the handler produced.
+
+    Nothing is streamed: the request body arrives whole (up to
+    MAX_BODY_SIZE) and the response is held in memory until the handler
+    returns, so static files skip sendfile and uploads and exports are
+    buffered in full.
+    """
+    handler = handler_class.__new__(handler_class)
+    handler.server = server
+    handler.client_address = client_address
+    handler.request = None
+    handler.connection = None
+    handler.rfile = io.BytesIO(raw_request)
+    handler.wfile = io.BytesIO()
+    handler.close_connection = True
+    handler.handle_one_request()
+    return handler.wfile.getvalue()
+
+
+def split_response(raw):
+    """Split raw response bytes into (status, headers list, body)"""
+    head, _, body = raw.partition(b"\r\n\r\n")
+    status_line, _, header_block = head.partition(b"\r\n")
+    status = int(status_line.split()[1])
+    headers = http.client.parse_headers(io.BytesIO(header_block + b"\r\n\r\n"))
+    kept = [(name, value) for name, value in headers.items()
+            if name.lower() not in ('content-length', 'connection', 'transfer-encoding')]
+    return status, kept, body
+
+
+class AsyncHTTPServer:
+    """asyncio HTTP/1.1 front end for RequestHandler
+
+    Connections are handled by coroutines. The M-Pesa STK push and status
+    routes, which spend seconds waiting on Safaricom, run natively on aiohttp
+    and aiomysql when those packages are installed. All other routes are run
+    by the regular RequestHandler on a small thread pool.
+    """
+
+    def __init__(self, handler_class, port, threads=DEFAULT_THREADS,
+                 request_timeout=DEFAULT_REQUEST_TIMEOUT, idle_timeout=DEFAULT_IDLE_TIMEOUT,
+                 reuse_port=False):
+        self.handler_class = handler_class
+        self.reuse_port = reuse_port
+        self.port = port
+        self.request_timeout = request_timeout
+        self.idle_timeout = idle_timeout
+        self.threads = threads
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="async-bridge")
+        self.mpesa = mpesa_async.AsyncMpesaClient() if mpesa_async.is_available() else None
+        # Native handlers get (JSON body as a dict, query parameters, path parameters)
+        self.native_routes = Router()
+        if self.mpesa is not None:
+            self.native_routes.add('POST', '/mpesa/stk-push',
+                                   lambda data, query: self.mpesa.handle_stk_push_request(data))
+            self.native_routes.add('POST', '/mpesa/status/{checkout_request_id}',
+                                   lambda data, query, checkout_request_id:
+                                   self.mpesa.check_transaction_status(checkout_request_id))
+            self.native_routes.add('POST', '/mpesa/status/{checkout_request_id}/wait',
+                                   lambda data, query, checkout_request_id:
+                                   self.mpesa.wait_for_status(checkout_request_id, wait_timeout(
+                                       data.get('timeout', query.get('timeout')))))
+        self.open_connections = 0
+        self.native_requests = 0
+        self.bridged_requests = 0
+
+    def stats(self):
+        """Return serving metrics"""
+        return {
+            "mode": "async",
+            "open_connections": self.open_connections,
+            "bridge_threads": self.threads,
+            "native_mpesa": self.mpesa is not None,
+            "native_requests": self.native_requests,
+            "bridged_requests": self.bridged_requests,
+        }
+
+    async def serve_forever(self):
+        if self.mpesa is not None:
+            await self.mpesa.start()
+        else:
+            print("aiohttp/aiomysql not installed; M-Pesa routes will use the thread pool")
+
+        server = await asyncio.start_server(self._handle_connection, host="", port=self.port,
+                                            limit=MAX_HEADER_SIZE, reuse_address=True,
+                                            reuse_port=self.reuse_port or None)
+        # Lets a pre-fork supervisor retire the worker this one replaces
+        notify_ready()
+        # SIGTERM stops accepting and lets open connections finish (pre-fork workers)
+        loop = asyncio.get_running_loop()
+        try:
+            loop.add_signal_handler(signal.SIGTERM, server.close)
+        except (NotImplementedError, RuntimeError):
+            pass
+        try:
+            async with server:
+                await server.serve_forever()
+        except asyncio.CancelledError:
+            await self._drain(self.request_timeout)
+        finally:
+            if self.mpesa is not None:
+                await self.mpesa.close()
+            self.executor.shutdown(wait=False)
+
+    async def _drain(self, timeout):
+        """Wait for open connections to finish after the listener is closed"""
+        deadline = asyncio.get_running_loop().time() + timeout
+        while self.open_connections and asyncio.get_running_loop().time() < deadline:
+            await asyncio.sleep(0.1)
+
+    async def _handle_connection(self, reader, writer):
+        self.open_connections += 1
+        peer = writer.get_extra_info("peername") or ("", 0)
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), self.idle_timeout)
+                except asyncio.LimitOverrunError:
+                    await self._send(writer, 431, [], dumps_bytes({"error": "Request headers too large"}), False)
+                    break
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                    break
+
+                request_line, _, header_block = head.partition(b"\r\n")
+                parts = request_line.decode("latin-1").split()
+                if len(parts) != 3:
+                    await self._send(writer, 400, [], dumps_bytes({"error": "Bad request"}), False)
+                    break
+                method, target, version = parts
+                headers = http.client.parse_headers(io.BytesIO(header_block))
+
+                if "chunked" in headers.get("Transfer-Encoding", "").lower():
+                    # The raw chunked bytes are passed on; the handler decodes them
+                    try:
+                        body = await asyncio.wait_for(self._read_chunked(reader), self.request_timeout)
+                    except ValueError:
+                        await self._send(writer, 413, [], dumps_bytes({"error": "Request body too large"}), False)
+                        break
+                    except (asyncio.TimeoutError, asyncio.IncompleteReadError,
+                            asyncio.LimitOverrunError, ConnectionError):
+                        break
+                    if body is None:
+                        await self._send(writer, 400, [], dumps_bytes({"error": "Bad request"}), False)
+                        break
+                else:
+                    try:
+                        length = int(headers.get("Content-Length", 0))
+                    except ValueError:
+                        length = -1
+                    if length < 0 or length > MAX_BODY_SIZE:
+                        await self._send(writer, 413, [], dumps_bytes({"error": "Request body too large"}), False)
+                        break
+                    try:
+                        body = await asyncio.wait_for(reader.readexactly(length), self.request_timeout) if length else b""
+                    except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                        break
+
+                keep_alive = version == "HTTP/1.1" and headers.get("Connection", "").lower() != "close"
+                status, response_headers, response_body = await self._dispatch(
+                    method, target, head + body, body, peer
+                )
+                await self._send(writer, status, response_headers, response_body, keep_alive)
+                if not keep_alive:
+                    break
+        finally:
+            self.open_connections -= 1
+            writer.close()
+
+    async def _read_chunked(self, reader):
+        """Read a chunked request body, keeping its framing
+
+        Returns None if the framing is malformed; raises ValueError if the
+        body exceeds MAX_BODY_SIZE.
+        """
+        parts = []
+        total = 0
+        while True:
+            line = await reader.readuntil(b"\r\n")
+            parts.append(line)
+            try:
+                size = int(line.split(b";", 1)[0].strip(), 16)
+            except ValueError:
+                return None
+            if size == 0:
+                while True:
+                    line = await reader.readuntil(b"\r\n")
+                    parts.append(line)
+                    if line == b"\r\n":
+                        return b"".join(parts)
+            total += size
+            if total > MAX_BODY_SIZE:
+                raise ValueError("Request body too large")
+            parts.append(await reader.readexactly(size + 2))
+
+    async def _dispatch(self, method, target, raw_request, body, peer):
+        url = urllib.parse.urlparse(target)
+        route, params = self.native_routes.match(method, url.path)
+        if route is not None:
+            self.native_requests += 1
+            try:
+                data = loads(body) if body else {}
+            except ValueError:
+                data = {}
+            # Same handling as RequestHandler: a JSON body that is not an object is ignored
+            if not isinstance(data, dict):
+                data = {}
+            query = {name: values[0] for name, values in urllib.parse.parse_qs(url.query).items()}
+            try:
+                response = await route.handler(data, query, **params)
+            except Exception as e:
+                print(f"Error handling {method} {target}: {e}")
+                return 500, [("Content-type", "application/json"),
+                             ("Access-Control-Allow-Origin", "*")], dumps_bytes({"error": "Internal server error"})
+            status = 400 if "error" in response else 200
+            return status, [("Content-type", "application/json"),
+                            ("Access-Control-Allow-Origin", "*")], dumps_bytes(response)
+
+        self.bridged_requests += 1
+        loop = asyncio.get_running_loop()
+        try:
+            raw = await loop.run_in_executor(self.executor, run_sync_handler,
+                                             self.handler_class, self, raw_request, peer)
+        except Exception as e:
+            print(f"Error handling {method} {target}: {e}")
+            raw = b""
+        if not raw:
+            return 500, [], b""
+        return split_response(raw)
+
+    async def _send(self, writer, status, headers, body, keep_alive):
+        try:
+            phrase = HTTPStatus(status).phrase
+        except ValueError:
+            phrase = ""
+        lines = [f"HTTP/1.1 {status} {phrase}"]
+        lines.extend(f"{name}: {value}" for name, value in headers)
+        if bodiless_status(status):
+            body = b""
+        else:
+            lines.append(f"Content-Length: {len(body)}")
+        lines.append("Connection: keep-alive" if keep_alive else "Connection: close")
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body)
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
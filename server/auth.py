@@ -1,11 +1,10 @@
 import hashlib
 import secrets
-from database import get_db_connection, json_dumps
-import jwt
-import datetime
+from database import get_db_connection
 import os
 from decimal import Decimal
-from middleware import SECRET_KEY  # Import the shared SECRET_KEY
+# Tokens are issued and verified in middleware
+from middleware import generate_token
 
 def hash_password(password):
     """Hash a password using SHA-256"""
@@ -125,36 +124,6 @@ def login_admin(email, password):
             cursor.close()
             connection.close()
 
-def generate_token(user_id, name, is_admin):
-    """Generate a JWT token for authentication"""
-    payload = {
-        "sub": str(user_id),  # Ensure user_id is converted to string
-        "name": name,
-        "is_admin": is_admin,
-        "exp": datetime.datetime.utcnow() + datetime.timedelta(days=1)
-    }
-    
-    print(f"Generating token with payload: {payload}")
-    token = jwt.encode(payload, SECRET_KEY, algorithm="HS256")
-    return token
-
-def verify_token(token):
-    """Verify a JWT token"""
-    try:
-        print(f"Verifying token: {token[:20]}...")
-        payload = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
-        print(f"Token decoded successfully: {payload}")
-        return payload
-    except jwt.ExpiredSignatureError:
-        print("Token verification failed: Token expired")
-        return {"error": "Token expired"}
-    except jwt.InvalidTokenError as e:
-        print(f"Token verification failed: Invalid token - {str(e)}")
-        return {"error": f"Invalid token: {str(e)}"}
-    except Exception as e:
-        print(f"Unexpected error during token verification: {str(e)}")
-        return {"error": f"Token verification error: {str(e)}"}
-
 def create_admin(name, email, password):
     """Create a new admin (called from terminal/script)"""
     connection = get_db_connection()
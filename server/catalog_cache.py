@@ -0,0 +1,184 @@
+import copy
+import hashlib
+import os
+import threading
+import time
+
+from serializer import dumps_bytes
+
+# Seconds a cached catalog response is served before it is reloaded
+CATALOG_CACHE_TTL = float(os.environ.get('CATALOG_CACHE_TTL', '60'))
+# Entries kept per cache; paginated listings add one entry per distinct query
+CATALOG_CACHE_MAX_ENTRIES = int(os.environ.get('CATALOG_CACHE_MAX_ENTRIES', '512'))
+
+
+def make_etag(body):
+    """Strong ETag derived from the response body"""
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+class CacheEntry:
+    """A cached response: the data plus its pre-serialized JSON body
+
+    `etag` is a hash of the body, so it is the same in every worker process.
+    `last_modified` is when the body last changed (a reload that produces
+    the same body keeps the earlier time). It is kept per process, so
+    clients should prefer the ETag; it always moves forward when the body
+    changes, even twice within one second.
+    """
+
+    __slots__ = ('version', 'data', 'body', 'etag', 'last_modified', 'expires_at')
+
+    def __init__(self, version, data, ttl, previous=None):
+        self.version = version
+        self.expires_at = time.monotonic() + ttl
+        self._set_data(data, previous)
+
+    def _set_data(self, data, previous):
+        self.data = data
+        self.body = dumps_bytes(data)
+        self.etag = make_etag(self.body)
+        if previous is None:
+            # HTTP dates have one-second resolution
+            self.last_modified = int(time.time())
+        elif previous.etag == self.etag:
+            self.last_modified = previous.last_modified
+        else:
+            # A later second than the old body's, so a client holding that
+            # date does not get a 304 for the new one
+            self.last_modified = max(int(time.time()), previous.last_modified + 1)
+
+    @property
+    def cacheable(self):
+        return not (isinstance(self.data, dict) and "error" in self.data)
+
+    def patched(self, data):
+        """Copy of this entry with new data, keeping its expiry"""
+        entry = CacheEntry.__new__(CacheEntry)
+        entry.version = self.version
+        entry.expires_at = self.expires_at
+        entry._set_data(data, self)
+        return entry
+
+
+class CatalogCache:
+    """Versioned read-through cache for catalog responses
+
+    get() returns the cached entry for a key, calling `loader()` on a miss or
+    once the TTL has passed. Write paths call invalidate(), which bumps the
+    version and drops every entry. A load that raced with an invalidation is
+    returned to its caller but not stored, so stale rows never get cached.
+    Responses containing an "error" key are never cached.
+
+    Concurrent misses for the same key share a single load. Small changes can
+    be applied with patch() instead of invalidating, so a burst of writes to
+    one row does not turn into a burst of full reloads.
+
+    At most `max_entries` entries are kept: once full, expired entries are
+    dropped, and if none have expired new loads are returned uncached.
+
+    The cache lives in the process; with several workers each one has its own
+    copy and the TTL bounds how long another worker's write goes unseen.
+    """
+
+    def __init__(self, name, ttl=CATALOG_CACHE_TTL, max_entries=CATALOG_CACHE_MAX_ENTRIES):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.version = 0
+        self._entries = {}
+        self._loading = {}  # key -> Event set when the in-flight load finishes
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.invalidations = 0
+        self.patches = 0
+
+    def get(self, key, loader):
+        """Return the CacheEntry for key, loading it if needed"""
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and entry.expires_at > time.monotonic():
+                    self.hits += 1
+                    return entry
+                loading = self._loading.get(key)
+                if loading is None:
+                    self.misses += 1
+                    version = self.version
+                    previous = entry
+                    loading = self._loading[key] = threading.Event()
+                    break
+                self.coalesced += 1
+            # Another thread is loading this key; wait for it, then re-check
+            loading.wait()
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and entry.expires_at > time.monotonic():
+                    return entry
+            # The load failed or was discarded (the entry left is expired);
+            # go round again and load it ourselves
+
+        try:
+            entry = CacheEntry(version, loader(), self.ttl, previous)
+            if entry.cacheable:
+                with self._lock:
+                    if self.version == version and self._has_room(key):
+                        self._entries[key] = entry
+            return entry
+        finally:
+            with self._lock:
+                del self._loading[key]
+            loading.set()
+
+    def _has_room(self, key):
+        if key in self._entries or len(self._entries) < self.max_entries:
+            return True
+        now = time.monotonic()
+        for stale in [k for k, e in self._entries.items() if e.expires_at <= now]:
+            del self._entries[stale]
+        return len(self._entries) < self.max_entries
+
+    def keys(self):
+        with self._lock:
+            return list(self._entries)
+
+    def patch(self, key, update):
+        """Apply `update(data)` to a cached entry in place of a reload
+
+        `update` receives a copy of the cached data, changes it and returns
+        True if anything changed. Loads already in flight are discarded,
+        since they may have read the rows before the change.
+        """
+        with self._lock:
+            self.version += 1
+            entry = self._entries.get(key)
+            if entry is None:
+                return False
+            data = copy.deepcopy(entry.data)
+            if not update(data):
+                return False
+            self._entries[key] = entry.patched(data)
+            self.patches += 1
+            return True
+
+    def invalidate(self):
+        """Drop every entry after a write to the underlying tables"""
+        with self._lock:
+            self.version += 1
+            self.invalidations += 1
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "version": self.version,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "invalidations": self.invalidations,
+                "patches": self.patches,
+            }
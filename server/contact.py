@@ -1,24 +1,8 @@
 
 from database import save_contact_message, get_all_contact_messages, update_message_status
-import json
 import jwt
 import os
-from decimal import Decimal
 from middleware import SECRET_KEY
-from datetime import datetime
-
-# Custom JSON encoder to handle Decimal types and datetime objects
-class CustomJSONEncoder(json.JSONEncoder):
-    def default(self, obj):
-        if isinstance(obj, Decimal):
-            return float(obj)
-        if isinstance(obj, datetime):
-            return obj.isoformat()
-        return super(CustomJSONEncoder, self).default(obj)
-
-def json_dumps(obj):
-    """Convert object to JSON string, handling Decimal and datetime types"""
-    return json.dumps(obj, cls=CustomJSONEncoder)
 
 def is_admin(auth_header):
     """Simple check if request has admin auth header"""
@@ -47,9 +31,6 @@ def create_contact_message(data):
     # Print result for debugging
     print(f"Save result: {result}")
     
-    # Convert any Decimal values to float
-    if isinstance(result, dict):
-        return json.loads(json_dumps(result))
     return result
 
 def get_messages(auth_header):
@@ -64,9 +45,6 @@ def get_messages(auth_header):
     # Print result for debugging
     print(f"Fetch messages result: {result}")
     
-    # Use custom JSON encoder for Decimal and datetime values
-    if isinstance(result, dict) and 'messages' in result:
-        return json.loads(json_dumps(result))
     return result
 
 def update_message(auth_header, message_id, data):
@@ -80,9 +58,6 @@ def update_message(auth_header, message_id, data):
     
     result = update_message_status(message_id, status)
     
-    # Convert any Decimal values to float
-    if isinstance(result, dict):
-        return json.loads(json_dumps(result))
     return result
 
 # WhatsApp message handling would need additional server-side code
@@ -0,0 +1,212 @@
+# Shared HTTP client for the Safaricom Daraja API.
+# One requests.Session keeps connections to Safaricom alive between calls
+# (no DNS/TCP/TLS setup per request). Every call has connect and read
+# timeouts; idempotent calls (OAuth, STK query) are retried with jittered
+# backoff, and a circuit breaker fails calls fast while the API is down.
+# Point MPESA_API_BASE_URL at daraja_stub.py to test without Safaricom.
+import os
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+MPESA_API_BASE_URL = os.environ.get('MPESA_API_BASE_URL', 'https://sandbox.safaricom.co.ke').rstrip('/')
+MPESA_CONNECT_TIMEOUT = float(os.environ.get('MPESA_CONNECT_TIMEOUT', '5'))
+MPESA_READ_TIMEOUT = float(os.environ.get('MPESA_READ_TIMEOUT', '30'))
+# Connections kept open to the API host
+MPESA_POOL_SIZE = int(os.environ.get('MPESA_POOL_SIZE', '10'))
+# Extra attempts for idempotent calls, and the base of the backoff between them
+MPESA_RETRIES = int(os.environ.get('MPESA_RETRIES', '2'))
+MPESA_RETRY_BACKOFF = float(os.environ.get('MPESA_RETRY_BACKOFF', '0.5'))
+# Consecutive failures that open the breaker, and seconds before it lets a call through again
+MPESA_BREAKER_THRESHOLD = int(os.environ.get('MPESA_BREAKER_THRESHOLD', '5'))
+MPESA_BREAKER_RESET = float(os.environ.get('MPESA_BREAKER_RESET', '30'))
+
+
+class DarajaUnavailable(requests.RequestException):
+    """Raised without calling the API while the circuit breaker is open"""
+    pass
+
+
+def backoff_delay(attempt, base=MPESA_RETRY_BACKOFF):
+    """Seconds to wait before retry `attempt` (1, 2, ...): full jitter over an exponential cap"""
+    return random.uniform(0, base * (2 ** (attempt - 1)))
+
+
+def is_server_error(status, body):
+    """A 5xx that is not a Daraja application error
+
+    Daraja answers some ordinary calls with 500 and an errorCode body (an
+    STK query for a payment still in progress, for one); those are not
+    outages and are neither retried nor counted by the breaker.
+    """
+    return status >= 500 and not (isinstance(body, dict) and "errorCode" in body)
+
+
+def _json_or_none(response):
+    try:
+        return response.json()
+    except ValueError:
+        return None
+
+
+def json_body(response):
+    """The JSON body DarajaClient decoded for `response`; ValueError if it was not JSON"""
+    if response.data is None:
+        raise ValueError(f"Daraja answered HTTP {response.status_code} without a JSON body")
+    return response.data
+
+
+class CircuitBreaker:
+    """Counts consecutive failures; after `threshold` of them calls fail fast
+
+    Once `reset_timeout` seconds have passed one trial call is let through
+    (half open): success closes the breaker, failure opens it again.
+    """
+
+    def __init__(self, threshold=MPESA_BREAKER_THRESHOLD, reset_timeout=MPESA_BREAKER_RESET):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+        self.rejected = 0
+        self.opened = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state(time.monotonic())
+
+    def _state(self, now):
+        if self._opened_at is None:
+            return "closed"
+        if now - self._opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self):
+        """True if a call may be made now"""
+        with self._lock:
+            state = self._state(time.monotonic())
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._trial:
+                self._trial = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial or self._failures >= self.threshold:
+                if self._opened_at is None or self._trial:
+                    self.opened += 1
+                self._opened_at = time.monotonic()
+                self._trial = False
+
+    def stats(self):
+        with self._lock:
+            return {
+                "state": self._state(time.monotonic()),
+                "consecutive_failures": self._failures,
+                "opened": self.opened,
+                "rejected": self.rejected,
+            }
+
+
+class DarajaClient:
+    """Pooled, keep-alive session for Daraja calls
+
+    get() and post() return the requests.Response, with its JSON body
+    already decoded in `response.data` (None if it was not JSON; read it
+    with json_body()). They raise requests.RequestException on network
+    errors and timeouts, and DarajaUnavailable while the breaker is open. Calls made with
+    idempotent=True are retried on network errors and 5xx responses; other
+    calls are only retried when the connection could not be made, since
+    then the request never reached Safaricom.
+    """
+
+    def __init__(self, pool_size=MPESA_POOL_SIZE, timeout=(MPESA_CONNECT_TIMEOUT, MPESA_READ_TIMEOUT),
+                 retries=MPESA_RETRIES, breaker=None):
+        self.timeout = timeout
+        self.retries = retries
+        self.breaker = breaker or CircuitBreaker()
+        self.session = requests.Session()
+        # Not pool_block: a blocked caller would wait for a free connection with
+        # no timeout. Calls beyond pool_size open a connection that is closed
+        # afterwards instead of kept.
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "retries": 0, "errors": 0}
+
+    def get(self, url, headers=None, idempotent=True):
+        return self.request('GET', url, headers=headers, idempotent=idempotent)
+
+    def post(self, url, json=None, headers=None, idempotent=False):
+        return self.request('POST', url, json=json, headers=headers, idempotent=idempotent)
+
+    def request(self, method, url, json=None, headers=None, idempotent=False):
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                raise DarajaUnavailable("M-Pesa API unavailable (circuit open), try again shortly")
+            self._count("requests")
+            try:
+                response = self.session.request(method, url, json=json, headers=headers,
+                                                timeout=self.timeout)
+            except requests.ConnectTimeout as e:
+                error = e
+                retry = True
+            except requests.ConnectionError as e:
+                error = e
+                retry = idempotent or _not_sent(e)
+            except requests.RequestException as e:
+                error = e
+                retry = idempotent
+            else:
+                response.data = _json_or_none(response)
+                if not is_server_error(response.status_code, response.data):
+                    self.breaker.record_success()
+                    return response
+                error = None
+                retry = idempotent
+
+            self.breaker.record_failure()
+            self._count("errors")
+            attempt += 1
+            if not retry or attempt > self.retries:
+                if error is not None:
+                    raise error
+                return response
+            self._count("retries")
+            time.sleep(backoff_delay(attempt))
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats["breaker"] = self.breaker.stats()
+        return stats
+
+
+def _not_sent(error):
+    """True if a ConnectionError happened while connecting, before the request was sent"""
+    reason = getattr(error.args[0], 'reason', None) if error.args else None
+    return isinstance(reason, NewConnectionError)
@@ -0,0 +1,178 @@
+# Local stand-in for the Safaricom Daraja API, for testing the M-Pesa flow
+# without the sandbox:
+#
+#   python daraja_stub.py --port 8081 --complete-after 5
+#   MPESA_API_BASE_URL=http://localhost:8081 python server.py
+#
+# It serves the OAuth, STK push and STK query endpoints the server uses.
+# STK queries report the payment as in progress until --complete-after
+# seconds after the push, then as completed (or failed for amounts ending
+# in 1). --latency and --error-rate simulate a slow or flaky API.
+import argparse
+import base64
+import http.server
+import json
+import random
+import sys
+import threading
+import time
+import uuid
+
+PENDING_RESPONSE = {
+    "requestId": "",
+    "errorCode": "500.001.1001",
+    "errorMessage": "The transaction is being processed",
+}
+
+
+class DarajaStub:
+    """State shared by the stub's request handlers"""
+
+    def __init__(self, complete_after=5.0, latency=0.0, error_rate=0.0, token_ttl=3599):
+        self.complete_after = complete_after
+        self.latency = latency
+        self.error_rate = error_rate
+        self.token_ttl = token_ttl
+        self.tokens = set()
+        self.pushes = {}
+        self.lock = threading.Lock()
+        self.counts = {"oauth": 0, "stk_push": 0, "stk_query": 0, "errors": 0}
+
+    def count(self, name):
+        with self.lock:
+            self.counts[name] += 1
+
+    def issue_token(self):
+        token = base64.b64encode(uuid.uuid4().bytes).decode()
+        with self.lock:
+            self.tokens.add(token)
+        return {"access_token": token, "expires_in": str(self.token_ttl)}
+
+    def valid_token(self, header):
+        with self.lock:
+            return header.startswith("Bearer ") and header[7:] in self.tokens
+
+    def push(self, body):
+        checkout_request_id = f"ws_CO_{uuid.uuid4().hex[:20]}"
+        with self.lock:
+            self.pushes[checkout_request_id] = (time.monotonic(), body.get("Amount"))
+        return {
+            "MerchantRequestID": uuid.uuid4().hex[:12],
+            "CheckoutRequestID": checkout_request_id,
+            "ResponseCode": "0",
+            "ResponseDescription": "Success. Request accepted for processing",
+            "CustomerMessage": "Success. Request accepted for processing",
+        }
+
+    def query(self, body):
+        checkout_request_id = body.get("CheckoutRequestID")
+        with self.lock:
+            push = self.pushes.get(checkout_request_id)
+        if push is None:
+            return 400, {"errorCode": "400.002.02", "errorMessage": "Bad Request - Invalid CheckoutRequestID"}
+        pushed_at, amount = push
+        if time.monotonic() - pushed_at < self.complete_after:
+            return 500, PENDING_RESPONSE
+        if str(amount).endswith("1"):
+            return 200, {"ResponseCode": "0", "CheckoutRequestID": checkout_request_id,
+                         "ResultCode": "1032", "ResultDesc": "Request cancelled by user"}
+        return 200, {"ResponseCode": "0", "CheckoutRequestID": checkout_request_id,
+                     "ResultCode": "0", "ResultDesc": "The service request is processed successfully."}
+
+
+class StubHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def _send(self, status, data):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            return json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            return {}
+
+    def _simulate(self):
+        """Apply the configured latency; True if this request should fail"""
+        stub = self.server.stub
+        if stub.latency:
+            time.sleep(stub.latency)
+        if random.random() < stub.error_rate:
+            stub.count("errors")
+            self._send(503, {"errorMessage": "Service unavailable (simulated)"})
+            return True
+        return False
+
+    def do_GET(self):
+        stub = self.server.stub
+        if not self.path.startswith("/oauth/v1/generate"):
+            self._send(404, {"errorMessage": "Not found"})
+            return
+        if self._simulate():
+            return
+        stub.count("oauth")
+        if not self.headers.get("Authorization", "").startswith("Basic "):
+            self._send(400, {"errorCode": "400.008.01", "errorMessage": "Invalid Authentication passed"})
+            return
+        self._send(200, stub.issue_token())
+
+    def do_POST(self):
+        stub = self.server.stub
+        body = self._body()
+        if self.path not in ("/mpesa/stkpush/v1/processrequest", "/mpesa/stkpushquery/v1/query"):
+            self._send(404, {"errorMessage": "Not found"})
+            return
+        if self._simulate():
+            return
+        if not stub.valid_token(self.headers.get("Authorization", "")):
+            self._send(401, {"errorCode": "404.001.03", "errorMessage": "Invalid Access Token"})
+            return
+        if self.path == "/mpesa/stkpush/v1/processrequest":
+            stub.count("stk_push")
+            self._send(200, stub.push(body))
+        else:
+            stub.count("stk_query")
+            self._send(*stub.query(body))
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_server(port, stub, host="127.0.0.1"):
+    server = http.server.ThreadingHTTPServer((host, port), StubHandler)
+    server.daemon_threads = True
+    server.stub = stub
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local stub of the Safaricom Daraja API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--complete-after", type=float, default=5.0,
+                        help="Seconds after a push before STK queries report a result")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every response")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 503")
+    args = parser.parse_args(argv)
+
+    stub = DarajaStub(complete_after=args.complete_after, latency=args.latency, error_rate=args.error_rate)
+    server = make_server(args.port, stub, args.host)
+    print(f"Daraja stub listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"Requests served: {stub.counts}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,17 +1,11 @@
-import mysql.connector
+import os
+import threading
 from mysql.connector import Error
-import json
 from decimal import Decimal
-from datetime import datetime
 
-# Custom JSON encoder to handle Decimal types and datetime objects
-class DecimalEncoder(json.JSONEncoder):
-    def default(self, obj):
-        if isinstance(obj, Decimal):
-            return float(obj)
-        if isinstance(obj, datetime):
-            return obj.isoformat()
-        return super(DecimalEncoder, self).default(obj)
+from exports import EXPORT_BATCH_SIZE
+from pagination import ListSpec, Filter, to_date, to_int
+from row_model import RowModel, Field, to_float
 
 # Database connection configuration
 DB_CONFIG = {
@@ -21,20 +15,44 @@ DB_CONFIG = {
     'database': 'afriart_db'  # Changed database name
 }
 
+# Shared connection pool, created on first use
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """Return the process-wide connection pool"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                from db_pool import ConnectionPool
+                _pool = ConnectionPool(DB_CONFIG)
+    return _pool
+
+def _reset_pool_after_fork():
+    if _pool is not None:
+        _pool.reset_after_fork()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_pool_after_fork)
+
 def get_db_connection():
-    """Create and return a database connection"""
+    """Check out a database connection from the pool
+
+    Calling close() on the returned connection hands it back to the pool.
+    """
     try:
-        connection = mysql.connector.connect(**DB_CONFIG)
+        connection = get_pool().acquire()
         if connection.is_connected():
             return connection
+        connection.close()
     except Error as e:
         print(f"Error connecting to MySQL: {e}")
     return None
 
-# Helper function to safely encode JSON with Decimal and datetime values
-def json_dumps(data):
-    """Safely convert data to JSON string, handling Decimal and datetime types"""
-    return json.dumps(data, cls=DecimalEncoder)
+def get_pool_stats():
+    """Return connection pool metrics (wait and checkout times in seconds)"""
+    return get_pool().stats()
 
 def dict_from_row(row, cursor):
     """Convert a database row to a dictionary"""
@@ -55,17 +73,8 @@ def save_contact_message(name, email, phone, message, source='contact_form'):
     try:
         cursor = connection.cursor()
         
-        # Check if contact_messages table has source column
-        cursor.execute("SHOW COLUMNS FROM contact_messages LIKE 'source'")
-        source_exists = cursor.fetchone()
-        
-        if not source_exists:
-            # Add source column if it doesn't exist
-            print("Adding source column to contact_messages table")
-            cursor.execute("ALTER TABLE contact_messages ADD COLUMN source VARCHAR(50) DEFAULT 'contact_form'")
-            connection.commit()
-        
-        # Insert the message into the database
+        # Insert the message into the database (the source column is added
+        # to older tables by migrations/0002_contact_message_source.py)
         query = """
         INSERT INTO contact_messages (name, email, phone, message, source, status)
         VALUES (%s, %s, %s, %s, %s, 'new')
@@ -96,10 +105,10 @@ def get_all_contact_messages():
     try:
         cursor = connection.cursor()
         
-        # Get all messages ordered by date (newest first)
+        # Get all messages, newest first
         query = """
         SELECT * FROM contact_messages
-        ORDER BY date DESC
+        ORDER BY created_at DESC
         """
         cursor.execute(query)
         rows = cursor.fetchall()
@@ -155,78 +164,118 @@ def update_message_status(message_id, status):
             cursor.close()
             connection.close()
 
-def get_all_orders():
-    """Get all artwork orders from the database"""
+# Admin order and ticket listings (GET /admin/orders, GET /tickets and their
+# /export variants). Pages use keyset pagination (see pagination.py); full
+# lists and exports are read with an unbuffered cursor, a batch at a time.
+ORDER_LIST = ListSpec(
+    "artwork_orders ao JOIN users u ON ao.user_id = u.id JOIN artworks a ON ao.artwork_id = a.id",
+    sorts={'created_at': 'desc', 'id': 'desc'}, alias='ao', filters=[
+        Filter('payment_status', 'ao.payment_status', choices=('pending', 'completed', 'failed')),
+        Filter('user_id', 'ao.user_id', convert=to_int),
+        Filter('artwork_id', 'ao.artwork_id', convert=to_int),
+        Filter('from', 'ao.created_at', '>=', to_date),
+        Filter('to', 'ao.created_at', '<', to_date),
+    ])
+ORDER_SELECT = """ao.*, u.name AS customer_name, u.email AS customer_email,
+       a.title AS artwork_title, a.price AS artwork_price"""
+ORDER_MODEL = RowModel('artwork_orders', [
+    Field('total_amount', convert=to_float),
+    Field('artwork_price', convert=to_float),
+])
+
+TICKET_LIST = ListSpec(
+    "exhibition_bookings eb JOIN users u ON eb.user_id = u.id JOIN exhibitions e ON eb.exhibition_id = e.id",
+    sorts={'created_at': 'desc', 'id': 'desc'}, alias='eb', filters=[
+        Filter('payment_status', 'eb.payment_status', choices=('pending', 'completed', 'failed')),
+        Filter('user_id', 'eb.user_id', convert=to_int),
+        Filter('exhibition_id', 'eb.exhibition_id', convert=to_int),
+        Filter('from', 'eb.created_at', '>=', to_date),
+        Filter('to', 'eb.created_at', '<', to_date),
+    ])
+TICKET_SELECT = """eb.*, u.name AS customer_name, u.email AS customer_email,
+       e.title AS exhibition_title, e.image_url AS exhibition_image_url"""
+TICKET_MODEL = RowModel('exhibition_bookings', [
+    Field('total_amount', convert=to_float),
+])
+
+def _get_page(model, select, query, key):
     connection = get_db_connection()
     if connection is None:
         return {"error": "Database connection failed"}
     
-    try:
-        cursor = connection.cursor()
-        
-        # Get all orders with user and artwork details
-        query = """
-        SELECT ao.*, u.name as customer_name, u.email as customer_email,
-               a.title as artwork_title, a.price as artwork_price
-        FROM artwork_orders ao
-        JOIN users u ON ao.user_id = u.id
-        JOIN artworks a ON ao.artwork_id = a.id
-        ORDER BY ao.created_at DESC
-        """
-        cursor.execute(query)
-        rows = cursor.fetchall()
-        
-        orders = []
-        for row in rows:
-            order_dict = dict_from_row(row, cursor)
-            orders.append(order_dict)
-        
-        print(f"Retrieved {len(orders)} orders")
-        return {"orders": orders}
+    cursor = connection.cursor()
     
+    try:
+        cursor.execute(*query.sql(select))
+        items, next_cursor = query.page(model, cursor, cursor.fetchall())
+        return {key: items, "nextCursor": next_cursor}
     except Error as e:
-        print(f"Error getting orders: {e}")
+        print(f"Error getting {key}: {e}")
         return {"error": str(e)}
-    
     finally:
         if connection.is_connected():
             cursor.close()
             connection.close()
 
-def get_all_exhibition_tickets():
-    """Get all exhibition tickets from the database"""
-    connection = get_db_connection()
-    if connection is None:
-        return {"error": "Database connection failed"}
+class RowStream:
+    """A listing query read through an unbuffered cursor
+
+    open() takes a connection and runs the query, iterating yields the
+    response dicts, and close() gives the cursor and connection back. The
+    caller opens and closes it in one try/finally, so the connection is
+    released whether or not iteration ever started.
+    """
     
-    try:
-        cursor = connection.cursor()
-        
-        # Get all tickets with user and exhibition details
-        query = """
-        SELECT eb.*, u.name as customer_name, u.email as customer_email,
-               e.title as exhibition_title, e.image_url as exhibition_image_url
-        FROM exhibition_bookings eb
-        JOIN users u ON eb.user_id = u.id
-        JOIN exhibitions e ON eb.exhibition_id = e.id
-        ORDER BY eb.created_at DESC
-        """
-        cursor.execute(query)
-        rows = cursor.fetchall()
-        
-        tickets = []
-        for row in rows:
-            ticket_dict = dict_from_row(row, cursor)
-            tickets.append(ticket_dict)
-        
-        print(f"Retrieved {len(tickets)} tickets")
-        return {"tickets": tickets}
+    def __init__(self, model, select, query):
+        self.model = model
+        self.select = select
+        self.query = query
+        self.connection = None
+        self.cursor = None
     
-    except Error as e:
-        print(f"Error getting tickets: {e}")
-        return {"error": str(e)}
+    def open(self):
+        """Run the query; returns None, or {"error": ...} if it could not be run"""
+        self.connection = get_db_connection()
+        if self.connection is None:
+            return {"error": "Database connection failed"}
+        # Unbuffered: rows stay on the server until fetched
+        self.cursor = self.connection.cursor(buffered=False)
+        try:
+            self.cursor.execute(*self.query.sql(self.select))
+        except Error as e:
+            print(f"Error streaming {self.model.table}: {e}")
+            return {"error": str(e)}
+        return None
     
-    finally:
-        if connection.is_connected():
-            cursor.close()
+    def __iter__(self):
+        return self.query.stream(self.model, self.cursor, EXPORT_BATCH_SIZE)
+    
+    def close(self):
+        """Release the cursor and connection (does nothing if not open)"""
+        cursor, connection = self.cursor, self.connection
+        self.cursor = self.connection = None
+        if cursor is not None:
+            try:
+                cursor.close()
+            except Error:
+                # Rows were left unread (the client went away); the pool discards
+                # the connection instead of reusing it
+                pass
+        if connection is not None:
             connection.close()
+
+def get_orders_page(query):
+    """One page of artwork orders with customer and artwork details"""
+    return _get_page(ORDER_MODEL, ORDER_SELECT, query, "orders")
+
+def stream_orders(query):
+    """Every artwork order matching an export query, as an unopened RowStream"""
+    return RowStream(ORDER_MODEL, ORDER_SELECT, query)
+
+def get_tickets_page(query):
+    """One page of exhibition bookings with customer and exhibition details"""
+    return _get_page(TICKET_MODEL, TICKET_SELECT, query, "tickets")
+
+def stream_tickets(query):
+    """Every exhibition booking matching an export query, as an unopened RowStream"""
+    return RowStream(TICKET_MODEL, TICKET_SELECT, query)
@@ -0,0 +1,235 @@
+import os
+import threading
+import time
+from collections import deque
+
+import mysql.connector
+from mysql.connector import Error
+
+# Pool configuration (override with environment variables)
+POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '10'))
+POOL_MAX_OVERFLOW = int(os.environ.get('DB_POOL_MAX_OVERFLOW', '10'))
+POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', '5'))
+POOL_RECYCLE = float(os.environ.get('DB_POOL_RECYCLE', '1800'))
+
+
+class PoolTimeout(Error):
+    """Raised when no connection could be checked out before the timeout"""
+    pass
+
+
+class PooledConnection:
+    """Wrapper around a MySQL connection that returns it to the pool on close()
+
+    Everything except close() is delegated to the real connection, so the
+    existing `connection.cursor()` / `connection.commit()` / `connection.close()`
+    code in the handlers works unchanged.
+    """
+
+    def __init__(self, pool, raw, created_at):
+        self._pool = pool
+        self._raw = raw
+        self._created_at = created_at
+        self._checked_out_at = time.monotonic()
+
+    def __getattr__(self, name):
+        raw = self.__dict__.get('_raw')
+        if raw is None:
+            raise Error("Connection has already been returned to the pool")
+        return getattr(raw, name)
+
+    def is_connected(self):
+        raw = self._raw
+        return raw is not None and raw.is_connected()
+
+    def close(self):
+        """Return the connection to the pool instead of closing it"""
+        raw = self._raw
+        if raw is None:
+            return
+        self._raw = None
+        self._pool._release(raw, self._created_at, self._checked_out_at)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class ConnectionPool:
+    """Bounded, thread-safe pool of MySQL connections
+
+    - `size` connections are kept open once created
+    - up to `max_overflow` extra connections may be opened under load; they
+      are closed instead of being kept when returned
+    - `timeout` is how long a caller waits for a free connection
+    - connections are pinged before being handed out and recycled once they
+      are older than `recycle` seconds
+    """
+
+    def __init__(self, db_config, size=POOL_SIZE, max_overflow=POOL_MAX_OVERFLOW,
+                 timeout=POOL_TIMEOUT, recycle=POOL_RECYCLE):
+        self.db_config = dict(db_config)
+        self.size = size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self.recycle = recycle
+
+        self._idle = deque()  # (raw connection, created_at)
+        self._open = 0
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
+
+        self._stats = {
+            "checkouts": 0,
+            "timeouts": 0,
+            "connects": 0,
+            "connect_errors": 0,
+            "recycled": 0,
+            "failed_health_checks": 0,
+            "wait_time_total": 0.0,
+            "wait_time_max": 0.0,
+            "checkout_time_total": 0.0,
+            "checkout_time_max": 0.0,
+            "returns": 0,
+        }
+
+    def _connect(self):
+        raw = mysql.connector.connect(**self.db_config)
+        with self._lock:
+            self._stats["connects"] += 1
+        return raw
+
+    def _discard(self, raw):
+        try:
+            raw.close()
+        except Exception:
+            pass
+
+    def _healthy(self, raw, created_at):
+        """Check a connection before handing it out"""
+        if self.recycle and time.monotonic() - created_at > self.recycle:
+            with self._lock:
+                self._stats["recycled"] += 1
+            return False
+        try:
+            raw.ping(reconnect=False)
+            return True
+        except Exception:
+            with self._lock:
+                self._stats["failed_health_checks"] += 1
+            return False
+
+    def acquire(self, timeout=None):
+        """Check out a connection, waiting up to `timeout` seconds"""
+        timeout = self.timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+
+        while True:
+            raw = None
+            created_at = None
+            with self._lock:
+                while True:
+                    if self._idle:
+                        raw, created_at = self._idle.pop()
+                        break
+                    if self._open < self.size + self.max_overflow:
+                        # Reserve a slot; the connection is opened outside the lock
+                        self._open += 1
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats["timeouts"] += 1
+                        raise PoolTimeout(
+                            f"Timed out after {timeout}s waiting for a database connection"
+                        )
+                    self._available.wait(remaining)
+
+            if raw is None:
+                try:
+                    raw = self._connect()
+                    created_at = time.monotonic()
+                except Exception:
+                    with self._lock:
+                        self._open -= 1
+                        self._stats["connect_errors"] += 1
+                        self._available.notify()
+                    raise
+            elif not self._healthy(raw, created_at):
+                # Drop the stale connection and try again with a fresh slot
+                self._discard(raw)
+                with self._lock:
+                    self._open -= 1
+                    self._available.notify()
+                continue
+
+            waited = time.monotonic() - started
+            with self._lock:
+                self._stats["checkouts"] += 1
+                self._stats["wait_time_total"] += waited
+                self._stats["wait_time_max"] = max(self._stats["wait_time_max"], waited)
+            return PooledConnection(self, raw, created_at)
+
+    def _release(self, raw, created_at, checked_out_at):
+        held = time.monotonic() - checked_out_at
+
+        # Reset the session state left behind by the caller
+        reusable = False
+        try:
+            if raw.is_connected():
+                raw.rollback()
+                reusable = True
+        except Exception:
+            reusable = False
+
+        with self._lock:
+            self._stats["returns"] += 1
+            self._stats["checkout_time_total"] += held
+            self._stats["checkout_time_max"] = max(self._stats["checkout_time_max"], held)
+
+            if reusable and len(self._idle) < self.size:
+                self._idle.append((raw, created_at))
+                raw = None
+            else:
+                self._open -= 1
+            self._available.notify()
+
+        if raw is not None:
+            self._discard(raw)
+
+    def reset_after_fork(self):
+        """Forget connections inherited from a parent process
+
+        The sockets belong to the parent, so they are dropped without sending
+        a disconnect that would kill the parent's session.
+        """
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
+        self._idle = deque()
+        self._open = 0
+
+    def close_all(self):
+        """Close every idle connection"""
+        with self._lock:
+            idle = list(self._idle)
+            self._idle.clear()
+            self._open -= len(idle)
+        for raw, _ in idle:
+            self._discard(raw)
+
+    def stats(self):
+        """Return a snapshot of the pool metrics"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = self.size
+            stats["max_overflow"] = self.max_overflow
+            stats["open"] = self._open
+            stats["idle"] = len(self._idle)
+            stats["in_use"] = self._open - len(self._idle)
+        checkouts = stats["checkouts"] or 1
+        returns = stats["returns"] or 1
+        stats["wait_time_avg"] = stats["wait_time_total"] / checkouts
+        stats["checkout_time_avg"] = stats["checkout_time_total"] / returns
+        return stats
@@ -1,10 +1,14 @@
 
-from database import get_db_connection, dict_from_row, json_dumps
-from auth import verify_token
+from database import get_db_connection
+from middleware import verify_token
+from catalog_cache import CatalogCache
+from uploads import save_base64_image, UploadError
+from image_variants import pipeline, load_variant_index, srcsets
+from row_model import RowModel, Field, to_str, to_float, isoformat
+from pagination import ListSpec, Filter, to_number
 import json
 import os
-import base64
-import time
+import binascii
 from decimal import Decimal
 
 # Default exhibition image path
@@ -21,8 +25,56 @@ def ensure_uploads_directory():
 # Call this function to ensure directory exists
 ensure_uploads_directory()
 
+# Cached responses for GET /exhibitions and GET /exhibitions/{id}
+exhibition_cache = CatalogCache('exhibitions')
+
+def get_cached_exhibitions():
+    """Return the cache entry (data and JSON body) for the full exhibition list"""
+    return exhibition_cache.get('all', get_all_exhibitions)
+
+def get_cached_exhibition_page(query):
+    """Return the cache entry for one page of a filtered exhibition listing"""
+    return exhibition_cache.get(query.key, lambda: get_exhibition_page(query))
+
+def get_cached_exhibition(exhibition_id):
+    """Return the cache entry for a single exhibition"""
+    return exhibition_cache.get(('exhibition', int(exhibition_id)), lambda: get_exhibition(exhibition_id))
+
+def invalidate_exhibition_cache():
+    """Call after any write to the exhibitions table other than a slot change"""
+    exhibition_cache.invalidate()
+
+def apply_slot_delta(exhibition_id, delta):
+    """Adjust availableSlots in the cached exhibition responses by `delta`
+
+    Used after bookings change available_slots, so the cached listings stay
+    correct without being reloaded. If a cached exhibition has no slot count
+    to adjust (availableSlots is NULL), the cache is cleared instead.
+    """
+    exhibition_id = str(exhibition_id)
+    unpatchable = []
+    
+    def update_one(exhibition):
+        if exhibition.get('id') != exhibition_id:
+            return False
+        if not isinstance(exhibition.get('availableSlots'), int):
+            unpatchable.append(exhibition_id)
+            return False
+        exhibition['availableSlots'] = exhibition['availableSlots'] + delta
+        return True
+    
+    def update_list(data):
+        return any([update_one(exhibition) for exhibition in data.get('exhibitions', [])])
+    
+    for key in exhibition_cache.keys():
+        if key == 'all' or key[0] == 'page':
+            exhibition_cache.patch(key, update_list)
+    exhibition_cache.patch(('exhibition', int(exhibition_id)), update_one)
+    if unpatchable:
+        invalidate_exhibition_cache()
+
 # Function to handle image storage
-def save_image_from_base64(base64_str, name_prefix="exhibition"):
+def save_image_from_base64(base64_str):
     """Save a base64 image to the uploads directory and return the path"""
     # Handle empty strings or None values
     if not base64_str:
@@ -33,43 +85,49 @@ def save_image_from_base64(base64_str, name_prefix="exhibition"):
         return base64_str
     
     try:
-        # Extract the image data from the base64 string
-        if "," in base64_str:
-            # For format like "data:image/jpeg;base64,/9j/4AAQSk..."
-            image_format, base64_data = base64_str.split(",", 1)
-            if ';base64' not in image_format:
-                print("Warning: Not a valid base64 image format")
-                return None
-        else:
-            # Assume it's just the base64 data
-            base64_data = base64_str
-        
-        # Decode the base64 data
-        try:
-            image_data = base64.b64decode(base64_data)
-        except Exception as e:
-            print(f"Failed to decode base64 data: {e}")
-            return DEFAULT_EXHIBITION_IMAGE
-        
-        # Generate a unique filename based on timestamp
-        timestamp = time.strftime("%Y%m%d%H%M%S")
-        filename = f"{name_prefix}_{timestamp}.jpg"
-        
-        # Save to the uploads directory
-        uploads_dir = os.path.join(os.path.dirname(__file__), "static", "uploads")
-        if not os.path.exists(uploads_dir):
-            os.makedirs(uploads_dir)
-            
-        file_path = os.path.join(uploads_dir, filename)
-        with open(file_path, "wb") as f:
-            f.write(image_data)
-        
-        # Return the URL path to the image (ALWAYS use the standard format)
-        return f"/static/uploads/{filename}"
+        # Decoded in slices straight to a temp file, then renamed into place
+        saved_path = save_base64_image(base64_str)
+        # Resized variants are made in the background; the cached listings
+        # are refreshed once they exist
+        pipeline.submit(saved_path, invalidate_exhibition_cache)
+        return saved_path
+    except UploadError as e:
+        print(f"Warning: {e}")
+        return None
+    except binascii.Error as e:
+        print(f"Failed to decode base64 data: {e}")
+        return DEFAULT_EXHIBITION_IMAGE
     except Exception as e:
         print(f"Error saving image: {e}")
         return DEFAULT_EXHIBITION_IMAGE
 
+def exhibition_image_url(image_url):
+    """Fall back to the default image (inline base64 is converted by migrate_images.py)"""
+    return image_url if image_url else DEFAULT_EXHIBITION_IMAGE
+
+# Columns returned by the exhibition endpoints, with their camelCase names
+EXHIBITION_MODEL = RowModel('exhibitions', [
+    Field('id', convert=to_str),
+    Field('title'),
+    Field('description'),
+    Field('location'),
+    Field('start_date', 'startDate', isoformat),
+    Field('end_date', 'endDate', isoformat),
+    Field('ticket_price', 'ticketPrice', to_float),
+    Field('image_url', 'imageUrl', exhibition_image_url),
+    Field('total_slots', 'totalSlots'),
+    Field('available_slots', 'availableSlots'),
+    Field('status'),
+])
+
+# Sorting and filters accepted by GET /exhibitions (see pagination.py)
+EXHIBITION_LIST = ListSpec('exhibitions', sorts={'start_date': 'asc', 'id': 'desc'}, filters=[
+    Filter('status', 'status', choices=('upcoming', 'ongoing', 'past')),
+    Filter('location', 'location'),
+    Filter('min_price', 'ticket_price', '>=', to_number),
+    Filter('max_price', 'ticket_price', '<=', to_number),
+])
+
 def get_all_exhibitions():
     """Get all exhibitions from the database"""
     connection = get_db_connection()
@@ -79,47 +137,17 @@ def get_all_exhibitions():
     cursor = connection.cursor()
     
     try:
-        query = """
-        SELECT id, title, description, location, start_date, end_date,
-               ticket_price, image_url, total_slots, available_slots, status
+        query = f"""
+        SELECT {EXHIBITION_MODEL.select}
         FROM exhibitions
         ORDER BY start_date ASC
         """
         cursor.execute(query)
-        rows = cursor.fetchall()
+        exhibitions = EXHIBITION_MODEL.to_dicts(cursor, cursor.fetchall())
         
-        exhibitions = []
-        for row in rows:
-            exhibition = dict_from_row(row, cursor)
-            
-            # Convert id to string to match frontend expectations
-            exhibition['id'] = str(exhibition['id'])
-            
-            # Convert dates to string format
-            exhibition['startDate'] = exhibition.pop('start_date').isoformat()
-            exhibition['endDate'] = exhibition.pop('end_date').isoformat()
-            
-            # Convert ticket_price to camelCase
-            exhibition['ticketPrice'] = exhibition.pop('ticket_price')
-            
-            # Convert image_url to camelCase and ensure it's valid
-            image_url = exhibition.pop('image_url')
-            # Convert base64 images to file paths
-            if image_url and (image_url.startswith('data:') or 'base64' in image_url):
-                # Save the base64 image to a file and get its path
-                saved_path = save_image_from_base64(image_url)
-                exhibition['imageUrl'] = saved_path
-                # Also update the database with the new path
-                update_exhibition_image(exhibition['id'], saved_path)
-                print(f"Converted base64 image to file: {saved_path}")
-            else:
-                exhibition['imageUrl'] = image_url if image_url else DEFAULT_EXHIBITION_IMAGE
-            
-            # Convert total_slots and available_slots to camelCase
-            exhibition['totalSlots'] = exhibition.pop('total_slots')
-            exhibition['availableSlots'] = exhibition.pop('available_slots')
-            
-            exhibitions.append(exhibition)
+        variant_index = load_variant_index()
+        for exhibition in exhibitions:
+            exhibition['imageVariants'] = srcsets(exhibition['imageUrl'], variant_index)
         
         return {"exhibitions": exhibitions}
     except Exception as e:
@@ -130,26 +158,26 @@ def get_all_exhibitions():
             cursor.close()
             connection.close()
 
-def update_exhibition_image(exhibition_id, image_path):
-    """Update the image_url in the database for an exhibition"""
+def get_exhibition_page(query):
+    """Get one page of exhibitions for a pagination.PageQuery"""
     connection = get_db_connection()
     if connection is None:
-        return False
+        return {"error": "Database connection failed"}
     
     cursor = connection.cursor()
     
     try:
-        query = """
-        UPDATE exhibitions
-        SET image_url = %s
-        WHERE id = %s
-        """
-        cursor.execute(query, (image_path, exhibition_id))
-        connection.commit()
-        return True
+        cursor.execute(*query.sql(EXHIBITION_MODEL.select))
+        exhibitions, next_cursor = query.page(EXHIBITION_MODEL, cursor, cursor.fetchall())
+        
+        variant_index = load_variant_index()
+        for exhibition in exhibitions:
+            exhibition['imageVariants'] = srcsets(exhibition['imageUrl'], variant_index)
+        
+        return {"exhibitions": exhibitions, "nextCursor": next_cursor}
     except Exception as e:
-        print(f"Error updating exhibition image: {e}")
-        return False
+        print(f"Error getting exhibitions: {e}")
+        return {"error": str(e)}
     finally:
         if connection.is_connected():
             cursor.close()
@@ -164,9 +192,8 @@ def get_exhibition(exhibition_id):
     cursor = connection.cursor()
     
     try:
-        query = """
-        SELECT id, title, description, location, start_date, end_date,
-               ticket_price, image_url, total_slots, available_slots, status
+        query = f"""
+        SELECT {EXHIBITION_MODEL.select}
         FROM exhibitions
         WHERE id = %s
         """
@@ -176,34 +203,8 @@ def get_exhibition(exhibition_id):
         if not row:
             return {"error": "Exhibition not found"}
         
-        exhibition = dict_from_row(row, cursor)
-        
-        # Convert id to string to match frontend expectations
-        exhibition['id'] = str(exhibition['id'])
-        
-        # Convert dates to string format
-        exhibition['startDate'] = exhibition.pop('start_date').isoformat()
-        exhibition['endDate'] = exhibition.pop('end_date').isoformat()
-        
-        # Convert ticket_price to camelCase
-        exhibition['ticketPrice'] = exhibition.pop('ticket_price')
-        
-        # Convert image_url to camelCase and ensure it's valid
-        image_url = exhibition.pop('image_url')
-        # Convert base64 images to file paths
-        if image_url and (image_url.startswith('data:') or 'base64' in image_url):
-            # Save the base64 image to a file and get its path
-            saved_path = save_image_from_base64(image_url)
-            exhibition['imageUrl'] = saved_path
-            # Also update the database with the new path
-            update_exhibition_image(exhibition['id'], saved_path)
-            print(f"Converted base64 image to file: {saved_path}")
-        else:
-            exhibition['imageUrl'] = image_url if image_url else DEFAULT_EXHIBITION_IMAGE
-        
-        # Convert total_slots and available_slots to camelCase
-        exhibition['totalSlots'] = exhibition.pop('total_slots')
-        exhibition['availableSlots'] = exhibition.pop('available_slots')
+        exhibition = EXHIBITION_MODEL.to_dict(cursor, row)
+        exhibition['imageVariants'] = srcsets(exhibition['imageUrl'], load_variant_index())
         
         return exhibition
     except Exception as e:
@@ -310,6 +311,7 @@ def create_exhibition(auth_header, exhibition_data):
             exhibition_data.get("status")
         ))
         connection.commit()
+        invalidate_exhibition_cache()
         
         # Return the newly created exhibition
         new_exhibition_id = cursor.lastrowid
@@ -380,6 +382,7 @@ def update_exhibition(auth_header, exhibition_id, exhibition_data):
         # Check if exhibition was found and updated
         if cursor.rowcount == 0:
             return {"error": "Exhibition not found"}
+        invalidate_exhibition_cache()
         
         # Return the updated exhibition
         return get_exhibition(exhibition_id)
@@ -448,6 +451,7 @@ def delete_exhibition(auth_header, exhibition_id):
         # Delete the exhibition
         cursor.execute("DELETE FROM exhibitions WHERE id = %s", (exhibition_id,))
         connection.commit()
+        invalidate_exhibition_cache()
         
         return {"success": True, "message": f"Exhibition with ID {exhibition_id} deleted successfully"}
     except Exception as e:
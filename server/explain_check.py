@@ -0,0 +1,200 @@
+# Runs EXPLAIN on the queries the server issues and fails if one of them has
+# to scan a whole table because no index can serve it:
+#
+#   python explain_check.py [--verbose] [--strict]
+#
+# Exit status 1 lists the offending queries. A table read with type ALL is a
+# failure only when MySQL reports no usable index (possible_keys is empty);
+# on small tables the optimizer may prefer a scan even when an index exists,
+# which is reported as a warning (--strict makes warnings failures too). A
+# full index scan (type index) is a failure unless the query has a LIMIT to
+# stop it early. Queries that return every row by design (the unpaginated
+# lists and exports) are marked full_scan_ok, either for every table or
+# only for the tables named.
+#
+# When you add a query to the server, add it here too. Run it against a
+# database that has been migrated (python migrate.py).
+import argparse
+import sys
+
+from database import get_db_connection, ORDER_LIST, ORDER_SELECT, TICKET_LIST, TICKET_SELECT
+from artwork import ARTWORK_MODEL, ARTWORK_LIST
+from exhibition import EXHIBITION_MODEL, EXHIBITION_LIST
+from mpesa import SELECT_TRANSACTION_SQL, SETTLE_TRANSACTION_SQL, SELECT_SETTLED_ORDER_SQL
+from mpesa_reconciler import SELECT_PENDING_SQL
+from pagination import encode_cursor
+
+
+class Check:
+    """A query to EXPLAIN; full_scan_ok is True or a tuple of tables (as EXPLAIN names them) allowed to be scanned"""
+
+    __slots__ = ('name', 'sql', 'args', 'full_scan_ok')
+
+    def __init__(self, name, sql, args=(), full_scan_ok=False):
+        self.name = name
+        self.sql = sql
+        self.args = args
+        self.full_scan_ok = full_scan_ok
+
+    def may_scan(self, table):
+        return self.full_scan_ok is True or (bool(self.full_scan_ok) and table in self.full_scan_ok)
+
+    @property
+    def limited(self):
+        return 'LIMIT' in self.sql.upper().split()
+
+
+def page_checks(name, spec, select, param_sets):
+    """Checks for a paginated listing: each parameter set, first and later pages"""
+    checks = []
+    for params in param_sets:
+        label = "&".join(f"{k}={v}" for k, v in params.items()) or "default"
+        query = spec.parse(dict(params, limit='20'))
+        checks.append(Check(f"{name} page ({label})", *query.sql(select)))
+        sort_value = 1 if query.sort == 'id' else '2025-01-01'
+        query = spec.parse(dict(params, limit='20', cursor=encode_cursor([sort_value, 1])))
+        checks.append(Check(f"{name} next page ({label})", *query.sql(select)))
+    return checks
+
+
+def export_checks(name, spec, select, alias, param_sets):
+    """Checks for an unpaginated export; only the unfiltered one may scan the main table"""
+    checks = []
+    for params in param_sets:
+        label = "&".join(f"{k}={v}" for k, v in params.items()) or "default"
+        sql, args = spec.export_query(params).sql(select)
+        checks.append(Check(f"{name} export ({label})", sql, args, full_scan_ok=() if params else (alias,)))
+    return checks
+
+
+def build_checks():
+    checks = [
+        # auth.py
+        Check("user by email", "SELECT id FROM users WHERE email = %s", ('a@example.com',)),
+        Check("user login", "SELECT id, name FROM users WHERE email = %s AND password = %s", ('a@example.com', 'x')),
+        Check("admin by email", "SELECT id FROM admins WHERE email = %s", ('a@example.com',)),
+        Check("admin login", "SELECT id, name FROM admins WHERE email = %s AND password = %s", ('a@example.com', 'x')),
+        # artwork.py / exhibition.py
+        Check("artwork list", f"SELECT {ARTWORK_MODEL.select} FROM artworks ORDER BY created_at DESC",
+              full_scan_ok=True),
+        Check("artwork by id", f"SELECT {ARTWORK_MODEL.select} FROM artworks WHERE id = %s", (1,)),
+        Check("artwork image", "SELECT image_url FROM artworks WHERE id = %s", (1,)),
+        Check("artwork delete", "DELETE FROM artworks WHERE id = %s", (0,)),
+        Check("exhibition list", f"SELECT {EXHIBITION_MODEL.select} FROM exhibitions ORDER BY start_date ASC",
+              full_scan_ok=True),
+        Check("exhibition by id", f"SELECT {EXHIBITION_MODEL.select} FROM exhibitions WHERE id = %s", (1,)),
+        Check("exhibition image", "SELECT image_url FROM exhibitions WHERE id = %s", (1,)),
+        # database.py
+        Check("contact messages", "SELECT * FROM contact_messages ORDER BY created_at DESC", full_scan_ok=True),
+        Check("contact message status", "UPDATE contact_messages SET status = %s WHERE id = %s", ('read', 0)),
+        # mpesa.py / mpesa_async.py
+        Check("transaction by checkout id", SELECT_TRANSACTION_SQL, ('ws_CO_0',)),
+        Check("settle transaction", SETTLE_TRANSACTION_SQL, {
+            'status': 'failed', 'result_code': '1', 'result_desc': 'x', 'checkout_request_id': 'ws_CO_0'}),
+        Check("settled order", SELECT_SETTLED_ORDER_SQL, ('ws_CO_0',)),
+        # mpesa_reconciler.py
+        Check("pending transactions", SELECT_PENDING_SQL, (30, 100)),
+        Check("user artwork orders", """
+        SELECT o.*, a.title as artwork_title, a.artist, a.image_url
+        FROM artwork_orders o JOIN artworks a ON o.artwork_id = a.id
+        WHERE o.user_id = %s ORDER BY o.created_at DESC
+        """, (1,)),
+        Check("user bookings", """
+        SELECT b.*, e.title as exhibition_title, e.location, e.image_url
+        FROM exhibition_bookings b JOIN exhibitions e ON b.exhibition_id = e.id
+        WHERE b.user_id = %s ORDER BY b.created_at DESC
+        """, (1,)),
+    ]
+    checks += page_checks("artworks", ARTWORK_LIST, ARTWORK_MODEL.select, [
+        {}, {'sort': 'id'}, {'status': 'available'}, {'artist': 'x'}, {'medium': 'x'},
+        {'min_price': '1', 'max_price': '100'},
+    ])
+    checks += page_checks("exhibitions", EXHIBITION_LIST, EXHIBITION_MODEL.select, [
+        {}, {'status': 'upcoming'}, {'location': 'x'}, {'min_price': '1'},
+    ])
+    checks += page_checks("orders", ORDER_LIST, ORDER_SELECT, [
+        {}, {'payment_status': 'completed'}, {'user_id': '1'}, {'from': '2025-01-01', 'to': '2025-02-01'},
+    ])
+    checks += page_checks("tickets", TICKET_LIST, TICKET_SELECT, [
+        {}, {'payment_status': 'completed'}, {'exhibition_id': '1'},
+    ])
+    # stream_orders / stream_tickets: GET /admin/orders, /tickets and their exports
+    checks += export_checks("orders", ORDER_LIST, ORDER_SELECT, 'ao', [
+        {}, {'payment_status': 'completed'}, {'user_id': '1'}, {'from': '2025-01-01', 'to': '2025-02-01'},
+    ])
+    checks += export_checks("tickets", TICKET_LIST, TICKET_SELECT, 'eb', [
+        {}, {'payment_status': 'completed'}, {'exhibition_id': '1'},
+    ])
+    return checks
+
+
+def explain(cursor, check):
+    """EXPLAIN rows of a query as dicts"""
+    cursor.execute("EXPLAIN " + check.sql, check.args)
+    columns = [name.lower() for name in cursor.column_names]
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def assess(check, plan):
+    """(failures, warnings) for one query plan"""
+    failures = []
+    warnings = []
+    for row in plan:
+        if row.get('type') not in ('ALL', 'index') or check.may_scan(row.get('table')):
+            continue
+        if row.get('type') == 'index':
+            if not check.limited:
+                failures.append(f"{check.name}: full scan of index {row.get('key')} on {row.get('table')}, no LIMIT")
+            continue
+        message = f"{check.name}: full scan of {row.get('table')}"
+        if row.get('possible_keys'):
+            warnings.append(f"{message} (index {row['possible_keys']} not chosen; table may be small)")
+        else:
+            failures.append(f"{message}, no usable index")
+    return failures, warnings
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="EXPLAIN the server's queries and fail on full table scans")
+    parser.add_argument("--verbose", action="store_true", help="Print every query plan")
+    parser.add_argument("--strict", action="store_true", help="Treat warnings as failures")
+    args = parser.parse_args(argv)
+
+    connection = get_db_connection()
+    if connection is None:
+        print("Database connection failed")
+        return 1
+    cursor = connection.cursor()
+    failures = []
+    warnings = []
+    try:
+        for check in build_checks():
+            try:
+                plan = explain(cursor, check)
+            except Exception as e:
+                failures.append(f"{check.name}: EXPLAIN failed ({e})")
+                continue
+            if args.verbose:
+                for row in plan:
+                    print(f"{check.name}: table={row.get('table')} type={row.get('type')} "
+                          f"key={row.get('key')} rows={row.get('rows')} extra={row.get('extra')}")
+            query_failures, query_warnings = assess(check, plan)
+            failures += query_failures
+            warnings += query_warnings
+    finally:
+        cursor.close()
+        connection.close()
+
+    if args.strict:
+        failures += warnings
+        warnings = []
+    for warning in warnings:
+        print(f"warning: {warning}")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    print(f"{len(failures)} failure(s), {len(warnings)} warning(s)")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
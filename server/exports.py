@@ -0,0 +1,107 @@
+# Streamed response bodies for admin listings and exports.
+# Rows are read from the database in batches and written to the client as
+# they are encoded, so the memory used by an export does not grow with the
+# number of orders. Bodies are sent with chunked transfer encoding when the
+# connection speaks HTTP/1.1, and delimited by closing the connection
+# otherwise.
+import csv
+import io
+import os
+
+from serializer import dumps_bytes
+
+# Rows fetched from the database per round trip while streaming
+EXPORT_BATCH_SIZE = int(os.environ.get('EXPORT_BATCH_SIZE', '500'))
+# Encoded output is sent in chunks of about this many bytes
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Leading characters spreadsheet programs treat as a formula
+_FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+class ChunkedWriter:
+    """Buffers small writes and sends them as HTTP/1.1 chunks
+
+    With chunked=False the data is written as is (for HTTP/1.0 clients,
+    where the end of the body is the end of the connection).
+    """
+
+    def __init__(self, wfile, chunked=True, chunk_size=STREAM_CHUNK_SIZE):
+        self.wfile = wfile
+        self.chunked = chunked
+        self.chunk_size = chunk_size
+        self._buffer = []
+        self._buffered = 0
+        self.bytes_sent = 0
+
+    def write(self, data):
+        self._buffer.append(data)
+        self._buffered += len(data)
+        if self._buffered >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if not self._buffered:
+            return
+        data = b"".join(self._buffer)
+        self._buffer = []
+        self._buffered = 0
+        if self.chunked:
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        else:
+            self.wfile.write(data)
+        self.bytes_sent += len(data)
+
+    def close(self):
+        """Send what is buffered and end the body"""
+        self.flush()
+        if self.chunked:
+            self.wfile.write(b"0\r\n\r\n")
+
+
+def ndjson_body(items):
+    """One JSON object per line"""
+    for item in items:
+        yield dumps_bytes(item) + b"\n"
+
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, str) and value.startswith(_FORMULA_PREFIXES):
+        # Keep customer-entered text from running as a formula when the
+        # export is opened in a spreadsheet
+        return "'" + value
+    return value
+
+
+def csv_body(items):
+    """CSV with a header row taken from the first item's keys"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    columns = None
+    for item in items:
+        if columns is None:
+            columns = list(item)
+            writer.writerow(columns)
+        writer.writerow([_csv_value(item.get(column)) for column in columns])
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def json_list_body(key, items):
+    """{"<key>": [...]}, the same document the unstreamed endpoints returned"""
+    yield b'{"' + key.encode() + b'":['
+    separator = b""
+    for item in items:
+        yield separator + dumps_bytes(item)
+        separator = b","
+    yield b"]}"
+
+
+# format query parameter -> (Content-Type, body generator, file extension)
+EXPORT_FORMATS = {
+    'ndjson': ('application/x-ndjson', ndjson_body, 'ndjson'),
+    'csv': ('text/csv; charset=utf-8', csv_body, 'csv'),
+}
@@ -0,0 +1,238 @@
+# Resized copies of uploaded images for responsive <img srcset> markup.
+# Variants are generated in a background process pool after an upload is
+# saved, and written to static/uploads/variants/ as w<width>-<original stem>
+# in WebP and JPEG.
+# Requires: pip install Pillow (without it uploads are served full size only)
+import multiprocessing
+import os
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+UPLOADS_DIR = os.path.join(os.path.dirname(__file__), "static", "uploads")
+VARIANTS_DIR = os.path.join(UPLOADS_DIR, "variants")
+VARIANTS_URL = "/static/uploads/variants"
+
+VARIANT_WIDTHS = tuple(int(w) for w in os.environ.get('IMAGE_VARIANT_WIDTHS', '320,640,1280').split(','))
+IMAGE_WORKERS = int(os.environ.get('IMAGE_WORKERS', '2'))
+
+# (srcset key, Pillow format, extension, save options)
+VARIANT_FORMATS = (
+    ('webp', 'WEBP', '.webp', {'quality': 80, 'method': 4}),
+    ('jpeg', 'JPEG', '.jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+)
+
+
+def is_available():
+    """True if Pillow is installed"""
+    return Image is not None
+
+
+def variant_name(original_name, width, extension):
+    # The width goes first so a content-hashed stem stays at the end of the
+    # name and the variant is served as immutable like its original
+    stem = os.path.splitext(original_name)[0]
+    return f"w{width}-{stem}{extension}"
+
+
+def _upload_path(image_url):
+    """Local path of a /static/uploads/ image, or None for anything else"""
+    if not image_url or not image_url.startswith('/static/uploads/'):
+        return None
+    name = image_url[len('/static/uploads/'):]
+    if '/' in name or name.startswith('.'):
+        return None
+    return os.path.join(UPLOADS_DIR, name)
+
+
+def generate_variants(source_path):
+    """Write the resized variants of one image; runs in a worker process
+
+    Widths at or above the original's are skipped. Returns the number of
+    files written.
+    """
+    os.makedirs(VARIANTS_DIR, exist_ok=True)
+    name = os.path.basename(source_path)
+    written = 0
+    with Image.open(source_path) as image:
+        image.load()
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+        for width in VARIANT_WIDTHS:
+            if width >= image.width:
+                continue
+            height = max(1, round(image.height * width / image.width))
+            resized = image.resize((width, height), Image.LANCZOS)
+            for _, image_format, extension, options in VARIANT_FORMATS:
+                target = os.path.join(VARIANTS_DIR, variant_name(name, width, extension))
+                if os.path.exists(target):
+                    continue
+                output = resized.convert('RGB') if image_format == 'JPEG' else resized
+                temp_path = target + '.part'
+                output.save(temp_path, image_format, **options)
+                os.replace(temp_path, target)
+                written += 1
+    return written
+
+
+class ImagePipeline:
+    """Generates image variants in a process pool, off the request path
+
+    The pool is started on first use with the "spawn" start method, so the
+    workers do not inherit the server's threads or database connections.
+    """
+
+    def __init__(self, workers=IMAGE_WORKERS):
+        self.workers = workers
+        self._executor = None
+        self._lock = threading.Lock()
+        self._in_flight = set()
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+
+    def _get_executor(self):
+        if self._executor is None:
+            context = multiprocessing.get_context('spawn')
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+        return self._executor
+
+    def submit(self, image_url, on_done=None):
+        """Queue variant generation for an uploaded image
+
+        `on_done()` is called (in a background thread) once new variants have
+        been written. Returns False if nothing was queued.
+        """
+        if Image is None:
+            return False
+        source_path = _upload_path(image_url)
+        if source_path is None:
+            return False
+        with self._lock:
+            if source_path in self._in_flight:
+                return False
+            try:
+                future = self._get_executor().submit(generate_variants, source_path)
+            except RuntimeError as e:
+                # Pool shut down (interpreter exiting)
+                print(f"Could not queue image variants for {image_url}: {e}")
+                return False
+            self._in_flight.add(source_path)
+            self.submitted += 1
+
+        def finished(future):
+            with self._lock:
+                self._in_flight.discard(source_path)
+            error = future.exception()
+            if error is not None:
+                self.failed += 1
+                print(f"Failed to generate image variants for {image_url}: {error}")
+                return
+            self.completed += 1
+            if future.result() and on_done is not None:
+                on_done()
+
+        future.add_done_callback(finished)
+        return True
+
+    def reset_after_fork(self):
+        """Forget the parent's pool in a forked worker process"""
+        self._executor = None
+        self._lock = threading.Lock()
+        self._in_flight = set()
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+
+    def stats(self):
+        with self._lock:
+            return {
+                "available": Image is not None,
+                "workers": self.workers,
+                "in_flight": len(self._in_flight),
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "failed": self.failed,
+            }
+
+
+pipeline = ImagePipeline()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=pipeline.reset_after_fork)
+
+
+def load_variant_index():
+    """Map original file name -> {format: [(width, url)]} for every variant on disk
+
+    Built with one directory listing, so a catalog load does not stat each
+    possible variant of each image.
+    """
+    index = {}
+    try:
+        names = os.listdir(VARIANTS_DIR)
+    except FileNotFoundError:
+        return index
+    extensions = {extension: key for key, _, extension, _ in VARIANT_FORMATS}
+    for name in names:
+        prefix, dash, rest = name.partition('-')
+        if not dash or not prefix.startswith('w') or not prefix[1:].isdigit():
+            continue
+        stem, extension = os.path.splitext(rest)
+        key = extensions.get(extension)
+        if key is None:
+            continue
+        index.setdefault(stem, {}).setdefault(key, []).append(
+            (int(prefix[1:]), f"{VARIANTS_URL}/{name}")
+        )
+    return index
+
+
+def srcsets(image_url, index):
+    """srcset strings per format for an image, e.g. {"webp": "/...w320-x.webp 320w, ..."}
+
+    Empty if the image has no variants (yet).
+    """
+    if not image_url or not image_url.startswith('/static/uploads/'):
+        return {}
+    stem = os.path.splitext(os.path.basename(image_url))[0]
+    variants = index.get(stem)
+    if not variants:
+        return {}
+    return {
+        key: ", ".join(f"{url} {width}w" for width, url in sorted(entries))
+        for key, entries in variants.items()
+    }
+
+
+def backfill():
+    """Generate missing variants for every image already in the uploads directory"""
+    if Image is None:
+        print("Pillow is not installed; run: pip install Pillow")
+        return 1
+    names = sorted(name for name in os.listdir(UPLOADS_DIR)
+                   if os.path.isfile(os.path.join(UPLOADS_DIR, name)) and not name.startswith('.'))
+    with ProcessPoolExecutor(max_workers=IMAGE_WORKERS) as executor:
+        paths = [os.path.join(UPLOADS_DIR, name) for name in names]
+        for name, result in zip(names, executor.map(_backfill_one, paths)):
+            print(f"{name}: {result}")
+    return 0
+
+
+def _backfill_one(path):
+    try:
+        return f"{generate_variants(path)} variants written"
+    except Exception as e:
+        return f"skipped ({e})"
+
+
+if __name__ == "__main__":
+    sys.exit(backfill())
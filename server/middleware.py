@@ -1,21 +1,87 @@
 
 import jwt
 import datetime
+import hashlib
 import os
+import threading
+import time
+from collections import OrderedDict
 from functools import wraps
 from http.server import BaseHTTPRequestHandler
-from decimal import Decimal
-import json
+
+from serializer import dumps_bytes
 
 # Get the secret key from environment or use a default (in production, always use environment variables)
 SECRET_KEY = os.environ.get('JWT_SECRET_KEY', 'afriart_default_secret_key')
+# Verified tokens remembered per process, so a session's repeated requests
+# skip the signature check
+JWT_CACHE_SIZE = int(os.environ.get('JWT_CACHE_SIZE', '1024'))
+
+
+class TokenCache:
+    """LRU of verified token -> claims
+
+    Keyed on a SHA-256 digest of the token, so the tokens themselves are not
+    kept in memory. A cached token is still rejected once its `exp` has
+    passed. Only tokens that verified are cached; a bad token is checked
+    again every time.
+    """
+
+    def __init__(self, max_entries=JWT_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._tokens = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+
+    @staticmethod
+    def key(token):
+        return hashlib.sha256(token.encode()).digest()
 
-# Custom JSON encoder to handle Decimal types
-class DecimalEncoder(json.JSONEncoder):
-    def default(self, obj):
-        if isinstance(obj, Decimal):
-            return float(obj)
-        return super(DecimalEncoder, self).default(obj)
+    def get(self, key):
+        """Claims for a cached token, {"error": "Token expired"}, or None on a miss"""
+        with self._lock:
+            entry = self._tokens.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            payload, expires_at = entry
+            if expires_at is not None and expires_at <= time.time():
+                del self._tokens[key]
+                self.expired += 1
+                return {"error": "Token expired"}
+            self._tokens.move_to_end(key)
+            self.hits += 1
+        # Callers get their own copy of the claims
+        return dict(payload)
+
+    def put(self, key, payload):
+        expires_at = payload.get("exp")
+        if expires_at is not None and not isinstance(expires_at, (int, float)):
+            return
+        with self._lock:
+            self._tokens[key] = (dict(payload), expires_at)
+            self._tokens.move_to_end(key)
+            while len(self._tokens) > self.max_entries:
+                self._tokens.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._tokens.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._tokens),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "expired": self.expired,
+            }
+
+
+token_cache = TokenCache()
 
 def generate_token(user_id, name, is_admin):
     """Generate a JWT token for authentication"""
@@ -31,11 +97,16 @@ def generate_token(user_id, name, is_admin):
     return token
 
 def verify_token(token):
-    """Verify a JWT token"""
+    """Verify a JWT token (tokens seen before are answered from token_cache)"""
+    key = TokenCache.key(token)
+    cached = token_cache.get(key)
+    if cached is not None:
+        return cached
     try:
         print(f"Verifying token: {token[:20]}...")
         payload = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
         print(f"Token decoded successfully: {payload}")
+        token_cache.put(key, payload)
         return payload
     except jwt.ExpiredSignatureError:
         print("Token verification failed: Token expired")
@@ -87,7 +158,7 @@ def auth_required(handler_method):
         payload = verify_token(token)
         if isinstance(payload, dict) and "error" in payload:
             self._set_response(401)
-            self.wfile.write(f'{{"error": "{payload["error"]}"}}'.encode())
+            self.wfile.write(dumps_bytes({"error": payload["error"]}))
             return None
         
         # Attach user info to the handler
@@ -110,7 +181,7 @@ def admin_required(handler_method):
         payload = verify_token(token)
         if isinstance(payload, dict) and "error" in payload:
             self._set_response(401)
-            self.wfile.write(f'{{"error": "{payload["error"]}"}}'.encode())
+            self.wfile.write(dumps_bytes({"error": payload["error"]}))
             return None
         
         # Check if user is admin
@@ -124,8 +195,3 @@ def admin_required(handler_method):
         return handler_method(self, *args, **kwargs)
     
     return wrapper
-
-# Helper function to safely encode JSON with Decimal values
-def json_dumps(data):
-    """Safely convert data to JSON string, handling Decimal types"""
-    return json.dumps(data, cls=DecimalEncoder)
@@ -0,0 +1,176 @@
+# Versioned schema migrations.
+# Each file in migrations/ is named <version>_<name>.py and defines
+# up(cursor); they are applied in version order and recorded in the
+# schema_version table, so each runs once per database. MySQL commits DDL
+# immediately, so migrations are written to be safe to re-run if one fails
+# half way (use the helpers below rather than bare CREATE INDEX).
+#
+#   python migrate.py           # apply pending migrations
+#   python migrate.py status    # list applied and pending migrations
+#
+# The server calls db_setup.initialize_database() at startup, which checks
+# schema_is_current() first and only takes the migration lock when a
+# migration is pending.
+import argparse
+import importlib.util
+import os
+import re
+import sys
+
+from mysql.connector import Error
+
+from database import get_db_connection
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(__file__), "migrations")
+# Serializes migration runs across worker processes and hosts
+LOCK_NAME = "afriart_schema_migrations"
+LOCK_TIMEOUT = 60
+
+_FILE_RE = re.compile(r"^(\d+)_(\w+)\.py$")
+
+SCHEMA_VERSION_TABLE = """
+CREATE TABLE IF NOT EXISTS schema_version (
+    version INT PRIMARY KEY,
+    name VARCHAR(255) NOT NULL,
+    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+)
+"""
+
+
+class MigrationError(Exception):
+    """A migration could not be applied; the message says what to fix"""
+
+
+def discover():
+    """[(version, name, path)] for every migration file, in order"""
+    migrations = []
+    for filename in os.listdir(MIGRATIONS_DIR):
+        match = _FILE_RE.match(filename)
+        if match:
+            migrations.append((int(match.group(1)), match.group(2), os.path.join(MIGRATIONS_DIR, filename)))
+    migrations.sort()
+    versions = [version for version, _, _ in migrations]
+    if len(versions) != len(set(versions)):
+        raise MigrationError(f"Duplicate migration versions in {MIGRATIONS_DIR}")
+    return migrations
+
+
+def load(path):
+    spec = importlib.util.spec_from_file_location(f"migration_{os.path.basename(path)[:-3]}", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def applied_versions(cursor):
+    cursor.execute(SCHEMA_VERSION_TABLE)
+    cursor.execute("SELECT version FROM schema_version")
+    return {row[0] for row in cursor.fetchall()}
+
+
+def schema_is_current(connection):
+    """True if every migration has been applied; a single query and no DDL"""
+    migrations = discover()
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SELECT COUNT(*), MAX(version) FROM schema_version")
+        count, latest = cursor.fetchone()
+    except Error:
+        # No schema_version table yet
+        return False
+    finally:
+        cursor.close()
+    return count == len(migrations) and latest == (migrations[-1][0] if migrations else None)
+
+
+def apply_migrations(connection):
+    """Apply every pending migration; returns the names applied
+
+    Raises MigrationError (or the database error) if one fails; the
+    migrations before it stay recorded.
+    """
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SELECT GET_LOCK(%s, %s)", (LOCK_NAME, LOCK_TIMEOUT))
+        if cursor.fetchone()[0] != 1:
+            raise MigrationError("Timed out waiting for another process to finish migrating")
+        try:
+            done = applied_versions(cursor)
+            applied = []
+            for version, name, path in discover():
+                if version in done:
+                    continue
+                print(f"Applying migration {version:04d}_{name}")
+                load(path).up(cursor)
+                cursor.execute("INSERT INTO schema_version (version, name) VALUES (%s, %s)", (version, name))
+                connection.commit()
+                applied.append(f"{version:04d}_{name}")
+            return applied
+        finally:
+            cursor.execute("SELECT RELEASE_LOCK(%s)", (LOCK_NAME,))
+            cursor.fetchone()
+    finally:
+        cursor.close()
+
+
+# Helpers for migrations (MySQL has no ADD INDEX / ADD COLUMN IF NOT EXISTS)
+
+def index_exists(cursor, table, name):
+    cursor.execute("""
+    SELECT 1 FROM information_schema.statistics
+    WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s
+    LIMIT 1
+    """, (table, name))
+    return cursor.fetchone() is not None
+
+
+def column_exists(cursor, table, column):
+    cursor.execute("""
+    SELECT 1 FROM information_schema.columns
+    WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s
+    """, (table, column))
+    return cursor.fetchone() is not None
+
+
+def add_index(cursor, table, name, columns, unique=False):
+    """Create an index unless one with that name exists"""
+    if index_exists(cursor, table, name):
+        return False
+    cursor.execute(f"CREATE {'UNIQUE ' if unique else ''}INDEX {name} ON {table} ({columns})")
+    print(f"  created index {name} on {table} ({columns})")
+    return True
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Apply database schema migrations")
+    parser.add_argument("command", nargs="?", choices=["up", "status"], default="up")
+    args = parser.parse_args(argv)
+
+    connection = get_db_connection()
+    if connection is None:
+        print("Database connection failed")
+        return 1
+    try:
+        if args.command == "status":
+            cursor = connection.cursor()
+            try:
+                done = applied_versions(cursor)
+            finally:
+                cursor.close()
+            for version, name, _ in discover():
+                print(f"{'applied' if version in done else 'pending'}  {version:04d}_{name}")
+            return 0
+
+        try:
+            applied = apply_migrations(connection)
+        except MigrationError as e:
+            print(f"Migration failed: {e}")
+            return 1
+        print(f"Applied {len(applied)} migration(s)" if applied else "Schema is up to date")
+        return 0
+    finally:
+        connection.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,140 @@
+# One-off migration: move images stored inline as base64 in artworks.image_url
+# and exhibitions.image_url into the uploads store, replacing each value with
+# its /static/uploads/ URL. Run it once after upgrading, while the server is
+# up or down:
+#
+#   python migrate_images.py [--batch-size 50] [--dry-run]
+#
+# Rows are processed in id order in small batches, one image in memory at a
+# time, and each row is committed on its own. Progress is checkpointed to
+# migrate_images.state, so an interrupted run continues where it stopped;
+# --restart ignores the checkpoint.
+import argparse
+import binascii
+import json
+import os
+import sys
+
+from database import get_db_connection
+from uploads import save_base64_image, UploadError
+
+STATE_FILE = os.path.join(os.path.dirname(__file__), "migrate_images.state")
+DEFAULT_BATCH_SIZE = 50
+
+# Table -> image used when a stored value cannot be decoded (the fallbacks
+# the read paths used to apply)
+TABLES = {
+    "artworks": "/static/uploads/placeholder.jpg",
+    "exhibitions": "/static/uploads/default_exhibition.jpg",
+}
+
+# Escaped for use in a parameterized query
+INLINE_IMAGE_CONDITION = "(image_url LIKE 'data:%%' OR image_url LIKE '%%base64%%')"
+
+
+def load_state():
+    try:
+        with open(STATE_FILE) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_state(state):
+    temp_path = STATE_FILE + ".tmp"
+    with open(temp_path, "w") as f:
+        json.dump(state, f)
+    os.replace(temp_path, STATE_FILE)
+
+
+def pending_ids(cursor, table, after_id, batch_size):
+    """Ids of the next rows with inline images (ids only, so a batch stays small)"""
+    cursor.execute(
+        f"SELECT id FROM {table} WHERE id > %s AND {INLINE_IMAGE_CONDITION} ORDER BY id LIMIT %s",
+        (after_id, batch_size)
+    )
+    return [row[0] for row in cursor.fetchall()]
+
+
+def convert(image_url, fallback):
+    """Store one inline image; returns (new URL, error message or None)"""
+    try:
+        return save_base64_image(image_url), None
+    except (UploadError, binascii.Error) as e:
+        return fallback, str(e)
+
+
+def migrate_table(connection, table, state, batch_size, dry_run):
+    """Convert every inline image in one table; returns (converted, failed)"""
+    cursor = connection.cursor()
+    fallback = TABLES[table]
+    after_id = state.get(table, 0)
+    converted = failed = 0
+    try:
+        while True:
+            ids = pending_ids(cursor, table, after_id, batch_size)
+            if not ids:
+                return converted, failed
+            for row_id in ids:
+                cursor.execute(f"SELECT image_url FROM {table} WHERE id = %s", (row_id,))
+                row = cursor.fetchone()
+                after_id = row_id
+                if row is None:
+                    continue
+                image_url = row[0]
+                if dry_run:
+                    print(f"{table} {row_id}: would convert {len(image_url)} characters")
+                    converted += 1
+                    continue
+
+                new_url, error = convert(image_url, fallback)
+                # Only replace the value we read, in case the row was edited meanwhile
+                cursor.execute(
+                    f"UPDATE {table} SET image_url = %s WHERE id = %s AND image_url = %s",
+                    (new_url, row_id, image_url)
+                )
+                connection.commit()
+                if error:
+                    failed += 1
+                    print(f"{table} {row_id}: could not decode image ({error}), using {new_url}")
+                else:
+                    converted += 1
+                    print(f"{table} {row_id}: {new_url}")
+            if not dry_run:
+                state[table] = after_id
+                save_state(state)
+    finally:
+        cursor.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Move inline base64 images out of the database")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+                        help="Rows fetched per query")
+    parser.add_argument("--dry-run", action="store_true", help="Report what would be converted")
+    parser.add_argument("--restart", action="store_true", help="Ignore the saved checkpoint")
+    args = parser.parse_args(argv)
+
+    connection = get_db_connection()
+    if connection is None:
+        print("Database connection failed")
+        return 1
+
+    state = {} if args.restart else load_state()
+    if state:
+        print(f"Resuming after {state}")
+    try:
+        for table in TABLES:
+            converted, failed = migrate_table(connection, table, state, args.batch_size, args.dry_run)
+            print(f"{table}: {converted} converted, {failed} replaced with a placeholder")
+    finally:
+        connection.close()
+
+    if not args.dry_run:
+        print("Done. Cached catalog responses expire within CATALOG_CACHE_TTL seconds; "
+              "run python image_variants.py to generate resized variants.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
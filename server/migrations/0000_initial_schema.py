@@ -0,0 +1,136 @@
+"""Tables of the original schema (formerly created by db_setup.initialize_database)
+
+Every statement is CREATE TABLE IF NOT EXISTS, so databases created before
+migrations existed are recorded as migrated without changes.
+"""
+
+TABLES = [
+    # Users table
+    """
+    CREATE TABLE IF NOT EXISTS users (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        name VARCHAR(255) NOT NULL,
+        email VARCHAR(255) NOT NULL UNIQUE,
+        password VARCHAR(255) NOT NULL,
+        phone VARCHAR(20),
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    # Admins table
+    """
+    CREATE TABLE IF NOT EXISTS admins (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        name VARCHAR(255) NOT NULL,
+        email VARCHAR(255) NOT NULL UNIQUE,
+        password VARCHAR(255) NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    # Artworks table
+    """
+    CREATE TABLE IF NOT EXISTS artworks (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        title VARCHAR(255) NOT NULL,
+        artist VARCHAR(255) NOT NULL,
+        description TEXT,
+        price DECIMAL(10, 2) NOT NULL,
+        image_url VARCHAR(255),
+        dimensions VARCHAR(100),
+        medium VARCHAR(100),
+        year INT,
+        status ENUM('available', 'sold') NOT NULL DEFAULT 'available',
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    # Exhibitions table
+    """
+    CREATE TABLE IF NOT EXISTS exhibitions (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        title VARCHAR(255) NOT NULL,
+        description TEXT,
+        location VARCHAR(255) NOT NULL,
+        start_date DATE NOT NULL,
+        end_date DATE NOT NULL,
+        ticket_price DECIMAL(10, 2) NOT NULL,
+        image_url VARCHAR(255),
+        total_slots INT NOT NULL,
+        available_slots INT NOT NULL,
+        status ENUM('upcoming', 'ongoing', 'past') NOT NULL DEFAULT 'upcoming',
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    # Artwork orders table
+    """
+    CREATE TABLE IF NOT EXISTS artwork_orders (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        user_id INT NOT NULL,
+        artwork_id INT NOT NULL,
+        name VARCHAR(255) NOT NULL,
+        email VARCHAR(255) NOT NULL,
+        phone VARCHAR(20) NOT NULL,
+        delivery_address TEXT NOT NULL,
+        payment_method ENUM('mpesa') NOT NULL,
+        payment_status ENUM('pending', 'completed', 'failed') NOT NULL DEFAULT 'pending',
+        total_amount DECIMAL(10, 2) NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+        FOREIGN KEY (artwork_id) REFERENCES artworks(id) ON DELETE CASCADE
+    )
+    """,
+    # Exhibition bookings (tickets) table
+    """
+    CREATE TABLE IF NOT EXISTS exhibition_bookings (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        user_id INT NOT NULL,
+        exhibition_id INT NOT NULL,
+        name VARCHAR(255) NOT NULL,
+        email VARCHAR(255) NOT NULL,
+        phone VARCHAR(20) NOT NULL,
+        slots INT NOT NULL,
+        payment_method ENUM('mpesa') NOT NULL,
+        payment_status ENUM('pending', 'completed', 'failed') NOT NULL DEFAULT 'pending',
+        total_amount DECIMAL(10, 2) NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        ticket_code VARCHAR(50) UNIQUE,
+        FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+        FOREIGN KEY (exhibition_id) REFERENCES exhibitions(id) ON DELETE CASCADE
+    )
+    """,
+    # Mpesa transactions table
+    """
+    CREATE TABLE IF NOT EXISTS mpesa_transactions (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        checkout_request_id VARCHAR(100) NOT NULL,
+        merchant_request_id VARCHAR(100) NOT NULL,
+        order_type ENUM('artwork', 'exhibition') NOT NULL,
+        order_id INT NOT NULL,
+        user_id INT NOT NULL,
+        amount DECIMAL(10, 2) NOT NULL,
+        phone_number VARCHAR(20) NOT NULL,
+        result_code VARCHAR(10),
+        result_desc VARCHAR(255),
+        transaction_id VARCHAR(50),
+        status ENUM('pending', 'completed', 'failed') NOT NULL DEFAULT 'pending',
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+    )
+    """,
+    # Contact messages table
+    """
+    CREATE TABLE IF NOT EXISTS contact_messages (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        name VARCHAR(255) NOT NULL,
+        email VARCHAR(255) NOT NULL,
+        phone VARCHAR(20),
+        message TEXT NOT NULL,
+        status ENUM('new', 'read', 'replied') NOT NULL DEFAULT 'new',
+        source VARCHAR(50) DEFAULT 'contact_form',
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+]
+
+
+def up(cursor):
+    for statement in TABLES:
+        cursor.execute(statement)
@@ -0,0 +1,48 @@
+"""Indexes for the hot lookups and the paginated listings
+
+- mpesa_transactions.checkout_request_id: every callback and status poll
+  looks a transaction up by it; Safaricom issues one per STK push, so it is
+  made unique.
+- contact_messages.created_at: the admin message list is ordered by it.
+- artworks/exhibitions/artwork_orders/exhibition_bookings: composite
+  indexes for the filtered, keyset-paginated listings (pagination.py).
+  Each filter column is followed by the sort column and id, so a filtered
+  page is one index range scan; they also cover lookups by artworks.status
+  and by the orders' and bookings' created_at.
+"""
+from migrate import MigrationError, add_index
+
+INDEXES = [
+    ('contact_messages', 'idx_contact_messages_created', 'created_at, id'),
+    ('artworks', 'idx_artworks_created', 'created_at, id'),
+    ('artworks', 'idx_artworks_status_created', 'status, created_at, id'),
+    ('artworks', 'idx_artworks_artist_created', 'artist, created_at, id'),
+    ('artworks', 'idx_artworks_medium_created', 'medium, created_at, id'),
+    ('artworks', 'idx_artworks_price', 'price, id'),
+    ('exhibitions', 'idx_exhibitions_start', 'start_date, id'),
+    ('exhibitions', 'idx_exhibitions_status_start', 'status, start_date, id'),
+    ('exhibitions', 'idx_exhibitions_location_start', 'location, start_date, id'),
+    ('exhibitions', 'idx_exhibitions_price', 'ticket_price, id'),
+    ('artwork_orders', 'idx_orders_created', 'created_at, id'),
+    ('artwork_orders', 'idx_orders_status_created', 'payment_status, created_at, id'),
+    ('exhibition_bookings', 'idx_bookings_created', 'created_at, id'),
+    ('exhibition_bookings', 'idx_bookings_status_created', 'payment_status, created_at, id'),
+]
+
+
+def up(cursor):
+    cursor.execute("""
+    SELECT checkout_request_id FROM mpesa_transactions
+    GROUP BY checkout_request_id HAVING COUNT(*) > 1
+    LIMIT 10
+    """)
+    duplicates = [row[0] for row in cursor.fetchall()]
+    if duplicates:
+        raise MigrationError(
+            "mpesa_transactions has several rows for checkout_request_id "
+            f"{', '.join(duplicates)}; remove the duplicates, then run python migrate.py"
+        )
+    add_index(cursor, 'mpesa_transactions', 'uq_mpesa_checkout_request', 'checkout_request_id', unique=True)
+
+    for table, name, columns in INDEXES:
+        add_index(cursor, table, name, columns)
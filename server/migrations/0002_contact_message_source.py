@@ -0,0 +1,12 @@
+"""contact_messages.source for tables created before the column existed
+
+save_contact_message used to check for the column (and add it) on every
+contact form submission.
+"""
+from migrate import column_exists
+
+
+def up(cursor):
+    if not column_exists(cursor, 'contact_messages', 'source'):
+        cursor.execute("ALTER TABLE contact_messages ADD COLUMN source VARCHAR(50) DEFAULT 'contact_form'")
+        print("  added contact_messages.source")
@@ -0,0 +1,10 @@
+"""Index for the M-Pesa reconciler's scan of pending transactions
+
+mpesa_reconciler.py reads the oldest transactions with status 'pending'
+every pass; without this it scans the whole table.
+"""
+from migrate import add_index
+
+
+def up(cursor):
+    add_index(cursor, 'mpesa_transactions', 'idx_mpesa_status_created', 'status, created_at')
@@ -1,10 +1,16 @@
-import requests
 import base64
 import json
 from datetime import datetime
 import time
+import threading
 from db_setup import get_db_connection, dict_from_row
+from artwork import invalidate_artwork_cache
+from exhibition import apply_slot_delta
 from mysql.connector import Error
+from mpesa_token import TokenManager
+from daraja_client import DarajaClient, MPESA_API_BASE_URL, json_body
+from payment_events import payment_events, Waiter, PAYMENT_WAIT_RECHECK
+from mpesa_reconciler import Reconciler
 
 # M-Pesa API credentials
 CONSUMER_KEY = "sMwMwGZ8oOiSkNrUIrPbcCeWIO8UiQ3SV4CyX739uAyZVs1F"
@@ -12,22 +18,181 @@ CONSUMER_SECRET = "A3Hs5zRY3nDCn7XpxPuc1iAKpfy6UDdetiCalIAfuAIpgTROI5yCqqOewDfTh
 BUSINESS_SHORT_CODE = "174379"  # Lipa Na M-Pesa Shortcode
 PASSKEY = "bfb279f9aa9bdbcf158e97dd71a467cd2e0c893059b10f78e6b72ada1ed2c919"
 CALLBACK_URL = "https://webhook.site/3c1f62b5-4214-47d6-9f26-71c1f4b9c8f0"
-API_BASE_URL = "https://sandbox.safaricom.co.ke"
+API_BASE_URL = MPESA_API_BASE_URL  # MPESA_API_BASE_URL, e.g. http://localhost:8081 for daraja_stub.py
 
-def get_access_token():
-    """Get OAuth access token from M-Pesa"""
-    url = f"{API_BASE_URL}/oauth/v1/generate?grant_type=client_credentials"
+OAUTH_URL = f"{API_BASE_URL}/oauth/v1/generate?grant_type=client_credentials"
+STK_PUSH_URL = f"{API_BASE_URL}/mpesa/stkpush/v1/processrequest"
+STK_QUERY_URL = f"{API_BASE_URL}/mpesa/stkpushquery/v1/query"
+
+# SQL shared by the blocking handlers here and the asyncio ones in mpesa_async.py
+INSERT_ARTWORK_ORDER_SQL = """
+INSERT INTO artwork_orders (user_id, artwork_id, amount, delivery_fee, delivery_address, status)
+VALUES (%s, %s, %s, %s, %s, 'pending')
+"""
+
+INSERT_EXHIBITION_BOOKING_SQL = """
+INSERT INTO exhibition_bookings (user_id, exhibition_id, slots, amount, status)
+VALUES (%s, %s, %s, %s, 'pending')
+"""
+
+INSERT_TRANSACTION_SQL = """
+INSERT INTO mpesa_transactions 
+(order_type, order_id, user_id, amount, phone_number, merchant_request_id, checkout_request_id, status)
+VALUES (%s, %s, %s, %s, %s, %s, %s, 'pending')
+"""
+
+SELECT_TRANSACTION_SQL = """
+SELECT * FROM mpesa_transactions 
+WHERE checkout_request_id = %s
+"""
+
+# Settles a pending transaction and its order in one statement. The
+# `status = 'pending'` guard makes settlement happen once, whichever of the
+# callback, the reconciler or expiry gets there first, so a booking's slots
+# are only taken once. A completed exhibition booking also needs its slots to
+# be still available, so concurrent payments cannot oversell an exhibition.
+# The LEFT JOINs match the order table for the transaction's type (MySQL
+# skips assignments to unmatched rows).
+SETTLE_TRANSACTION_SQL = """
+UPDATE mpesa_transactions t
+LEFT JOIN artwork_orders o ON t.order_type = 'artwork' AND o.id = t.order_id
+LEFT JOIN artworks a ON a.id = o.artwork_id
+LEFT JOIN exhibition_bookings b ON t.order_type = 'exhibition' AND b.id = t.order_id
+LEFT JOIN exhibitions e ON e.id = b.exhibition_id
+SET t.status = %(status)s, t.result_code = %(result_code)s, t.result_desc = %(result_desc)s,
+    o.payment_status = %(status)s,
+    b.payment_status = %(status)s,
+    a.status = IF(%(status)s = 'completed', 'sold', a.status),
+    e.available_slots = IF(%(status)s = 'completed', e.available_slots - b.slots, e.available_slots)
+WHERE t.checkout_request_id = %(checkout_request_id)s AND t.status = 'pending'
+  AND (%(status)s <> 'completed' OR t.order_type <> 'exhibition' OR e.available_slots >= b.slots)
+"""
+
+NO_SLOTS_RESULT_DESC = "Payment received but the exhibition has no slots left"
+
+# What the caches need to know about a transaction just settled
+SELECT_SETTLED_ORDER_SQL = """
+SELECT t.order_type, b.exhibition_id, b.slots
+FROM mpesa_transactions t
+LEFT JOIN exhibition_bookings b ON t.order_type = 'exhibition' AND b.id = t.order_id
+WHERE t.checkout_request_id = %s
+"""
+
+def oauth_headers():
+    """Basic auth headers for the OAuth token request"""
     auth = base64.b64encode(f"{CONSUMER_KEY}:{CONSUMER_SECRET}".encode()).decode('utf-8')
-    headers = {
+    return {
         "Authorization": f"Basic {auth}"
     }
+
+def bearer_headers(access_token):
+    """Headers for authenticated Daraja API calls"""
+    return {
+        "Authorization": f"Bearer {access_token}",
+        "Content-Type": "application/json"
+    }
+
+def format_phone_number(phone_number):
+    """Convert a phone number to the 2547XXXXXXXX format M-Pesa expects"""
+    if phone_number.startswith('+'):
+        phone_number = phone_number[1:]
+    if phone_number.startswith('0'):
+        phone_number = '254' + phone_number[1:]
+    return phone_number
+
+def build_stk_push_payload(phone_number, amount_int, account_reference, order_type, order_id):
+    """Build the STK Push request body"""
+    password, timestamp = generate_password()
+    return {
+        "BusinessShortCode": BUSINESS_SHORT_CODE,
+        "Password": password,
+        "Timestamp": timestamp,
+        "TransactionType": "CustomerPayBillOnline",
+        "Amount": amount_int,
+        "PartyA": phone_number.replace("+", ""),  # Remove any + character
+        "PartyB": BUSINESS_SHORT_CODE,
+        "PhoneNumber": phone_number.replace("+", ""),  # Remove any + character
+        "CallBackURL": CALLBACK_URL,
+        "AccountReference": account_reference,
+        "TransactionDesc": f"Payment for {order_type} #{order_id}"
+    }
+
+def build_stk_query_payload(checkout_request_id):
+    """Build the STK Push status query body"""
+    password, timestamp = generate_password()
+    return {
+        "BusinessShortCode": BUSINESS_SHORT_CODE,
+        "Password": password,
+        "Timestamp": timestamp,
+        "CheckoutRequestID": checkout_request_id
+    }
+
+def order_insert(order_type, order_id, user_id, amount):
+    """Return (query, params) creating the pending order/booking, or None"""
+    # For artwork orders
+    if order_type == 'artwork':
+        return INSERT_ARTWORK_ORDER_SQL, (
+            user_id,
+            order_id,
+            amount * 0.9,  # 90% of amount for artwork
+            amount * 0.1,  # 10% for delivery
+            "To be provided"  # Default address
+        )
+    # For exhibition bookings
+    if order_type == 'exhibition':
+        return INSERT_EXHIBITION_BOOKING_SQL, (
+            user_id,
+            order_id,
+            int(amount / (amount / 1)),  # Calculate slots
+            amount,
+            "pending"
+        )
+    return None
+
+def stored_status_response(transaction):
+    """Response for a transaction that is no longer pending"""
+    return {
+        "status": transaction["status"],
+        "message": transaction["result_desc"] if transaction["result_desc"] else 
+                  "Payment completed" if transaction["status"] == "completed" else "Payment failed"
+    }
+
+def pending_status_response():
+    """Response for a transaction still waiting on the customer"""
+    return {
+        "status": "pending",
+        "message": "Payment is being processed"
+    }
+
+def interpret_stk_query_result(result):
+    """Map an STK Push query response to (new status or None, response for the client)"""
+    if "ResultCode" not in result:
+        return None, pending_status_response()
+    
+    if result["ResultCode"] == "0":
+        return "completed", {
+            "success": True,
+            "status": "completed",
+            "message": "Payment completed successfully"
+        }
+    
+    return "failed", {
+        "success": False,
+        "status": "failed",
+        "message": result.get("ResultDesc", "Payment failed")
+    }
+
+def fetch_access_token():
+    """Request a new OAuth access token from M-Pesa (the whole response)"""
+    url = OAUTH_URL
+    headers = oauth_headers()
     
     try:
-        response = requests.get(url, headers=headers)
-        response_data = response.json()
+        response = daraja.get(url, headers=headers)
+        response_data = json_body(response)
         
         if "access_token" in response_data:
-            return response_data["access_token"]
+            return response_data
         else:
             print("Error getting access token:", response_data)
             return None
@@ -35,6 +200,15 @@ def get_access_token():
         print(f"Exception while getting access token: {e}")
         return None
 
+# Keep-alive connections to Safaricom shared by every call (daraja_client.py)
+daraja = DarajaClient()
+# One token is shared by every request until it is about to expire
+access_tokens = TokenManager(fetch_access_token)
+
+def get_access_token():
+    """Get OAuth access token from M-Pesa (cached, see mpesa_token.py)"""
+    return access_tokens.get()
+
 def generate_password():
     """Generate password for M-Pesa STK Push"""
     timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
@@ -48,19 +222,10 @@ def initiate_stk_push(phone_number, amount, account_reference, order_type, order
     if not access_token:
         return {"error": "Failed to get access token"}
     
-    password, timestamp = generate_password()
+    phone_number = format_phone_number(phone_number)
     
-    # Format phone number
-    if phone_number.startswith('+'):
-        phone_number = phone_number[1:]
-    if phone_number.startswith('0'):
-        phone_number = '254' + phone_number[1:]
-    
-    url = f"{API_BASE_URL}/mpesa/stkpush/v1/processrequest"
-    headers = {
-        "Authorization": f"Bearer {access_token}",
-        "Content-Type": "application/json"
-    }
+    url = STK_PUSH_URL
+    headers = bearer_headers(access_token)
     
     # Ensure amount is an integer (M-Pesa requires integer values)
     try:
@@ -68,23 +233,13 @@ def initiate_stk_push(phone_number, amount, account_reference, order_type, order
     except (ValueError, TypeError):
         return {"error": "Invalid amount format. Must be a number."}
     
-    payload = {
-        "BusinessShortCode": BUSINESS_SHORT_CODE,
-        "Password": password,
-        "Timestamp": timestamp,
-        "TransactionType": "CustomerPayBillOnline",
-        "Amount": amount_int,
-        "PartyA": phone_number.replace("+", ""),  # Remove any + character
-        "PartyB": BUSINESS_SHORT_CODE,
-        "PhoneNumber": phone_number.replace("+", ""),  # Remove any + character
-        "CallBackURL": CALLBACK_URL,
-        "AccountReference": account_reference,
-        "TransactionDesc": f"Payment for {order_type} #{order_id}"
-    }
+    payload = build_stk_push_payload(phone_number, amount_int, account_reference, order_type, order_id)
     
     try:
-        response = requests.post(url, json=payload, headers=headers)
-        result = response.json()
+        response = daraja.post(url, json=payload, headers=headers)
+        if response.status_code == 401:
+            access_tokens.invalidate(access_token)
+        result = json_body(response)
         print(f"STK Push result: {result}")
         
         if "ResponseCode" in result and result["ResponseCode"] == "0":
@@ -96,43 +251,13 @@ def initiate_stk_push(phone_number, amount, account_reference, order_type, order
             cursor = connection.cursor()
             
             try:
-                # For artwork orders
-                if order_type == 'artwork':
-                    query = """
-                    INSERT INTO artwork_orders (user_id, artwork_id, amount, delivery_fee, delivery_address, status)
-                    VALUES (%s, %s, %s, %s, %s, 'pending')
-                    """
-                    cursor.execute(query, (
-                        user_id,
-                        order_id,
-                        amount * 0.9,  # 90% of amount for artwork
-                        amount * 0.1,  # 10% for delivery
-                        "To be provided"  # Default address
-                    ))
-                    order_id = cursor.lastrowid
-                
-                # For exhibition bookings
-                elif order_type == 'exhibition':
-                    query = """
-                    INSERT INTO exhibition_bookings (user_id, exhibition_id, slots, amount, status)
-                    VALUES (%s, %s, %s, %s, 'pending')
-                    """
-                    cursor.execute(query, (
-                        user_id,
-                        order_id,
-                        int(amount / (amount / 1)),  # Calculate slots
-                        amount,
-                        "pending"
-                    ))
+                insert = order_insert(order_type, order_id, user_id, amount)
+                if insert:
+                    cursor.execute(*insert)
                     order_id = cursor.lastrowid
                 
                 # Save transaction details
-                query = """
-                INSERT INTO mpesa_transactions 
-                (order_type, order_id, user_id, amount, phone_number, merchant_request_id, checkout_request_id, status)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, 'pending')
-                """
-                cursor.execute(query, (
+                cursor.execute(INSERT_TRANSACTION_SQL, (
                     order_type,
                     order_id,
                     user_id,
@@ -168,7 +293,153 @@ def initiate_stk_push(phone_number, amount, account_reference, order_type, order
         return {"error": str(e)}
 
 def check_transaction_status(checkout_request_id):
-    """Check status of an STK Push transaction"""
+    """Check status of an STK Push transaction
+
+    Answered from the database only. A transaction that has been pending for
+    a while is handed to the reconciler, which queries Safaricom for it once
+    however many clients are polling.
+    """
+    transaction = get_stored_transaction(checkout_request_id)
+    if transaction is None:
+        return {"error": "Transaction not found"}
+    if "error" in transaction:
+        return transaction
+    if transaction["status"] != "pending":
+        return stored_status_response(transaction)
+    request_reconciliation(transaction)
+    return pending_status_response()
+
+def request_reconciliation(transaction):
+    """Queue a pending transaction for an STK query if its callback is overdue"""
+    created_at = transaction.get("created_at")
+    if created_at is None or (datetime.now() - created_at).total_seconds() >= reconciler.min_age:
+        reconciler.request(transaction["checkout_request_id"])
+
+# Daraja's answer to an STK query for a payment the customer has not finished
+STK_QUERY_PENDING_ERROR = "500.001.1001"
+
+def query_stk_status(checkout_request_id):
+    """Ask Safaricom for a pending transaction's result and settle it (reconciler)
+
+    Returns "completed" or "failed", or None when Safaricom reports the
+    payment as still in progress. Raises if Safaricom could not be asked or
+    gave any other answer, so the caller can tell "still pending" from
+    "unknown".
+    """
+    access_token = get_access_token()
+    if not access_token:
+        raise RuntimeError("Failed to get access token for STK query")
+    
+    # The query only reads the payment's state, so it may be retried
+    response = daraja.post(STK_QUERY_URL, json=build_stk_query_payload(checkout_request_id),
+                           headers=bearer_headers(access_token), idempotent=True)
+    if response.status_code == 401:
+        access_tokens.invalidate(access_token)
+    result = json_body(response)
+    print(f"Transaction status query result: {result}")
+    
+    status, _ = interpret_stk_query_result(result)
+    if status is None and result.get("errorCode") != STK_QUERY_PENDING_ERROR:
+        raise RuntimeError(f"STK query gave no result: {result}")
+    if status:
+        settle_transaction(checkout_request_id, status, result.get("ResultCode"), result.get("ResultDesc"))
+    return status
+
+def expire_transaction(checkout_request_id):
+    """Fail a transaction that stayed pending past MPESA_PENDING_EXPIRY (reconciler)"""
+    print(f"Expiring pending transaction {checkout_request_id}")
+    return settle_transaction(checkout_request_id, "failed", None, "Payment request expired")
+
+# Payments that need someone to refund or reconcile them by hand
+payment_alerts = {"paid_not_pending": 0, "paid_no_slots": 0}
+payment_alerts_lock = threading.Lock()
+
+def alert_payment(kind, message):
+    """Log a payment problem for the operators and count it (shown on /metrics)"""
+    with payment_alerts_lock:
+        payment_alerts[kind] += 1
+    print(f"ALERT: {message}")
+
+def settle_transaction(checkout_request_id, status, result_code=None, result_desc=None):
+    """Record a transaction's final status and update its order, in one database transaction
+
+    A completed payment for a booking whose slots are no longer available
+    settles as failed, and is alerted on for a refund. Returns False if the
+    transaction was not pending (already settled by the callback, the
+    reconciler or expiry) or could not be updated.
+    """
+    connection = get_db_connection()
+    if not connection:
+        return False
+    
+    cursor = connection.cursor()
+    
+    try:
+        cursor.execute(SETTLE_TRANSACTION_SQL, {
+            "status": status,
+            "result_code": result_code,
+            "result_desc": result_desc,
+            "checkout_request_id": checkout_request_id
+        })
+        if cursor.rowcount == 0 and status == "completed":
+            # Either not pending any more, or the booking's slots are gone
+            cursor.execute(SETTLE_TRANSACTION_SQL, {
+                "status": "failed",
+                "result_code": result_code,
+                "result_desc": NO_SLOTS_RESULT_DESC,
+                "checkout_request_id": checkout_request_id
+            })
+            if cursor.rowcount:
+                status, result_desc = "failed", NO_SLOTS_RESULT_DESC
+                alert_payment("paid_no_slots", f"payment {checkout_request_id} completed but its "
+                              "booking has no slots left; the order was failed and needs a refund")
+        if cursor.rowcount == 0:
+            connection.rollback()
+            if status == "completed":
+                report_late_payment(checkout_request_id)
+            return False
+        order_type = exhibition_id = slots = None
+        if status == "completed":
+            cursor.execute(SELECT_SETTLED_ORDER_SQL, (checkout_request_id,))
+            order_type, exhibition_id, slots = cursor.fetchone()
+        connection.commit()
+    except Error as e:
+        print(f"Error settling transaction {checkout_request_id}: {e}")
+        connection.rollback()
+        return False
+    finally:
+        cursor.close()
+        connection.close()
+    
+    if status == "completed":
+        if order_type == "artwork":
+            invalidate_artwork_cache()
+        elif exhibition_id is not None:
+            # Patch the cached listings rather than reloading them
+            apply_slot_delta(exhibition_id, -slots)
+    
+    # Wake up status requests waiting on this payment
+    publish_transaction_status(checkout_request_id, status, result_desc)
+    return True
+
+def report_late_payment(checkout_request_id):
+    """Alert on a successful payment for a transaction that is no longer pending"""
+    transaction = get_stored_transaction(checkout_request_id)
+    if transaction is None:
+        alert_payment("paid_not_pending", f"payment {checkout_request_id} completed for an unknown transaction")
+    elif "error" in transaction:
+        print(f"Could not check settled transaction {checkout_request_id}: {transaction['error']}")
+    elif transaction["status"] == "completed":
+        print(f"Transaction {checkout_request_id} already completed, ignoring repeated result")
+    else:
+        alert_payment("paid_not_pending", f"payment {checkout_request_id} completed after the "
+                      f"transaction was marked {transaction['status']}; it needs a refund or manual settlement")
+
+# Queries Safaricom for payments whose callback is overdue (mpesa_reconciler.py)
+reconciler = Reconciler(query_stk_status, expire_transaction)
+
+def get_stored_transaction(checkout_request_id):
+    """The transaction row as a dict, None if there is none, or {"error": ...}"""
     connection = get_db_connection()
     if not connection:
         return {"error": "Database connection failed"}
@@ -176,103 +447,58 @@ def check_transaction_status(checkout_request_id):
     cursor = connection.cursor()
     
     try:
-        # Check if transaction exists in database
-        query = """
-        SELECT * FROM mpesa_transactions 
-        WHERE checkout_request_id = %s
-        """
-        cursor.execute(query, (checkout_request_id,))
+        cursor.execute(SELECT_TRANSACTION_SQL, (checkout_request_id,))
         row = cursor.fetchone()
-        
-        if not row:
-            return {"error": "Transaction not found"}
-        
-        transaction = dict_from_row(row, cursor)
-        
-        # If transaction is still pending, check status from M-Pesa
-        if transaction["status"] == "pending":
-            access_token = get_access_token()
-            if not access_token:
-                return {"error": "Failed to get access token"}
-            
-            password, timestamp = generate_password()
-            
-            url = f"{API_BASE_URL}/mpesa/stkpushquery/v1/query"
-            headers = {
-                "Authorization": f"Bearer {access_token}",
-                "Content-Type": "application/json"
-            }
-            
-            payload = {
-                "BusinessShortCode": BUSINESS_SHORT_CODE,
-                "Password": password,
-                "Timestamp": timestamp,
-                "CheckoutRequestID": checkout_request_id
-            }
-            
-            try:
-                response = requests.post(url, json=payload, headers=headers)
-                result = response.json()
-                print(f"Transaction status query result: {result}")
-                
-                if "ResultCode" in result:
-                    if result["ResultCode"] == "0":
-                        # Update transaction status to completed
-                        update_transaction_status(
-                            checkout_request_id,
-                            "completed",
-                            result.get("ResultCode"),
-                            result.get("ResultDesc")
-                        )
-                        
-                        # Update order status
-                        update_order_status(
-                            transaction["order_type"],
-                            transaction["order_id"],
-                            "completed"
-                        )
-                        
-                        return {
-                            "success": True,
-                            "status": "completed",
-                            "message": "Payment completed successfully"
-                        }
-                    else:
-                        # Update transaction status to failed
-                        update_transaction_status(
-                            checkout_request_id,
-                            "failed",
-                            result.get("ResultCode"),
-                            result.get("ResultDesc")
-                        )
-                        
-                        return {
-                            "success": False,
-                            "status": "failed",
-                            "message": result.get("ResultDesc", "Payment failed")
-                        }
-                else:
-                    return {
-                        "status": "pending",
-                        "message": "Payment is being processed"
-                    }
-            except Exception as e:
-                print(f"Exception during status check: {e}")
-                return {"error": str(e)}
-        else:
-            # Return status from database
-            return {
-                "status": transaction["status"],
-                "message": transaction["result_desc"] if transaction["result_desc"] else 
-                          "Payment completed" if transaction["status"] == "completed" else "Payment failed"
-            }
-    except Exception as e:
-        print(f"Error checking transaction: {e}")
+        return dict_from_row(row, cursor) if row else None
+    except Error as e:
+        print(f"Error reading transaction: {e}")
         return {"error": str(e)}
     finally:
-        if connection.is_connected():
-            cursor.close()
-            connection.close()
+        cursor.close()
+        connection.close()
+
+def publish_transaction_status(checkout_request_id, status, result_desc=None):
+    """Send a transaction's final status to the requests waiting on it"""
+    payment_events.publish(checkout_request_id, stored_status_response({
+        "status": status,
+        "result_desc": result_desc
+    }))
+
+def wait_for_transaction_status(checkout_request_id, timeout):
+    """Hold a status request until the payment completes or fails
+
+    Returns as soon as the callback for the transaction is handled in this
+    process, and re-reads the transaction from the database every
+    PAYMENT_WAIT_RECHECK seconds in case it was handled by another worker.
+    Never queries Safaricom. After `timeout` seconds the transaction is
+    reported as pending, and the client asks again. When every wait slot is
+    taken (see payment_events.py) the current status is returned at once,
+    so waiting requests cannot occupy all of the server's threads.
+    """
+    waiting = payment_events.acquire_wait_slot()
+    if not waiting:
+        timeout = 0
+    deadline = time.monotonic() + timeout
+    try:
+        # Subscribe before reading, so a callback that lands in between is not missed
+        with Waiter(payment_events, checkout_request_id) as waiter:
+            while True:
+                transaction = get_stored_transaction(checkout_request_id)
+                if transaction is None:
+                    return {"error": "Transaction not found"}
+                if "error" in transaction:
+                    return transaction
+                if transaction["status"] != "pending":
+                    return stored_status_response(transaction)
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return pending_status_response()
+                result = waiter.wait(min(remaining, PAYMENT_WAIT_RECHECK))
+                if result is not None:
+                    return result
+    finally:
+        if waiting:
+            payment_events.release_wait_slot()
 
 def save_transaction_request(checkout_request_id, merchant_request_id, order_type, order_id, user_id, amount, phone_number):
     """Save M-Pesa transaction request to database"""
@@ -307,89 +533,6 @@ def save_transaction_request(checkout_request_id, merchant_request_id, order_typ
             cursor.close()
             connection.close()
 
-def update_transaction_status(checkout_request_id, status, result_code=None, result_desc=None):
-    """Update M-Pesa transaction status in database"""
-    connection = get_db_connection()
-    if not connection:
-        return False
-    
-    cursor = connection.cursor()
-    
-    try:
-        query = """
-        UPDATE mpesa_transactions
-        SET status = %s, result_code = %s, result_desc = %s
-        WHERE checkout_request_id = %s
-        """
-        cursor.execute(query, (status, result_code, result_desc, checkout_request_id))
-        connection.commit()
-        return True
-    except Error as e:
-        print(f"Error updating transaction: {e}")
-        return False
-    finally:
-        if connection.is_connected():
-            cursor.close()
-            connection.close()
-
-def update_order_status(order_type, order_id, payment_status):
-    """Update order payment status in database"""
-    connection = get_db_connection()
-    if not connection:
-        return False
-    
-    cursor = connection.cursor()
-    
-    try:
-        if order_type == "artwork":
-            query = """
-            UPDATE artwork_orders
-            SET payment_status = %s
-            WHERE id = %s
-            """
-        elif order_type == "exhibition":
-            query = """
-            UPDATE exhibition_bookings
-            SET payment_status = %s
-            WHERE id = %s
-            """
-        else:
-            return False
-        
-        cursor.execute(query, (payment_status, order_id))
-        connection.commit()
-        
-        # If it's an artwork order and payment is completed, update artwork status
-        if order_type == "artwork" and payment_status == "completed":
-            query = """
-            UPDATE artworks a
-            JOIN artwork_orders o ON a.id = o.artwork_id
-            SET a.status = 'sold'
-            WHERE o.id = %s
-            """
-            cursor.execute(query, (order_id,))
-            connection.commit()
-        
-        # If it's an exhibition booking and payment is completed, update available slots
-        if order_type == "exhibition" and payment_status == "completed":
-            query = """
-            UPDATE exhibitions e
-            JOIN exhibition_bookings b ON e.id = b.exhibition_id
-            SET e.available_slots = e.available_slots - b.slots
-            WHERE b.id = %s
-            """
-            cursor.execute(query, (order_id,))
-            connection.commit()
-        
-        return True
-    except Error as e:
-        print(f"Error updating order: {e}")
-        return False
-    finally:
-        if connection.is_connected():
-            cursor.close()
-            connection.close()
-
 def handle_mpesa_callback(callback_data):
     """Handle M-Pesa callback data"""
     try:
@@ -407,47 +550,23 @@ def handle_mpesa_callback(callback_data):
             # Payment failed
             status = "failed"
         
-        # Update transaction status
-        success = update_transaction_status(checkout_request_id, status, result_code, result_desc)
-        
-        if success:
-            # Get transaction details
-            connection = get_db_connection()
-            if not connection:
-                return {"error": "Database connection failed"}
-            
-            cursor = connection.cursor()
-            
-            try:
-                query = """
-                SELECT order_type, order_id FROM mpesa_transactions 
-                WHERE checkout_request_id = %s
-                """
-                cursor.execute(query, (checkout_request_id,))
-                row = cursor.fetchone()
-                
-                if row:
-                    order_type = row[0]
-                    order_id = row[1]
-                    
-                    # Update order status
-                    update_order_status(order_type, order_id, status)
-            finally:
-                if connection.is_connected():
-                    cursor.close()
-                    connection.close()
+        if not settle_transaction(checkout_request_id, status, result_code, result_desc):
+            print(f"Callback for transaction {checkout_request_id} did not settle it")
         
         return {"success": True}
     except Exception as e:
         print(f"Error handling M-Pesa callback: {e}")
         return {"error": str(e)}
 
+def missing_stk_push_fields(request_data):
+    """Return the required STK Push fields absent from a request"""
+    required_fields = ["phoneNumber", "amount", "orderType", "orderId", "userId", "accountReference"]
+    return [field for field in required_fields if field not in request_data or not request_data.get(field)]
+
 def handle_stk_push_request(request_data):
     """Handle STK Push request from frontend"""
     try:
-        # Extract all required fields from request data
-        required_fields = ["phoneNumber", "amount", "orderType", "orderId", "userId", "accountReference"]
-        missing_fields = [field for field in required_fields if field not in request_data or not request_data.get(field)]
+        missing_fields = missing_stk_push_fields(request_data)
         
         if missing_fields:
             return {"error": f"Missing required fields: {', '.join(missing_fields)}"}
@@ -508,46 +627,3 @@ def get_user_orders(user_id):
     finally:
         cursor.close()
         connection.close()
-
-def get_all_admin_orders():
-    """Get all orders and tickets for admin dashboard"""
-    connection = get_db_connection()
-    if not connection:
-        return {"error": "Database connection failed"}
-    
-    cursor = connection.cursor()
-    try:
-        # Get all artwork orders
-        orders_query = """
-        SELECT o.*, u.name as customer_name, u.email as customer_email,
-               a.title as artwork_title, a.artist, a.image_url
-        FROM artwork_orders o
-        JOIN users u ON o.user_id = u.id
-        JOIN artworks a ON o.artwork_id = a.id
-        ORDER BY o.created_at DESC
-        """
-        cursor.execute(orders_query)
-        orders = [dict_from_row(row, cursor) for row in cursor.fetchall()]
-        
-        # Get all exhibition bookings
-        tickets_query = """
-        SELECT b.*, u.name as customer_name, u.email as customer_email,
-               e.title as exhibition_title, e.location, e.image_url
-        FROM exhibition_bookings b
-        JOIN users u ON b.user_id = u.id
-        JOIN exhibitions e ON b.exhibition_id = e.id
-        ORDER BY b.created_at DESC
-        """
-        cursor.execute(tickets_query)
-        tickets = [dict_from_row(row, cursor) for row in cursor.fetchall()]
-        
-        return {
-            "orders": orders,
-            "tickets": tickets
-        }
-    except Exception as e:
-        print(f"Error getting admin orders: {e}")
-        return {"error": str(e)}
-    finally:
-        cursor.close()
-        connection.close()
@@ -0,0 +1,253 @@
+# Asyncio versions of the M-Pesa STK Push handlers, used by async_server.py.
+# Daraja calls go through aiohttp and the database through aiomysql, so a slow
+# STK push holds a coroutine instead of a thread. Status checks only read the
+# database; overdue payments are queried by the reconciler (mpesa_reconciler.py).
+# Requires: pip install aiohttp aiomysql
+import asyncio
+import time
+
+from database import DB_CONFIG
+from mpesa import (OAUTH_URL, STK_PUSH_URL, INSERT_TRANSACTION_SQL, SELECT_TRANSACTION_SQL,
+                   oauth_headers, bearer_headers, format_phone_number, build_stk_push_payload,
+                   order_insert, stored_status_response, pending_status_response, request_reconciliation,
+                   missing_stk_push_fields, access_tokens, daraja)
+from payment_events import payment_events, PAYMENT_WAIT_RECHECK
+from daraja_client import (MPESA_CONNECT_TIMEOUT, MPESA_READ_TIMEOUT, MPESA_POOL_SIZE, MPESA_RETRIES,
+                           DarajaUnavailable, backoff_delay, is_server_error)
+
+try:
+    import aiohttp
+    import aiomysql
+except ImportError:
+    aiohttp = None
+    aiomysql = None
+
+DB_POOL_MAX_SIZE = 20
+
+
+def is_available():
+    """True if the async drivers are installed"""
+    return aiohttp is not None and aiomysql is not None
+
+
+class AsyncMpesaClient:
+    """Holds the aiohttp session and aiomysql pool for the async handlers"""
+
+    def __init__(self):
+        self.session = None
+        self.db_pool = None
+
+    async def start(self):
+        # Same connection limit and timeouts as the threaded client (daraja_client.py)
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit_per_host=MPESA_POOL_SIZE),
+            timeout=aiohttp.ClientTimeout(sock_connect=MPESA_CONNECT_TIMEOUT, sock_read=MPESA_READ_TIMEOUT),
+        )
+        self.db_pool = await aiomysql.create_pool(
+            host=DB_CONFIG['host'],
+            user=DB_CONFIG['user'],
+            password=DB_CONFIG['password'],
+            db=DB_CONFIG['database'],
+            minsize=1,
+            maxsize=DB_POOL_MAX_SIZE,
+            # Reads see the latest committed rows (a pooled connection left in
+            # an open transaction would keep reading its old snapshot); writes
+            # open their own transaction with begin()
+            autocommit=True,
+        )
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+        if self.db_pool is not None:
+            self.db_pool.close()
+            await self.db_pool.wait_closed()
+
+    async def get_access_token(self):
+        """Get OAuth access token from M-Pesa
+
+        Shares the cached token with the threaded handlers (mpesa.access_tokens).
+        """
+        token = access_tokens.cached()
+        if token is not None:
+            return token
+        if not access_tokens.begin_refresh():
+            # Another coroutine or thread is refreshing; wait for it off the loop
+            return await asyncio.get_running_loop().run_in_executor(None, access_tokens.get)
+        started = time.monotonic()
+        response_data = None
+        try:
+            _, response_data = await self._request('GET', OAUTH_URL, idempotent=True, headers=oauth_headers())
+            if not response_data or "access_token" not in response_data:
+                print("Error getting access token:", response_data)
+        except Exception as e:
+            print(f"Exception while getting access token: {e}")
+        finally:
+            access_tokens.store(response_data, started)
+        return access_tokens.cached()
+
+    async def _request(self, method, url, idempotent=False, **kwargs):
+        """(status, JSON body) of a Daraja call
+
+        Shares the circuit breaker with the threaded client; idempotent calls
+        are retried with the same jittered backoff.
+        """
+        breaker = daraja.breaker
+        attempt = 0
+        while True:
+            if not breaker.allow():
+                raise DarajaUnavailable("M-Pesa API unavailable (circuit open), try again shortly")
+            try:
+                async with self.session.request(method, url, **kwargs) as response:
+                    status = response.status
+                    try:
+                        body = await response.json(content_type=None)
+                    except ValueError:
+                        body = None
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = e
+                retry = idempotent or isinstance(e, aiohttp.ClientConnectorError)
+            else:
+                if not is_server_error(status, body):
+                    breaker.record_success()
+                    return status, body
+                error = None
+                retry = idempotent
+
+            breaker.record_failure()
+            attempt += 1
+            if not retry or attempt > MPESA_RETRIES:
+                if error is not None:
+                    raise error
+                return status, body
+            await asyncio.sleep(backoff_delay(attempt))
+
+    async def _post(self, url, payload, access_token, idempotent=False):
+        status, body = await self._request('POST', url, idempotent=idempotent, json=payload,
+                                           headers=bearer_headers(access_token))
+        if status == 401:
+            access_tokens.invalidate(access_token)
+        return body if body is not None else {}
+
+    async def handle_stk_push_request(self, request_data):
+        """Handle STK Push request from frontend"""
+        missing_fields = missing_stk_push_fields(request_data)
+        if missing_fields:
+            return {"error": f"Missing required fields: {', '.join(missing_fields)}"}
+
+        order_type = request_data.get("orderType")
+        order_id = request_data.get("orderId")
+        user_id = request_data.get("userId")
+        amount = request_data.get("amount")
+
+        try:
+            amount_int = int(float(amount))
+        except (ValueError, TypeError):
+            return {"error": "Invalid amount format. Must be a number."}
+
+        access_token = await self.get_access_token()
+        if not access_token:
+            return {"error": "Failed to get access token"}
+
+        phone_number = format_phone_number(request_data.get("phoneNumber"))
+        payload = build_stk_push_payload(phone_number, amount_int, request_data.get("accountReference"),
+                                         order_type, order_id)
+        try:
+            result = await self._post(STK_PUSH_URL, payload, access_token)
+        except Exception as e:
+            print(f"Exception during STK Push: {e}")
+            return {"error": str(e)}
+        print(f"STK Push result: {result}")
+
+        if result.get("ResponseCode") != "0":
+            return {
+                "error": result.get("errorMessage", "STK Push failed"),
+                "details": result
+            }
+
+        async with self.db_pool.acquire() as connection:
+            async with connection.cursor() as cursor:
+                try:
+                    # The order and its transaction are saved together or not at all
+                    await connection.begin()
+                    insert = order_insert(order_type, order_id, user_id, amount)
+                    if insert:
+                        await cursor.execute(*insert)
+                        order_id = cursor.lastrowid
+                    await cursor.execute(INSERT_TRANSACTION_SQL, (
+                        order_type,
+                        order_id,
+                        user_id,
+                        amount_int,
+                        phone_number,
+                        result["MerchantRequestID"],
+                        result["CheckoutRequestID"]
+                    ))
+                    await connection.commit()
+                except Exception as e:
+                    print(f"Database error: {e}")
+                    await connection.rollback()
+                    return {"error": "Failed to save order details"}
+
+        return {
+            "success": True,
+            "checkoutRequestId": result["CheckoutRequestID"],
+            "merchantRequestId": result["MerchantRequestID"],
+            "orderId": order_id
+        }
+
+    async def check_transaction_status(self, checkout_request_id):
+        """Check status of an STK Push transaction (from the database only, see mpesa.check_transaction_status)"""
+        try:
+            transaction = await self._stored_transaction(checkout_request_id)
+        except Exception as e:
+            print(f"Error checking transaction: {e}")
+            return {"error": str(e)}
+        if not transaction:
+            return {"error": "Transaction not found"}
+        if transaction["status"] != "pending":
+            return stored_status_response(transaction)
+        request_reconciliation(transaction)
+        return pending_status_response()
+
+    async def _stored_transaction(self, checkout_request_id):
+        async with self.db_pool.acquire() as connection:
+            async with connection.cursor(aiomysql.DictCursor) as cursor:
+                await cursor.execute(SELECT_TRANSACTION_SQL, (checkout_request_id,))
+                return await cursor.fetchone()
+
+    async def wait_for_status(self, checkout_request_id, timeout):
+        """Hold a status request until the payment completes or fails
+
+        The coroutine version of mpesa.wait_for_transaction_status: woken by
+        the callback through payment_events, re-reading the database every
+        PAYMENT_WAIT_RECHECK seconds, never querying Safaricom.
+        """
+        loop = asyncio.get_running_loop()
+        published = loop.create_future()
+
+        def deliver(result):
+            # Called from whichever thread handled the callback
+            loop.call_soon_threadsafe(lambda: published.done() or published.set_result(result))
+
+        deadline = loop.time() + timeout
+        payment_events.subscribe(checkout_request_id, deliver)
+        try:
+            while True:
+                transaction = await self._stored_transaction(checkout_request_id)
+                if not transaction:
+                    return {"error": "Transaction not found"}
+                if transaction["status"] != "pending":
+                    return stored_status_response(transaction)
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    return pending_status_response()
+                try:
+                    return await asyncio.wait_for(asyncio.shield(published), min(remaining, PAYMENT_WAIT_RECHECK))
+                except asyncio.TimeoutError:
+                    pass
+        except Exception as e:
+            print(f"Error waiting for transaction: {e}")
+            return {"error": str(e)}
+        finally:
+            payment_events.unsubscribe(checkout_request_id, deliver)
@@ -0,0 +1,261 @@
+# Background reconciliation of pending M-Pesa payments.
+# Payments normally settle when Safaricom's callback arrives. For those whose
+# callback is late or lost, one background thread periodically queries
+# Safaricom for every transaction still pending, at a bounded rate. A
+# transaction pending past MPESA_PENDING_EXPIRY gets one last query and is
+# marked failed only if Safaricom answers that it is still in progress; if
+# the query fails it stays pending and is tried again on the next pass.
+# Status requests only read the database; a request for a transaction that
+# has been pending a while asks the reconciler to query it soon, and any
+# number of such requests for one transaction become a single query.
+#
+# Only one process runs the queries: the reconciler holds a MySQL named lock
+# (GET_LOCK) on its own connection while it leads, so with several workers
+# or hosts the others stay idle, and one takes over if the leader dies.
+import os
+import threading
+import time
+
+import mysql.connector
+from mysql.connector import Error
+
+from database import DB_CONFIG, get_db_connection
+
+# Seconds between passes over the pending transactions (0 disables the reconciler)
+MPESA_RECONCILE_INTERVAL = float(os.environ.get('MPESA_RECONCILE_INTERVAL', '15'))
+# Pending transactions younger than this are left to the callback
+MPESA_RECONCILE_MIN_AGE = float(os.environ.get('MPESA_RECONCILE_MIN_AGE', '30'))
+# Pending transactions older than this are marked failed if a last query finds them still in progress
+MPESA_PENDING_EXPIRY = float(os.environ.get('MPESA_PENDING_EXPIRY', '900'))
+# STK status queries per second, across all workers
+MPESA_QUERY_RATE = float(os.environ.get('MPESA_QUERY_RATE', '2'))
+# Pending transactions read per pass
+MPESA_RECONCILE_BATCH = int(os.environ.get('MPESA_RECONCILE_BATCH', '100'))
+
+LEADER_LOCK_NAME = "afriart_mpesa_reconciler"
+
+# What _call_query returns when no answer was obtained (an error, or stopping)
+QUERY_FAILED = object()
+
+SELECT_PENDING_SQL = """
+SELECT checkout_request_id FROM mpesa_transactions
+WHERE status = 'pending' AND created_at < NOW() - INTERVAL %s SECOND
+ORDER BY created_at
+LIMIT %s
+"""
+
+
+class RateLimiter:
+    """Token bucket: wait() returns once a call is allowed (used by one thread)"""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+
+    def wait(self, stop):
+        """False if `stop` was set while waiting"""
+        while True:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            if stop.wait((1 - self._tokens) / self.rate):
+                return False
+
+
+class Reconciler:
+    """Queries pending transactions in the background
+
+    `query(checkout_request_id)` asks Safaricom for a transaction's state,
+    settles it if it has completed or failed and returns that status (None
+    while Safaricom reports it still in progress). It raises when Safaricom
+    could not be asked or gave no usable answer. `expire(checkout_request_id)`
+    marks one failed. Both are supplied by mpesa.py.
+    """
+
+    def __init__(self, query, expire, interval=MPESA_RECONCILE_INTERVAL, min_age=MPESA_RECONCILE_MIN_AGE,
+                 expiry=MPESA_PENDING_EXPIRY, rate=MPESA_QUERY_RATE, batch_size=MPESA_RECONCILE_BATCH):
+        self.query = query
+        self.expire = expire
+        self.interval = interval
+        self.min_age = min_age
+        self.expiry = expiry
+        self.batch_size = batch_size
+        self.limiter = RateLimiter(rate)
+        self._lock = threading.Lock()
+        self._requested = set()
+        self._last_queried = {}
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._leader_connection = None
+        self._stats = {"passes": 0, "queries": 0, "coalesced": 0, "expired": 0, "errors": 0}
+
+    @property
+    def enabled(self):
+        return self.interval > 0
+
+    def start(self):
+        """Start the background thread (once per process)"""
+        if not self.enabled or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="mpesa-reconciler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        self._release_leadership()
+
+    def request(self, checkout_request_id):
+        """Ask for a transaction to be queried soon (coalesced with other requests)"""
+        if not self.enabled:
+            return
+        with self._lock:
+            if checkout_request_id in self._requested:
+                self._stats["coalesced"] += 1
+                return
+            self._requested.add(checkout_request_id)
+        self._wake.set()
+
+    def _run(self):
+        next_pass = time.monotonic()
+        while not self._stop.is_set():
+            try:
+                if self._is_leader():
+                    self._query_requested()
+                    if time.monotonic() >= next_pass:
+                        self.run_pass()
+                        next_pass = time.monotonic() + self.interval
+                else:
+                    with self._lock:
+                        self._requested.clear()
+                    next_pass = time.monotonic()
+            except Exception as e:
+                self._count("errors")
+                print(f"M-Pesa reconciler error: {e}")
+            timeout = next_pass - time.monotonic()
+            self._wake.wait(timeout if timeout > 0 else self.interval)
+            self._wake.clear()
+
+    def run_pass(self):
+        """Query the pending transactions, expiring stale ones Safaricom has no result for"""
+        self._count("passes")
+        for checkout_request_id in self._pending(self.expiry):
+            if self._stop.is_set():
+                return
+            self._query_stale(checkout_request_id)
+        # Stale ones still pending were just queried, so _query skips them
+        for checkout_request_id in self._pending(self.min_age):
+            if self._stop.is_set():
+                return
+            self._query(checkout_request_id)
+        # Forget transactions that are no longer being queried
+        cutoff = time.monotonic() - self.expiry
+        with self._lock:
+            self._last_queried = {key: at for key, at in self._last_queried.items() if at > cutoff}
+
+    def _query_requested(self):
+        with self._lock:
+            requested = self._requested
+            self._requested = set()
+        for checkout_request_id in requested:
+            if self._stop.is_set():
+                return
+            self._query(checkout_request_id)
+
+    def _query(self, checkout_request_id):
+        # Skip a transaction queried recently (a pass right after a request)
+        last = self._last_queried.get(checkout_request_id)
+        if last is not None and time.monotonic() - last < self.min_age:
+            self._count("coalesced")
+            return
+        self._call_query(checkout_request_id)
+
+    def _query_stale(self, checkout_request_id):
+        """Query a transaction pending past the expiry; fail it if Safaricom says it is still in progress"""
+        if self._call_query(checkout_request_id) is None:
+            # A payment that is still in progress this late is not going to complete
+            self.expire(checkout_request_id)
+            self._count("expired")
+        # QUERY_FAILED: left pending, and queried again on the next pass
+
+    def _call_query(self, checkout_request_id):
+        """Query one transaction at the rate limit; its new status, None if still pending, or QUERY_FAILED"""
+        if not self.limiter.wait(self._stop):
+            return QUERY_FAILED
+        self._last_queried[checkout_request_id] = time.monotonic()
+        self._count("queries")
+        try:
+            return self.query(checkout_request_id)
+        except Exception as e:
+            self._count("errors")
+            print(f"Error reconciling transaction {checkout_request_id}: {e}")
+            return QUERY_FAILED
+
+    def _pending(self, older_than):
+        connection = get_db_connection()
+        if connection is None:
+            return []
+        cursor = connection.cursor()
+        try:
+            cursor.execute(SELECT_PENDING_SQL, (int(older_than), self.batch_size))
+            return [row[0] for row in cursor.fetchall()]
+        finally:
+            cursor.close()
+            connection.close()
+
+    def _is_leader(self):
+        """Hold (or try to take) the leader lock; it lives as long as its connection"""
+        connection = self._leader_connection
+        if connection is not None:
+            try:
+                connection.ping(reconnect=False)
+                return True
+            except Error:
+                # The lock went with the connection
+                self._release_leadership()
+        try:
+            connection = mysql.connector.connect(**DB_CONFIG)
+            cursor = connection.cursor()
+            cursor.execute("SELECT GET_LOCK(%s, 0)", (LEADER_LOCK_NAME,))
+            acquired = cursor.fetchone()[0] == 1
+            cursor.close()
+        except Error as e:
+            print(f"M-Pesa reconciler could not check leadership: {e}")
+            return False
+        if not acquired:
+            connection.close()
+            return False
+        print(f"M-Pesa reconciler leading in process {os.getpid()}")
+        self._leader_connection = connection
+        return True
+
+    def _release_leadership(self):
+        connection = self._leader_connection
+        self._leader_connection = None
+        if connection is not None:
+            try:
+                connection.close()
+            except Error:
+                pass
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["requested"] = len(self._requested)
+        stats["enabled"] = self.enabled
+        stats["leader"] = self._leader_connection is not None
+        return stats
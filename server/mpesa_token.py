@@ -0,0 +1,152 @@
+# Cached M-Pesa OAuth access token.
+# Daraja tokens are valid for about an hour (`expires_in`), so one token is
+# shared by every STK push and status query in the process instead of
+# fetching a new one before each call.
+import os
+import threading
+import time
+
+# Seconds before expiry at which the token is refreshed in the background;
+# requests keep using the current token meanwhile
+MPESA_TOKEN_REFRESH_AHEAD = float(os.environ.get('MPESA_TOKEN_REFRESH_AHEAD', '300'))
+# A token this close to expiry is not handed out at all
+MPESA_TOKEN_EXPIRY_MARGIN = float(os.environ.get('MPESA_TOKEN_EXPIRY_MARGIN', '30'))
+# Used when the OAuth response has no usable expires_in
+DEFAULT_EXPIRES_IN = 3599
+# Longest a request waits for another thread's refresh
+REFRESH_WAIT_TIMEOUT = 30
+
+
+class TokenManager:
+    """Caches the token returned by `fetch()` until shortly before it expires
+
+    `fetch()` returns the OAuth response as a dict (access_token,
+    expires_in) or None on failure. Refreshes are single-flight: when the
+    token is missing or expired, one caller fetches a new one and the others
+    wait for it (and share its failure, rather than each trying again). Once
+    the token is within `refresh_ahead` seconds of expiry it is refreshed by
+    a background thread while callers keep using it.
+    """
+
+    def __init__(self, fetch, refresh_ahead=MPESA_TOKEN_REFRESH_AHEAD, expiry_margin=MPESA_TOKEN_EXPIRY_MARGIN):
+        self.fetch = fetch
+        self.refresh_ahead = refresh_ahead
+        self.expiry_margin = expiry_margin
+        self._token = None
+        self._expires_at = 0.0
+        self._refreshing = False
+        self._lock = threading.Lock()
+        self._refreshed = threading.Condition(self._lock)
+        self._stats = {
+            "hits": 0,
+            "waits": 0,
+            "refreshes": 0,
+            "background_refreshes": 0,
+            "failures": 0,
+            "invalidations": 0,
+            "refresh_time_total": 0.0,
+            "refresh_time_max": 0.0,
+            "refresh_time_last": 0.0,
+        }
+
+    def _usable(self, now):
+        return self._token is not None and now < self._expires_at - self.expiry_margin
+
+    def cached(self):
+        """The current token, or None if a refresh is needed first
+
+        Starts a background refresh when the token is close to expiry.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if not self._usable(now):
+                return None
+            self._stats["hits"] += 1
+            if now >= self._expires_at - self.refresh_ahead and not self._refreshing:
+                self._refreshing = True
+                self._stats["background_refreshes"] += 1
+                threading.Thread(target=self._refresh, name="mpesa-token-refresh", daemon=True).start()
+            return self._token
+
+    def get(self):
+        """A valid access token, or None if it could not be obtained"""
+        token = self.cached()
+        if token is not None:
+            return token
+        with self._lock:
+            if self._refreshing:
+                # Another thread is already fetching one
+                self._stats["waits"] += 1
+                deadline = time.monotonic() + REFRESH_WAIT_TIMEOUT
+                while self._refreshing and time.monotonic() < deadline:
+                    self._refreshed.wait(deadline - time.monotonic())
+                return self._token if self._usable(time.monotonic()) else None
+            if self._usable(time.monotonic()):
+                return self._token
+            self._refreshing = True
+        self._refresh()
+        with self._lock:
+            return self._token if self._usable(time.monotonic()) else None
+
+    def _refresh(self):
+        started = time.monotonic()
+        try:
+            response = self.fetch()
+        except Exception as e:
+            print(f"Exception while refreshing M-Pesa access token: {e}")
+            response = None
+        self.store(response, started)
+
+    def store(self, response, started):
+        """Record the OAuth response of a refresh that began at `started`
+
+        (time.monotonic()); also used by the asyncio client, which fetches
+        tokens itself.
+        """
+        latency = time.monotonic() - started
+        with self._lock:
+            self._refreshing = False
+            self._stats["refreshes"] += 1
+            self._stats["refresh_time_total"] += latency
+            self._stats["refresh_time_last"] = latency
+            self._stats["refresh_time_max"] = max(self._stats["refresh_time_max"], latency)
+            if isinstance(response, dict) and response.get("access_token"):
+                self._token = response["access_token"]
+                self._expires_at = started + _expires_in(response)
+            else:
+                self._stats["failures"] += 1
+            self._refreshed.notify_all()
+
+    def begin_refresh(self):
+        """Claim the refresh for a caller that fetches the token itself
+
+        Returns False if a refresh is already in flight.
+        """
+        with self._lock:
+            if self._refreshing:
+                return False
+            self._refreshing = True
+            return True
+
+    def invalidate(self, token):
+        """Drop `token` after Safaricom rejected it, so the next call fetches a new one"""
+        with self._lock:
+            if token is not None and token == self._token:
+                self._token = None
+                self._stats["invalidations"] += 1
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            stats = dict(self._stats)
+            stats["valid"] = self._usable(now)
+            stats["expires_in"] = max(0.0, self._expires_at - now) if self._token is not None else 0.0
+        stats["refresh_time_avg"] = stats["refresh_time_total"] / (stats["refreshes"] or 1)
+        return stats
+
+
+def _expires_in(response):
+    try:
+        return float(response.get("expires_in", DEFAULT_EXPIRES_IN))
+    except (TypeError, ValueError):
+        return DEFAULT_EXPIRES_IN
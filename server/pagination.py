@@ -0,0 +1,250 @@
+# Keyset (cursor) pagination and filtering for list endpoints.
+#
+#   GET /artworks?limit=20&status=available&min_price=100
+#   -> {"artworks": [...20 rows...], "nextCursor": "WyIyMDI1LTA..."}
+#   GET /artworks?limit=20&status=available&min_price=100&cursor=WyIyMDI1LTA...
+#
+# A cursor holds the sort value and id of the last row on the page, and the
+# next page starts after it with
+#   WHERE (sort_col < %s OR (sort_col = %s AND id < %s)) ORDER BY sort_col DESC, id DESC
+# so every page is an index range scan, however deep the client pages, and
+# rows inserted meanwhile do not shift the pages.
+import base64
+import binascii
+import datetime
+import math
+import os
+
+from serializer import dumps_bytes, loads
+
+DEFAULT_PAGE_SIZE = int(os.environ.get('PAGE_SIZE', '20'))
+# Larger limits are reduced to this
+MAX_PAGE_SIZE = int(os.environ.get('MAX_PAGE_SIZE', '100'))
+
+PAGING_PARAMS = ('limit', 'cursor', 'sort', 'order')
+
+
+class QueryError(Exception):
+    """Invalid query parameters; the message is safe to return to the client"""
+
+
+def encode_cursor(values):
+    """Opaque URL-safe token for the sort key of a row"""
+    return base64.urlsafe_b64encode(dumps_bytes(values)).rstrip(b'=').decode('ascii')
+
+
+def decode_cursor(token):
+    """Sort key from a cursor token; raises QueryError if it is not one of ours"""
+    try:
+        values = loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+    except (binascii.Error, ValueError):
+        raise QueryError("Invalid cursor")
+    if (not isinstance(values, list) or len(values) != 2 or not isinstance(values[1], int)
+            or not isinstance(values[0], (str, int, float))):
+        raise QueryError("Invalid cursor")
+    return values
+
+
+def _cursor_value(value):
+    # MySQL compares DATE/TIMESTAMP columns with these strings
+    if isinstance(value, datetime.datetime):
+        return value.isoformat(' ')
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    return value
+
+
+def to_date(param, value):
+    """Filter converter for date (or date and time) parameters, e.g. 2025-01-31"""
+    try:
+        return datetime.datetime.fromisoformat(value).isoformat(' ')
+    except ValueError:
+        raise QueryError(f"{param} must be a date (YYYY-MM-DD)")
+
+
+def to_int(param, value):
+    """Filter converter for id parameters"""
+    try:
+        return int(value)
+    except ValueError:
+        raise QueryError(f"{param} must be an integer")
+
+
+def to_number(param, value):
+    """Filter converter for numeric parameters (finite only: nan and inf are refused)"""
+    try:
+        number = float(value)
+    except ValueError:
+        raise QueryError(f"{param} must be a number")
+    if not math.isfinite(number):
+        raise QueryError(f"{param} must be a number")
+    return number
+
+
+class Filter:
+    """A query parameter that narrows a listing, e.g. Filter('min_price', 'price', '>=', to_number)
+
+    `choices` restricts the accepted values (for ENUM columns).
+    """
+
+    __slots__ = ('param', 'column', 'op', 'convert', 'choices')
+
+    def __init__(self, param, column, op='=', convert=None, choices=None):
+        self.param = param
+        self.column = column
+        self.op = op
+        self.convert = convert
+        self.choices = choices
+
+    def parse(self, value):
+        if self.choices is not None and value not in self.choices:
+            raise QueryError(f"{self.param} must be one of: {', '.join(self.choices)}")
+        if self.convert is not None:
+            return self.convert(self.param, value)
+        return value
+
+
+class ListSpec:
+    """What a list endpoint can be sorted and filtered by
+
+        ARTWORK_LIST = ListSpec('artworks',
+                                sorts={'created_at': 'desc', 'id': 'desc'},
+                                filters=[Filter('artist', 'artist'), ...])
+
+    `sorts` maps each sortable column to its default order; the first is the
+    default sort. Every sort also orders by id, so the sort key is unique.
+    `table` may be a join, with `alias` naming the table whose id and sort
+    columns are used; filter columns are then written with their alias.
+    """
+
+    def __init__(self, table, sorts, filters=(), alias=None):
+        self.table = table
+        self.sorts = dict(sorts)
+        self.default_sort = next(iter(self.sorts))
+        self.filters = list(filters)
+        self.alias = alias
+
+    def params(self):
+        return PAGING_PARAMS + tuple(f.param for f in self.filters)
+
+    def parse(self, params):
+        """PageQuery for a request's query parameters
+
+        Returns None if none of the paging or filter parameters were given,
+        so the endpoint can keep serving its full, unpaginated list.
+        """
+        if not any(name in params for name in self.params()):
+            return None
+        return self._parse(params, paginate=True)
+
+    def export_query(self, params):
+        """PageQuery for every matching row (no limit), for exports"""
+        return self._parse(params, paginate=False)
+
+    def _parse(self, params, paginate):
+        sort = params.get('sort', self.default_sort)
+        if sort not in self.sorts:
+            raise QueryError(f"sort must be one of: {', '.join(self.sorts)}")
+        order = params.get('order', self.sorts[sort]).lower()
+        if order not in ('asc', 'desc'):
+            raise QueryError("order must be asc or desc")
+
+        limit = None
+        if paginate:
+            limit = params.get('limit', DEFAULT_PAGE_SIZE)
+            try:
+                limit = int(limit)
+            except ValueError:
+                raise QueryError("limit must be an integer")
+            if limit < 1:
+                raise QueryError("limit must be at least 1")
+            limit = min(limit, MAX_PAGE_SIZE)
+
+        conditions = tuple(
+            (f.column, f.op, f.parse(params[f.param]))
+            for f in self.filters if f.param in params
+        )
+        after = tuple(decode_cursor(params['cursor'])) if params.get('cursor') else None
+        return PageQuery(self.table, sort, order == 'desc', conditions, after, limit, self.alias)
+
+
+class PageQuery:
+    """One page of a listing: filters, sort order, position and size
+
+    A limit of None selects every row after the cursor.
+    """
+
+    __slots__ = ('table', 'sort', 'descending', 'conditions', 'after', 'limit', 'alias')
+
+    def __init__(self, table, sort, descending, conditions, after, limit, alias=None):
+        self.table = table
+        self.sort = sort
+        self.descending = descending
+        self.conditions = conditions
+        self.after = after
+        self.limit = limit
+        self.alias = alias
+
+    @property
+    def key(self):
+        """Hashable identity of the page, for caching"""
+        return ('page', self.sort, self.descending, self.conditions, self.after, self.limit)
+
+    def sql(self, select):
+        """SELECT statement and arguments for the page
+
+        The sort value and id are selected again as the last two columns, so
+        the cursor can be read from the rows whatever `select` contains.
+        """
+        where = []
+        args = []
+        for column, op, value in self.conditions:
+            where.append(f"{column} {op} %s")
+            args.append(value)
+
+        prefix = f"{self.alias}." if self.alias else ""
+        sort = prefix + self.sort
+        id_column = prefix + "id"
+        direction = 'DESC' if self.descending else 'ASC'
+        compare = '<' if self.descending else '>'
+        if self.after is not None:
+            sort_value, last_id = self.after
+            if self.sort == 'id':
+                where.append(f"{id_column} {compare} %s")
+                args.append(last_id)
+            else:
+                where.append(f"({sort} {compare} %s OR ({sort} = %s AND {id_column} {compare} %s))")
+                args.extend((sort_value, sort_value, last_id))
+
+        query = f"SELECT {select}, {sort} AS _sort_value, {id_column} AS _sort_id FROM {self.table}"
+        if where:
+            query += " WHERE " + " AND ".join(where)
+        query += f" ORDER BY {sort} {direction}, {id_column} {direction}"
+        if self.limit is not None:
+            # One extra row tells whether there is a next page
+            query += " LIMIT %s"
+            args.append(self.limit + 1)
+        return query, tuple(args)
+
+    def page(self, model, cursor, rows):
+        """(response dicts, next cursor or None) for the rows the query returned"""
+        has_more = len(rows) > self.limit
+        rows = rows[:self.limit]
+        # The builder ignores the two trailing sort-key columns
+        build = model.builder(cursor.column_names[:-2])
+        items = [build(row) for row in rows]
+        next_cursor = None
+        if has_more:
+            last = rows[-1]
+            next_cursor = encode_cursor([_cursor_value(last[-2]), last[-1]])
+        return items, next_cursor
+
+    def stream(self, model, cursor, batch_size):
+        """Response dicts for every row the query returns, fetched batch_size rows at a time"""
+        build = model.builder(cursor.column_names[:-2])
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            for row in rows:
+                yield build(row)
@@ -0,0 +1,121 @@
+# In-process notifications of M-Pesa payment results.
+# handle_mpesa_callback publishes the final status of a transaction, keyed by
+# its checkout_request_id; requests waiting on it (POST
+# /mpesa/status/{id}/wait) return as soon as it arrives, without querying
+# Safaricom. Subscriptions are per process: with several workers the callback
+# may land on a different worker than the waiting request, so waiters also
+# re-read the transaction from the database every PAYMENT_WAIT_RECHECK
+# seconds.
+#
+# A waiting request served by a thread holds that thread, so at most
+# PAYMENT_MAX_WAITERS of them wait at once per process; further requests are
+# answered straight away with the current status from the database. The
+# native asyncio route waits in a coroutine and is not limited.
+import os
+import threading
+
+# Longest a status request is held open, and how often it re-reads the database
+PAYMENT_WAIT_TIMEOUT = float(os.environ.get('PAYMENT_WAIT_TIMEOUT', '25'))
+PAYMENT_WAIT_RECHECK = float(os.environ.get('PAYMENT_WAIT_RECHECK', '5'))
+PAYMENT_MAX_WAITERS = int(os.environ.get('PAYMENT_MAX_WAITERS', '4'))
+
+
+class PaymentEvents:
+    """Subscribers per checkout_request_id, each called once with the result"""
+
+    def __init__(self, max_blocking_waiters=PAYMENT_MAX_WAITERS):
+        self._subscribers = {}
+        self._lock = threading.Lock()
+        self.max_blocking_waiters = max_blocking_waiters
+        self._blocking_waiters = 0
+        self.published = 0
+        self.delivered = 0
+        self.waits_refused = 0
+
+    def acquire_wait_slot(self):
+        """Claim one of the slots for a thread that blocks waiting; False if all are taken"""
+        with self._lock:
+            if self._blocking_waiters >= self.max_blocking_waiters:
+                self.waits_refused += 1
+                return False
+            self._blocking_waiters += 1
+            return True
+
+    def release_wait_slot(self):
+        with self._lock:
+            self._blocking_waiters -= 1
+
+    def subscribe(self, key, callback):
+        with self._lock:
+            self._subscribers.setdefault(key, []).append(callback)
+
+    def unsubscribe(self, key, callback):
+        with self._lock:
+            callbacks = self._subscribers.get(key)
+            if callbacks and callback in callbacks:
+                callbacks.remove(callback)
+                if not callbacks:
+                    del self._subscribers[key]
+
+    def publish(self, key, result):
+        """Call every subscriber of `key` with `result`; returns how many there were"""
+        with self._lock:
+            callbacks = self._subscribers.pop(key, [])
+            self.published += 1
+            self.delivered += len(callbacks)
+        for callback in callbacks:
+            try:
+                callback(result)
+            except Exception as e:
+                print(f"Error delivering payment result for {key}: {e}")
+        return len(callbacks)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "waiting": sum(len(callbacks) for callbacks in self._subscribers.values()),
+                "transactions": len(self._subscribers),
+                "published": self.published,
+                "delivered": self.delivered,
+                "blocking_waiters": self._blocking_waiters,
+                "max_blocking_waiters": self.max_blocking_waiters,
+                "waits_refused": self.waits_refused,
+            }
+
+
+class Waiter:
+    """Blocking subscription for one transaction (use in a with block)"""
+
+    def __init__(self, events, key):
+        self.events = events
+        self.key = key
+        self.result = None
+        self._event = threading.Event()
+
+    def _deliver(self, result):
+        self.result = result
+        self._event.set()
+
+    def wait(self, timeout):
+        """The published result, or None if nothing arrived within `timeout`"""
+        self._event.wait(timeout)
+        return self.result
+
+    def __enter__(self):
+        self.events.subscribe(self.key, self._deliver)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.events.unsubscribe(self.key, self._deliver)
+
+
+def wait_timeout(value):
+    """Seconds to hold a status request, from the client's `timeout` (capped)"""
+    try:
+        timeout = float(value)
+    except (TypeError, ValueError):
+        return PAYMENT_WAIT_TIMEOUT
+    return max(0.0, min(timeout, PAYMENT_WAIT_TIMEOUT))
+
+
+payment_events = PaymentEvents()
@@ -0,0 +1,264 @@
+import io
+import queue
+import socket
+import socketserver
+import threading
+
+# Defaults for the worker-pool serving mode
+DEFAULT_THREADS = 16
+DEFAULT_QUEUE_SIZE = 64
+DEFAULT_REQUEST_TIMEOUT = 30.0
+DEFAULT_IDLE_TIMEOUT = 5.0
+# Unread request body bytes discarded so the connection can be reused; a
+# larger leftover closes the connection instead
+MAX_DRAIN_SIZE = 64 * 1024
+
+_OVERLOADED_BODY = b'{"error": "Server is busy, please retry"}'
+OVERLOADED_RESPONSE = (
+    b"HTTP/1.1 503 Service Unavailable\r\n"
+    b"Content-Type: application/json\r\n"
+    b"Content-Length: " + str(len(_OVERLOADED_BODY)).encode() + b"\r\n"
+    b"Retry-After: 1\r\n"
+    b"Access-Control-Allow-Origin: *\r\n"
+    b"Connection: close\r\n"
+    b"\r\n" + _OVERLOADED_BODY
+)
+
+
+class BodyReader:
+    """Wraps rfile while a request is handled, counting the body bytes read"""
+
+    def __init__(self, rfile):
+        self._rfile = rfile
+        self.consumed = 0
+
+    def read(self, size=-1):
+        data = self._rfile.read(size)
+        self.consumed += len(data)
+        return data
+
+    def read1(self, size=-1):
+        data = self._rfile.read1(size)
+        self.consumed += len(data)
+        return data
+
+    def readline(self, size=-1):
+        data = self._rfile.readline(size)
+        self.consumed += len(data)
+        return data
+
+    def readinto(self, buffer):
+        count = self._rfile.readinto(buffer)
+        self.consumed += count or 0
+        return count
+
+    def __getattr__(self, name):
+        return getattr(self._rfile, name)
+
+
+def bodiless_status(status):
+    """True for responses that never carry a body (and so no Content-Length)"""
+    return status is not None and (status < 200 or status in (204, 304))
+
+
+class KeepAliveMixin:
+    """Mixin for BaseHTTPRequestHandler subclasses to support HTTP/1.1 keep-alive
+
+    Keep-alive needs a Content-Length on every response, but the route
+    handlers write their JSON bodies straight to wfile after the headers.
+    While a do_* method runs, headers and body are buffered and sent together
+    with the right Content-Length once the method returns. Handlers that set
+    Content-Length (or Transfer-Encoding) themselves are streamed directly.
+
+    A request body the handler did not read (a GET with a body, a multipart
+    POST) would otherwise be parsed as the next request on the connection,
+    so the rest of it is discarded after the handler returns, or the
+    connection is closed when that is not possible.
+    """
+
+    protocol_version = "HTTP/1.1"
+    request_timeout = DEFAULT_REQUEST_TIMEOUT
+    idle_timeout = DEFAULT_IDLE_TIMEOUT
+
+    _buffering = False
+    _status = None
+
+    def handle_one_request(self):
+        # Wait at most idle_timeout for the next request on this connection
+        self.connection.settimeout(self.idle_timeout)
+        try:
+            super().handle_one_request()
+        except socket.timeout:
+            self.close_connection = True
+
+    def parse_request(self):
+        # Once a request line has arrived, allow request_timeout to finish it
+        self.connection.settimeout(self.request_timeout)
+        return super().parse_request()
+
+    def send_response(self, code, message=None):
+        self._status = code
+        super().send_response(code, message)
+
+    def send_header(self, keyword, value):
+        if self._buffering and keyword.lower() in ('content-length', 'transfer-encoding'):
+            self._length_known = True
+        super().send_header(keyword, value)
+
+    def end_headers(self):
+        if self._buffering and not self._length_known:
+            # Hold the headers until the body length is known
+            self._headers_pending = True
+            return
+        if self._buffering:
+            # The handler streams its own body; stop buffering
+            self._stop_buffering()
+        super().end_headers()
+
+    def _stop_buffering(self):
+        self._buffering = False
+        self.wfile = self._real_wfile
+
+    def _finish_body(self, reader):
+        """Discard what is left of the request body, or mark the connection for closing"""
+        if "chunked" in self.headers.get('Transfer-Encoding', '').lower():
+            # The end of a chunked body is only known by parsing it
+            self.close_connection = True
+            return
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+        except ValueError:
+            self.close_connection = True
+            return
+        remaining = length - reader.consumed
+        if remaining <= 0:
+            return
+        if remaining > MAX_DRAIN_SIZE:
+            self.close_connection = True
+            return
+        try:
+            while remaining > 0:
+                data = self.rfile.read(min(remaining, MAX_DRAIN_SIZE))
+                if not data:
+                    break
+                remaining -= len(data)
+        except OSError:
+            remaining = 1
+        if remaining > 0:
+            self.close_connection = True
+
+    def _buffered(self, method):
+        self._real_wfile = self.wfile
+        self.wfile = io.BytesIO()
+        self._buffering = True
+        self._length_known = False
+        self._headers_pending = False
+        real_rfile = self.rfile
+        reader = self.rfile = BodyReader(real_rfile)
+        try:
+            method()
+        finally:
+            self.rfile = real_rfile
+            self._finish_body(reader)
+            if self._buffering:
+                body = self.wfile.getvalue()
+                self._stop_buffering()
+                if self._headers_pending:
+                    if not bodiless_status(self._status):
+                        super().send_header('Content-Length', str(len(body)))
+                    if self.close_connection:
+                        super().send_header('Connection', 'close')
+                    super().end_headers()
+                    self.wfile.write(body)
+                elif body:
+                    # Body written without headers; nothing sane to frame it with
+                    self.close_connection = True
+                    self.wfile.write(body)
+
+    def do_GET(self):
+        self._buffered(super().do_GET)
+
+    def do_POST(self):
+        self._buffered(super().do_POST)
+
+    def do_PUT(self):
+        self._buffered(super().do_PUT)
+
+    def do_DELETE(self):
+        self._buffered(super().do_DELETE)
+
+    def do_OPTIONS(self):
+        self._buffered(super().do_OPTIONS)
+
+
+class WorkerPoolHTTPServer(socketserver.TCPServer):
+    """TCP server that hands connections to a fixed set of worker threads
+
+    Accepted connections wait in a bounded queue. When the queue is full the
+    connection is answered with 503 straight away instead of spawning another
+    thread, so a burst cannot create an unbounded number of threads (and
+    database connections).
+    """
+
+    allow_reuse_address = True
+    request_queue_size = 128  # listen() backlog
+
+    def __init__(self, server_address, handler_class, threads=DEFAULT_THREADS,
+                 queue_size=DEFAULT_QUEUE_SIZE, bind_and_activate=True):
+        super().__init__(server_address, handler_class, bind_and_activate)
+        self.threads = threads
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._workers = []
+        self.rejected = 0
+        for i in range(threads):
+            worker = threading.Thread(target=self._worker_loop, name=f"http-worker-{i}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def process_request(self, request, client_address):
+        try:
+            self._queue.put_nowait((request, client_address))
+        except queue.Full:
+            self.rejected += 1
+            self._reject(request)
+
+    def _reject(self, request):
+        try:
+            request.settimeout(1.0)
+            request.sendall(OVERLOADED_RESPONSE)
+        except OSError:
+            pass
+        self.shutdown_request(request)
+
+    def _worker_loop(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            request, client_address = item
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+    def server_close(self, timeout=30.0):
+        """Stop accepting, then let the workers drain queued connections"""
+        super().server_close()
+        for _ in self._workers:
+            try:
+                self._queue.put(None, timeout=timeout)
+            except queue.Full:
+                break
+        for worker in self._workers:
+            worker.join(timeout)
+
+    def stats(self):
+        """Return worker pool metrics"""
+        return {
+            "threads": self.threads,
+            "queued": self._queue.qsize(),
+            "queue_size": self._queue.maxsize,
+            "rejected": self.rejected,
+        }
@@ -0,0 +1,228 @@
+import os
+import select
+import signal
+import socket
+import time
+import traceback
+
+# How long a worker gets to finish in-flight requests after SIGTERM
+GRACEFUL_TIMEOUT = 30.0
+# How long a replacement worker gets to report it is serving during a reload
+READY_TIMEOUT = 30.0
+# Environment variable holding the fd a worker writes to once it is serving
+READY_FD_ENV = 'PREFORK_READY_FD'
+# A worker exiting sooner than this after starting counts as a crash loop
+MIN_UPTIME = 2.0
+MAX_RESTART_DELAY = 30.0
+
+
+def reuse_port_supported():
+    """True if this platform can share a port between processes with SO_REUSEPORT"""
+    return hasattr(os, 'fork') and hasattr(socket, 'SO_REUSEPORT')
+
+
+def enable_reuse_port(sock):
+    """Allow several worker processes to bind the same address"""
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+
+
+def notify_ready():
+    """Tell the supervisor this worker is accepting connections (no-op without one)"""
+    fd = os.environ.pop(READY_FD_ENV, None)
+    if fd is None:
+        return
+    try:
+        os.write(int(fd), b"1")
+        os.close(int(fd))
+    except (OSError, ValueError):
+        # The supervisor stopped waiting; nothing to tell it
+        pass
+
+
+class Supervisor:
+    """Pre-fork process supervisor
+
+    Forks `workers` children that each run `run_worker(slot)`, or, when
+    `worker_command` is given, exec the argv list `worker_command(slot)`
+    returns. Every worker binds its own listening socket with SO_REUSEPORT,
+    so the kernel spreads incoming connections across them and no socket is
+    handed over.
+
+    - a worker that exits unexpectedly is replaced (with a growing delay if
+      it keeps crashing straight after start)
+    - SIGHUP does a rolling reload: each worker is replaced one at a time,
+      the old one being sent SIGTERM only after its replacement has called
+      notify_ready(). If a replacement exits or is not ready within
+      READY_TIMEOUT, it is stopped and the reload is abandoned, leaving the
+      remaining old workers running. Exec'd workers are fresh interpreters
+      and load the code currently on disk; forked ones run the code the
+      supervisor loaded at startup.
+    - SIGTERM / SIGINT stop all workers gracefully
+
+    The worker must call notify_ready() once it is accepting connections,
+    and exit once it receives SIGTERM and has finished its in-flight
+    requests.
+    """
+
+    def __init__(self, workers, run_worker=None, graceful_timeout=GRACEFUL_TIMEOUT, worker_command=None):
+        self.worker_count = workers
+        self.run_worker = run_worker
+        self.worker_command = worker_command
+        self.graceful_timeout = graceful_timeout
+        self.workers = {}  # pid -> (slot, started_at)
+        self.restart_delays = {}  # slot -> seconds
+        self._stopping = False
+        self._reload_requested = False
+
+    def _spawn(self, slot, wait_ready=False):
+        """Start a worker; with wait_ready, returns (pid, fd that becomes readable once it is serving)"""
+        ready_read, ready_write = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            # Worker process: the supervisor handles SIGINT/SIGHUP
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            signal.signal(signal.SIGHUP, signal.SIG_IGN)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            os.close(ready_read)
+            os.set_inheritable(ready_write, True)
+            os.environ[READY_FD_ENV] = str(ready_write)
+            exit_code = 0
+            try:
+                if self.worker_command is not None:
+                    argv = self.worker_command(slot)
+                    os.execv(argv[0], argv)
+                self.run_worker(slot)
+            except BaseException:
+                traceback.print_exc()
+                exit_code = 1
+            finally:
+                os._exit(exit_code)
+        os.close(ready_write)
+        self.workers[pid] = (slot, time.monotonic())
+        print(f"Started worker {slot} (pid {pid})")
+        if wait_ready:
+            return pid, ready_read
+        os.close(ready_read)
+        return pid
+
+    def _wait_ready(self, pid, ready_fd, timeout):
+        """True once the worker reports it is serving; False if it exits or times out first"""
+        deadline = time.monotonic() + timeout
+        try:
+            while not self._stopping:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                readable, _, _ = select.select([ready_fd], [], [], min(remaining, 0.5))
+                if readable:
+                    # Empty means the pipe closed: the worker exited without reporting
+                    return os.read(ready_fd, 1) == b"1"
+                try:
+                    done, _ = os.waitpid(pid, os.WNOHANG)
+                except ChildProcessError:
+                    done = pid
+                if done:
+                    self.workers.pop(pid, None)
+                    return False
+            return False
+        finally:
+            os.close(ready_fd)
+
+    def _handle_stop(self, signum, frame):
+        self._stopping = True
+
+    def _handle_reload(self, signum, frame):
+        self._reload_requested = True
+
+    def _reap(self):
+        """Collect exited workers; returns [(pid, slot, uptime, status)]"""
+        exited = []
+        while self.workers:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                break
+            if pid in self.workers:
+                slot, started_at = self.workers.pop(pid)
+                exited.append((pid, slot, time.monotonic() - started_at, status))
+        return exited
+
+    def _wait_for_exit(self, pids, timeout):
+        deadline = time.monotonic() + timeout
+        pending = set(pids)
+        while pending and time.monotonic() < deadline:
+            for pid in list(pending):
+                try:
+                    done, _ = os.waitpid(pid, os.WNOHANG)
+                except ChildProcessError:
+                    done = pid
+                if done:
+                    pending.discard(pid)
+                    self.workers.pop(pid, None)
+            time.sleep(0.1)
+        for pid in pending:
+            print(f"Worker pid {pid} did not stop in {timeout}s, killing it")
+            try:
+                os.kill(pid, signal.SIGKILL)
+                os.waitpid(pid, 0)
+            except (ProcessLookupError, ChildProcessError):
+                pass
+            self.workers.pop(pid, None)
+
+    def _stop_workers(self, pids):
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        self._wait_for_exit(pids, self.graceful_timeout)
+
+    def _rolling_reload(self):
+        print("Reloading workers..." if self.worker_command else "Restarting workers...")
+        for pid, (slot, _) in list(self.workers.items()):
+            if self._stopping:
+                return
+            new_pid, ready_fd = self._spawn(slot, wait_ready=True)
+            if not self._wait_ready(new_pid, ready_fd, READY_TIMEOUT):
+                if new_pid in self.workers:
+                    self._stop_workers([new_pid])
+                print(f"Replacement for worker {slot} did not start; reload aborted, "
+                      "the remaining workers keep running")
+                return
+            self._stop_workers([pid])
+        print("Reload complete")
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self._handle_stop)
+        signal.signal(signal.SIGINT, self._handle_stop)
+        signal.signal(signal.SIGHUP, self._handle_reload)
+
+        for slot in range(self.worker_count):
+            self._spawn(slot)
+
+        try:
+            while not self._stopping:
+                if self._reload_requested:
+                    self._reload_requested = False
+                    self._rolling_reload()
+
+                for pid, slot, uptime, status in self._reap():
+                    if self._stopping:
+                        break
+                    print(f"Worker {slot} (pid {pid}) exited with status {status}")
+                    if uptime < MIN_UPTIME:
+                        delay = min(self.restart_delays.get(slot, 0.5) * 2, MAX_RESTART_DELAY)
+                    else:
+                        delay = 0
+                    self.restart_delays[slot] = delay or 0.5
+                    if delay:
+                        print(f"Worker {slot} is crashing on start, restarting in {delay:.1f}s")
+                        time.sleep(delay)
+                    self._spawn(slot)
+
+                time.sleep(0.2)
+        finally:
+            print("Stopping workers...")
+            self._stop_workers(list(self.workers))
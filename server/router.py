@@ -0,0 +1,145 @@
+import time
+
+
+def _int_converter(segment):
+    if not segment.isdigit():
+        raise ValueError(segment)
+    return int(segment)
+
+
+def _str_converter(segment):
+    if not segment:
+        raise ValueError(segment)
+    return segment
+
+
+# Parameter types usable in templates, e.g. /artworks/{artwork_id:int}
+CONVERTERS = {
+    'int': _int_converter,
+    'str': _str_converter,
+}
+
+
+class Route:
+    """A registered route"""
+
+    __slots__ = ('method', 'template', 'handler', 'name')
+
+    def __init__(self, method, template, handler, name):
+        self.method = method
+        self.template = template
+        self.handler = handler
+        self.name = name
+
+    def __repr__(self):
+        return f"Route({self.method} {self.template} -> {self.name})"
+
+
+class _Node:
+    __slots__ = ('static', 'params', 'routes')
+
+    def __init__(self):
+        self.static = {}   # segment -> _Node
+        self.params = []   # [(param name, type name, converter, _Node)]
+        self.routes = {}   # method -> Route
+
+
+def _split(path):
+    return path.strip('/').split('/') if path != '/' else []
+
+
+class Router:
+    """Method + path-template router backed by a segment trie
+
+    Templates are literal segments plus typed parameters:
+        router.add('GET', '/artworks/{artwork_id:int}', handler)
+    Untyped parameters ({name}) match any non-empty segment. Literal segments
+    take precedence over parameters, and int parameters over str ones. A
+    lookup walks the trie once per path segment, so unknown paths fail fast.
+    """
+
+    def __init__(self):
+        self._root = _Node()
+        self._routes = []
+
+    def add(self, method, template, handler, name=None):
+        """Register `handler` for `method` requests matching `template`"""
+        node = self._root
+        for segment in _split(template):
+            if segment.startswith('{') and segment.endswith('}'):
+                param, _, type_name = segment[1:-1].partition(':')
+                type_name = type_name or 'str'
+                if type_name not in CONVERTERS:
+                    raise ValueError(f"Unknown parameter type '{type_name}' in {template}")
+                for existing in node.params:
+                    if existing[0] == param and existing[1] == type_name:
+                        node = existing[3]
+                        break
+                else:
+                    child = _Node()
+                    node.params.append((param, type_name, CONVERTERS[type_name], child))
+                    # Try stricter converters first
+                    node.params.sort(key=lambda p: p[1] != 'int')
+                    node = child
+            else:
+                node = node.static.setdefault(segment, _Node())
+
+        if method in node.routes:
+            raise ValueError(f"Duplicate route {method} {template}")
+        route = Route(method, template, handler, name or getattr(handler, '__name__', repr(handler)))
+        node.routes[method] = route
+        self._routes.append(route)
+        return route
+
+    def match(self, method, path):
+        """Return (route, params) for a request, or (None, None) if nothing matches"""
+        node, params = self._find(self._root, _split(path), 0, {})
+        if node is None:
+            return None, None
+        route = node.routes.get(method)
+        if route is None:
+            return None, None
+        return route, params
+
+    def allowed_methods(self, path):
+        """Methods registered for a path (empty if the path is unknown)"""
+        node, _ = self._find(self._root, _split(path), 0, {})
+        return sorted(node.routes) if node is not None else []
+
+    def _find(self, node, segments, index, params):
+        if index == len(segments):
+            return (node, params) if node.routes else (None, None)
+        segment = segments[index]
+
+        child = node.static.get(segment)
+        if child is not None:
+            found, found_params = self._find(child, segments, index + 1, params)
+            if found is not None:
+                return found, found_params
+
+        for name, _, converter, child in node.params:
+            try:
+                value = converter(segment)
+            except ValueError:
+                continue
+            found, found_params = self._find(child, segments, index + 1, dict(params, **{name: value}))
+            if found is not None:
+                return found, found_params
+        return None, None
+
+    def routes(self):
+        """All registered routes, in registration order"""
+        return list(self._routes)
+
+    def describe(self):
+        """Human readable route table"""
+        return "\n".join(f"{r.method:<7} {r.template:<45} {r.name}" for r in self._routes)
+
+    def benchmark(self, requests, iterations=10000):
+        """Time lookups of (method, path) pairs; returns mean seconds per lookup"""
+        started = time.perf_counter()
+        for _ in range(iterations):
+            for method, path in requests:
+                self.match(method, path)
+        elapsed = time.perf_counter() - started
+        return elapsed / (iterations * len(requests))
@@ -0,0 +1,89 @@
+from decimal import Decimal
+
+
+def to_str(value):
+    return None if value is None else str(value)
+
+
+def to_float(value):
+    return float(value) if isinstance(value, Decimal) else value
+
+
+def isoformat(value):
+    return None if value is None else value.isoformat()
+
+
+class Field:
+    """One selected column and how it appears in API responses"""
+
+    __slots__ = ('column', 'name', 'convert')
+
+    def __init__(self, column, name=None, convert=None):
+        self.column = column
+        self.name = name or column
+        self.convert = convert
+
+
+class RowModel:
+    """Declarative mapping from a table's columns to response fields
+
+        ARTWORK_MODEL = RowModel('artworks', [
+            Field('id', convert=to_str),
+            Field('ticket_price', 'ticketPrice', to_float),
+            ...
+        ])
+        cursor.execute(f"SELECT {ARTWORK_MODEL.select} FROM artworks")
+        artworks = ARTWORK_MODEL.to_dicts(cursor, cursor.fetchall())
+
+    For each distinct column order a cursor returns, a builder is made once
+    that zips the row with the response names and converts only the columns
+    that need it, so listings do no per-row key lookups, renames or pops.
+    """
+
+    def __init__(self, table, fields):
+        self.table = table
+        self.fields = list(fields)
+        self.select = ", ".join(f.column for f in self.fields)
+        self._by_column = {f.column: f for f in self.fields}
+        self._builders = {}
+
+    def builder(self, column_names):
+        """Return the row -> dict function for a cursor's column order"""
+        key = tuple(column_names)
+        build = self._builders.get(key)
+        if build is None:
+            build = self._builders[key] = self._compile(key)
+        return build
+
+    def _compile(self, column_names):
+        names = []
+        conversions = []
+        for index, column in enumerate(column_names):
+            field = self._by_column.get(column)
+            if field is None:
+                # Columns the model does not declare pass through as they are
+                names.append(column)
+                continue
+            names.append(field.name)
+            if field.convert is not None:
+                conversions.append((index, field.convert))
+        names = tuple(names)
+        
+        if not conversions:
+            def build(row):
+                return dict(zip(names, row))
+            return build
+        
+        def build(row):
+            values = list(row)
+            for index, convert in conversions:
+                values[index] = convert(values[index])
+            return dict(zip(names, values))
+        return build
+
+    def to_dict(self, cursor, row):
+        return self.builder(cursor.column_names)(row)
+
+    def to_dicts(self, cursor, rows):
+        build = self.builder(cursor.column_names)
+        return [build(row) for row in rows]
@@ -0,0 +1,56 @@
+# JSON encoding for API responses.
+# Uses orjson when it is installed (pip install orjson) and the standard
+# library otherwise; JSON_BACKEND=json forces the standard library. Both
+# backends write Decimal as a number and date/datetime/time as ISO 8601, so
+# query results can be passed to dumps() as they come from the database.
+import datetime
+import json
+import os
+from decimal import Decimal
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if os.environ.get('JSON_BACKEND', '').lower() == 'json':
+    orjson = None
+
+BACKEND = 'orjson' if orjson is not None else 'json'
+
+
+def _default(obj):
+    """Encode the types the database returns that JSON has no type for"""
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, (datetime.date, datetime.time)):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+if orjson is not None:
+    # orjson encodes date/datetime/time itself; non-string keys are accepted
+    # like json.dumps does
+    _OPTIONS = orjson.OPT_NON_STR_KEYS
+
+    def dumps_bytes(data):
+        """Encode data as UTF-8 JSON bytes"""
+        return orjson.dumps(data, default=_default, option=_OPTIONS)
+
+    def dumps(data):
+        """Encode data as a JSON string"""
+        return orjson.dumps(data, default=_default, option=_OPTIONS).decode('utf-8')
+
+    loads = orjson.loads
+else:
+    _encoder = json.JSONEncoder(default=_default)
+
+    def dumps_bytes(data):
+        """Encode data as UTF-8 JSON bytes"""
+        return _encoder.encode(data).encode('utf-8')
+
+    def dumps(data):
+        """Encode data as a JSON string"""
+        return _encoder.encode(data)
+
+    loads = json.loads
@@ -1,27 +1,51 @@
 import os
-import json
+import sys
+import argparse
+import signal
+import threading
 import http.server
 import socketserver
 import urllib.parse
-import mimetypes
 from http import HTTPStatus
-from datetime import datetime
 from urllib.parse import parse_qs, urlparse
-from decimal import Decimal
+from email.utils import formatdate, parsedate_tz, mktime_tz
 
 # Import modules
 from auth import register_user, login_user, login_admin
-from artwork import get_all_artworks, get_artwork, create_artwork, update_artwork, delete_artwork
-from exhibition import get_all_exhibitions, get_exhibition, create_exhibition, update_exhibition, delete_exhibition
-from contact import create_contact_message, get_messages, update_message, json_dumps
+from artwork import (get_cached_artworks, get_cached_artwork, get_cached_artwork_page, create_artwork,
+                     update_artwork, delete_artwork, artwork_cache, ARTWORK_LIST)
+from exhibition import (get_cached_exhibitions, get_cached_exhibition, get_cached_exhibition_page,
+                        create_exhibition, update_exhibition, delete_exhibition, exhibition_cache,
+                        EXHIBITION_LIST)
+from pagination import QueryError
+from contact import create_contact_message, get_messages, update_message
+from serializer import dumps_bytes, loads
 from db_setup import initialize_database
-from middleware import auth_required, admin_required, extract_auth_token, verify_token
-from mpesa import handle_stk_push_request, check_transaction_status, handle_mpesa_callback
-from database import get_all_orders, get_all_exhibition_tickets
+from middleware import auth_required, admin_required, extract_auth_token, verify_token, token_cache
+from mpesa import (handle_stk_push_request, check_transaction_status, handle_mpesa_callback, get_user_orders,
+                   wait_for_transaction_status, access_tokens as mpesa_tokens, daraja, reconciler,
+                   payment_alerts)
+from payment_events import payment_events, wait_timeout
+from database import (get_orders_page, stream_orders, get_tickets_page, stream_tickets, get_pool_stats,
+                      ORDER_LIST, TICKET_LIST)
+from exports import ChunkedWriter, EXPORT_FORMATS, json_list_body
+from router import Router
+from uploads import save_upload_stream
+from image_variants import pipeline as image_pipeline
+from static_files import (file_cache, resolve_static_path, cache_control_for, parse_range,
+                          modified_since, send_body)
+from prefork import Supervisor, reuse_port_supported, enable_reuse_port, notify_ready
+from pool_server import (KeepAliveMixin, WorkerPoolHTTPServer, DEFAULT_THREADS, DEFAULT_QUEUE_SIZE,
+                         DEFAULT_REQUEST_TIMEOUT, DEFAULT_IDLE_TIMEOUT)
 
 # Define the port
 PORT = 8000
 
+# Browsers and proxies may reuse a catalog response for this many seconds,
+# then revalidate it with If-None-Match / If-Modified-Since
+CATALOG_MAX_AGE = int(os.environ.get('CATALOG_MAX_AGE', '30'))
+CATALOG_CACHE_CONTROL = f"public, max-age={CATALOG_MAX_AGE}, must-revalidate"
+
 # Ensure the static/uploads directory exists
 def ensure_uploads_directory():
     uploads_dir = os.path.join(os.path.dirname(__file__), "static", "uploads")
@@ -57,15 +81,6 @@ def create_default_exhibition_image():
 # Call this function to ensure the default exhibition image exists
 create_default_exhibition_image()
 
-# Custom JSON encoder to handle Decimal types
-class DecimalEncoder(json.JSONEncoder):
-    def default(self, obj):
-        if isinstance(obj, Decimal):
-            return float(obj)
-        if isinstance(obj, datetime):
-            return obj.isoformat()
-        return super(DecimalEncoder, self).default(obj)
-
 # Mock data for tickets (in a real app, this would come from a database)
 # We'll use this for demo purposes
 mock_tickets = [
@@ -104,10 +119,10 @@ mock_tickets = [
     }
 ]
 
-# Function to get all tickets (using database)
-def get_all_tickets(auth_header):
-    """Get all tickets (admin only)"""
-    print(f"Getting all tickets with auth header: {auth_header[:20]}... (truncated)")
+# Admin check for the ticket listing and export
+def check_tickets_access(auth_header):
+    """Return {"error": ...} unless the header carries an admin token"""
+    print(f"Checking ticket access with auth header: {auth_header[:20]}... (truncated)")
     
     # Extract and verify token
     token = extract_auth_token(auth_header)
@@ -125,58 +140,181 @@ def get_all_tickets(auth_header):
         print("Access denied - not an admin user")
         return {"error": "Unauthorized access: Admin privileges required"}
     
-    # Get tickets from database
-    return get_all_exhibition_tickets()
+    return payload
+
+# Route table: (method, path template, RequestHandler method name)
+ROUTES = [
+    ('GET', '/artworks', 'handle_list_artworks'),
+    ('GET', '/artworks/{artwork_id:int}', 'handle_get_artwork'),
+    ('GET', '/exhibitions', 'handle_list_exhibitions'),
+    ('GET', '/exhibitions/{exhibition_id:int}', 'handle_get_exhibition'),
+    ('GET', '/messages', 'handle_list_messages'),
+    ('GET', '/tickets', 'handle_list_tickets'),
+    ('GET', '/tickets/export', 'handle_export_tickets'),
+    ('GET', '/tickets/generate/{booking_id}', 'handle_generate_ticket'),
+    ('GET', '/admin/orders', 'handle_admin_orders'),
+    ('GET', '/admin/orders/export', 'handle_export_orders'),
+    ('GET', '/user/orders/{user_id}', 'handle_user_orders'),
+    ('GET', '/metrics', 'handle_metrics'),
+    ('POST', '/register', 'handle_register'),
+    ('POST', '/login', 'handle_login'),
+    ('POST', '/admin-login', 'handle_admin_login'),
+    ('POST', '/artworks', 'handle_create_artwork'),
+    ('POST', '/exhibitions', 'handle_create_exhibition'),
+    ('POST', '/contact', 'handle_create_contact_message'),
+    ('POST', '/uploads', 'handle_upload'),
+    ('POST', '/messages/{message_id:int}', 'handle_update_message'),
+    ('POST', '/mpesa/stk-push', 'handle_stk_push'),
+    ('POST', '/mpesa/callback', 'handle_mpesa_callback_request'),
+    ('POST', '/mpesa/status/{checkout_request_id}', 'handle_mpesa_status'),
+    ('POST', '/mpesa/status/{checkout_request_id}/wait', 'handle_mpesa_status_wait'),
+    ('PUT', '/artworks/{artwork_id:int}', 'handle_update_artwork'),
+    ('PUT', '/exhibitions/{exhibition_id:int}', 'handle_update_exhibition'),
+    ('DELETE', '/artworks/{artwork_id:int}', 'handle_delete_artwork'),
+    ('DELETE', '/exhibitions/{exhibition_id:int}', 'handle_delete_exhibition'),
+]
+
+# POST routes that read the request body themselves instead of from post_data
+STREAMING_POST_PATHS = {'/uploads'}
+
+def admin_error_status(error_message):
+    """Map an error from the admin artwork/exhibition functions to a status code"""
+    if "Authentication" in error_message or "authorized" in error_message:
+        return 401
+    if "Admin" in error_message:
+        return 403
+    if "not found" in error_message:
+        return 404
+    return 400
+
+def refresh_catalog_caches():
+    """Drop cached listings so newly generated image variants are picked up"""
+    artwork_cache.invalidate()
+    exhibition_cache.invalidate()
+
+def upload_error_status(error_message):
+    """Map an error from save_upload_stream to a status code"""
+    if "too large" in error_message:
+        return 413
+    if "Length Required" in error_message:
+        return 411
+    if "Unsupported image type" in error_message:
+        return 415
+    return 400
+
+def not_modified(headers, etag, last_modified):
+    """True if the request's conditional headers match the current representation
 
-# Function to get all orders (admin only)
-def get_all_admin_orders():
-    """Get all orders (admin only)"""
-    return get_all_orders()
+    If-None-Match takes precedence; If-Modified-Since is only consulted when
+    the client sent no entity tags.
+    """
+    if_none_match = headers.get('If-None-Match')
+    if if_none_match is not None:
+        if if_none_match.strip() == '*':
+            return True
+        # Weak comparison, as required for If-None-Match
+        tags = [tag.strip() for tag in if_none_match.split(',')]
+        return etag in [tag[2:] if tag.startswith('W/') else tag for tag in tags]
+    if_modified_since = headers.get('If-Modified-Since')
+    if if_modified_since:
+        try:
+            since = mktime_tz(parsedate_tz(if_modified_since))
+        except (TypeError, ValueError, OverflowError):
+            return False
+        return last_modified <= since
+    return False
 
 class RequestHandler(http.server.BaseHTTPRequestHandler):
     
-    def _set_response(self, status_code=200, content_type='application/json'):
+    def _set_response(self, status_code=200, content_type='application/json',
+                      cache_control='no-store', headers=None):
         self.send_response(status_code)
-        self.send_header('Content-type', content_type)
+        if content_type:
+            self.send_header('Content-type', content_type)
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'GET, POST, PUT, DELETE, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type, Authorization')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type, Authorization, If-None-Match')
+        self.send_header('Access-Control-Expose-Headers', 'ETag, Last-Modified')
+        if cache_control:
+            self.send_header('Cache-Control', cache_control)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
         self.end_headers()
     
+    def _send_json(self, data, status_code=200):
+        self._set_response(status_code)
+        self.wfile.write(dumps_bytes(data))
+    
     def do_OPTIONS(self):
         self._set_response()
     
     def serve_static_file(self, file_path):
-        """Serve a static file based on its MIME type"""
+        """Serve a static file, honouring Range and If-Modified-Since"""
         try:
-            # Check if file exists
-            if not os.path.exists(file_path):
-                self.send_response(404)
-                self.end_headers()
-                return
-                
-            # Determine the content type
-            content_type, _ = mimetypes.guess_type(file_path)
-            if not content_type:
-                content_type = 'application/octet-stream'
-                
-            # Get file size
-            file_size = os.path.getsize(file_path)
-            
-            # Set headers
-            self.send_response(200)
-            self.send_header('Content-type', content_type)
-            self.send_header('Content-Length', str(file_size))
+            entry = file_cache.acquire(file_path)
+        except OSError:
+            self.send_response(404)
             self.end_headers()
-            
-            # Read and send the file
-            with open(file_path, 'rb') as f:
-                self.wfile.write(f.read())
-                
+            return
+
+        try:
+            headers = {
+                'Last-Modified': entry.last_modified,
+                'Cache-Control': cache_control_for(file_path),
+                'Accept-Ranges': 'bytes',
+            }
+            if not modified_since(self.headers, entry.mtime):
+                self._send_static_headers(304, headers)
+                return
+
+            byte_range = None
+            if_range = self.headers.get('If-Range')
+            if if_range is None or if_range == entry.last_modified:
+                byte_range = parse_range(self.headers.get('Range'), entry.size)
+            if byte_range is False:
+                headers['Content-Range'] = f"bytes */{entry.size}"
+                headers['Content-Length'] = '0'
+                self._send_static_headers(416, headers)
+                return
+
+            headers['Content-type'] = entry.content_type
+            if byte_range:
+                start, end = byte_range
+                headers['Content-Range'] = f"bytes {start}-{end}/{entry.size}"
+                status = 206
+            else:
+                start, end = 0, entry.size - 1
+                status = 200
+            headers['Content-Length'] = str(end - start + 1)
+            self._send_static_headers(status, headers)
+            send_body(self.connection, self.wfile, entry, start, end - start + 1)
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
         except Exception as e:
             print(f"Error serving static file: {e}")
-            self.send_response(500)
-            self.end_headers()
+            self.close_connection = True
+        finally:
+            file_cache.release(entry)
+
+    def _send_static_headers(self, status_code, headers):
+        self.send_response(status_code)
+        self.send_header('Access-Control-Allow-Origin', '*')
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+    
+    def _query_params(self):
+        """Query string parameters of the request (first value of each)"""
+        query = urllib.parse.urlparse(self.path).query
+        return {name: values[0] for name, values in parse_qs(query).items()}
+    
+    def _dispatch(self, method, path):
+        """Find the route for the request and call its handler"""
+        route, params = router.match(method, path)
+        if route is None:
+            self._send_json({"error": "Resource not found"}, 404)
+            return
+        route.handler(self, **params)
     
     def do_GET(self):
         parsed_url = urllib.parse.urlparse(self.path)
@@ -184,153 +322,27 @@ class RequestHandler(http.server.BaseHTTPRequestHandler):
         
         # Handle static files (images, CSS, JS, etc.)
         if path.startswith('/static/'):
-            file_path = os.path.join(os.path.dirname(__file__), path[1:])
-            # Debugging info
-            print(f"Serving static file: {file_path}")
-            self.serve_static_file(file_path)
-            return
-        
-        # Handle API endpoints
-        # Handle GET /artworks
-        if path == '/artworks':
-            response = get_all_artworks()
-            self._set_response()
-            self.wfile.write(json_dumps(response).encode())
-            return
-        
-        # Handle GET /artworks/{id}
-        elif path.startswith('/artworks/') and len(path.split('/')) == 3:
-            artwork_id = path.split('/')[2]
-            response = get_artwork(artwork_id)
-            self._set_response()
-            self.wfile.write(json_dumps(response).encode())
-            return
-        
-        # Handle GET /exhibitions
-        elif path == '/exhibitions':
-            response = get_all_exhibitions()
-            self._set_response()
-            self.wfile.write(json_dumps(response).encode())
-            return
-        
-        # Handle GET /exhibitions/{id}
-        elif path.startswith('/exhibitions/') and len(path.split('/')) == 3:
-            exhibition_id = path.split('/')[2]
-            response = get_exhibition(exhibition_id)
-            self._set_response()
-            self.wfile.write(json_dumps(response).encode())
-            return
-        
-        # Handle GET /messages (admin only)
-        elif path == '/messages':
-            print("Processing GET /messages request")
-            auth_header = self.headers.get('Authorization', '')
-            print(f"Authorization header: {auth_header[:20]}... (truncated)")
-            
-            # Get messages
-            response = get_messages(auth_header)
-            print(f"Get messages response: {response}")
-            
-            if "error" in response:
-                self._set_response(401)
-                self.wfile.write(json_dumps({"error": response["error"]}).encode())
-                return
-            
-            self._set_response()
-            self.wfile.write(json_dumps(response).encode())
-            return
-            
-        # Handle GET /tickets (admin only)
-        elif path == '/tickets':
-            print("Processing GET /tickets request")
-            auth_header = self.headers.get('Authorization', '')
-            print(f"Authorization header: {auth_header[:20]}... (truncated)")
-            
-            # Get tickets
-            response = get_all_tickets(auth_header)
-            print(f"Get tickets response: {response}")
-            
-            if "error" in response:
-                self._set_response(401)
-                self.wfile.write(json_dumps({"error": response["error"]}).encode())
-                return
-            
-            self._set_response()
-            self.wfile.write(json_dumps(response).encode())
-            return
-            
-        # Handle GET /tickets/generate/{id} (generate ticket)
-        elif path.startswith('/tickets/generate/') and len(path.split('/')) == 4:
-            booking_id = path.split('/')[3]
-            print(f"Processing generate ticket request for booking {booking_id}")
-            auth_header = self.headers.get('Authorization', '')
-            
-            # Generate ticket
-            response = generate_ticket(booking_id, auth_header)
-            
-            if "error" in response:
-                self._set_response(401)
-                self.wfile.write(json_dumps({"error": response["error"]}).encode())
-                return
-            
-            self._set_response()
-            self.wfile.write(json_dumps(response).encode())
-            return
-        
-        # Handle admin orders and tickets
-        elif path == '/admin/orders':
-            auth_header = self.headers.get('Authorization', '')
-            token = extract_auth_token(auth_header)
-            
-            if not token:
-                self._set_response(401)
-                self.wfile.write(json_dumps({"error": "Authentication required"}).encode())
+            file_path = resolve_static_path(path)
+            if file_path is None:
+                self._send_json({"error": "Resource not found"}, 404)
                 return
-                
-            payload = verify_token(token)
-            if not payload.get("is_admin", False):
-                self._set_response(403)
-                self.wfile.write(json_dumps({"error": "Admin access required"}).encode())
-                return
-            
-            response = get_all_admin_orders()
-            if "error" in response:
-                self._set_response(500)
-            else:
-                self._set_response(200)
-            self.wfile.write(json_dumps(response).encode())
-            return
-            
-        # Handle user orders and tickets
-        elif path.startswith('/user/orders/'):
-            user_id = path.split('/')[-1]
-            auth_header = self.headers.get('Authorization', '')
-            token = extract_auth_token(auth_header)
-            
-            if not token:
-                self._set_response(401)
-                self.wfile.write(json_dumps({"error": "Authentication required"}).encode())
-                return
-                
-            payload = verify_token(token)
-            if str(payload.get("user_id")) != str(user_id):
-                self._set_response(403)
-                self.wfile.write(json_dumps({"error": "Unauthorized access"}).encode())
-                return
-            
-            response = get_user_orders(user_id)
-            if "error" in response:
-                self._set_response(500)
-            else:
-                self._set_response(200)
-            self.wfile.write(json_dumps(response).encode())
+            self.serve_static_file(file_path)
             return
         
-        # Default 404 response
-        self._set_response(404)
-        self.wfile.write(json_dumps({"error": "Resource not found"}).encode())
+        self._dispatch('GET', path)
     
     def do_POST(self):
+        path = urllib.parse.urlparse(self.path).path
+        if path in STREAMING_POST_PATHS:
+            # The handler streams the body; if it stops early (e.g. auth
+            # failed) the rest is unread, so the connection cannot be reused
+            self.post_data = {}
+            self.body_consumed = False
+            self._dispatch('POST', path)
+            if not self.body_consumed:
+                self.close_connection = True
+            return
+        
         # Get content length
         content_length = int(self.headers.get('Content-Length', 0))
         
@@ -346,7 +358,7 @@ class RequestHandler(http.server.BaseHTTPRequestHandler):
         if content_length > 0:
             if "application/json" in content_type:
                 # Handle JSON data
-                post_data = json.loads(self.rfile.read(content_length).decode('utf-8'))
+                post_data = loads(self.rfile.read(content_length))
                 print(f"Parsed JSON data: {post_data}")
             elif "multipart/form-data" in content_type:
                 # For multipart form data (like file uploads), will be handled in specific endpoints
@@ -359,358 +371,581 @@ class RequestHandler(http.server.BaseHTTPRequestHandler):
                     post_data[key] = post_data[key][0]
                 print(f"Parsed form data: {post_data}")
         
-        # Process based on path
-        path = self.path
+        self.post_data = post_data
+        self._dispatch('POST', path)
+    
+    def do_PUT(self):
+        # Get content length
+        content_length = int(self.headers.get('Content-Length', 0))
         
-        # Register user
-        if path == '/register':
-            if not post_data:
-                self._set_response(400)
-                self.wfile.write(json_dumps({"error": "Missing registration data"}).encode())
-                return
-            
-            print(f"Registration data: {post_data}")
-            
-            # Check required fields
-            required_fields = ['name', 'email', 'password']
-            missing_fields = [field for field in required_fields if field not in post_data]
-            
-            if missing_fields:
-                self._set_response(400)
-                self.wfile.write(json_dumps({"error": f"Missing required fields: {', '.join(missing_fields)}"}).encode())
-                return
-            
-            # Register the user
-            response = register_user(
-                post_data['name'], 
-                post_data['email'], 
-                post_data['password'],
-                post_data.get('phone', '')  # Optional field
-            )
-            
-            if "error" in response:
-                self._set_response(400)
-            else:
-                self._set_response(201)
-            
-            self.wfile.write(json_dumps(response).encode())
+        # Parse JSON data
+        post_data = {}
+        if content_length > 0:
+            post_data = loads(self.rfile.read(content_length))
+        
+        self.post_data = post_data
+        self._dispatch('PUT', urllib.parse.urlparse(self.path).path)
+    
+    def do_DELETE(self):
+        self._dispatch('DELETE', urllib.parse.urlparse(self.path).path)
+    
+    # GET routes
+    
+    def _send_cached(self, entry):
+        """Send a pre-serialized catalog response, or 304 if the client's copy is current"""
+        if not entry.cacheable:
+            self._set_response()
+            self.wfile.write(entry.body)
             return
+        validators = {
+            'ETag': entry.etag,
+            'Last-Modified': formatdate(entry.last_modified, usegmt=True),
+        }
+        if not_modified(self.headers, entry.etag, entry.last_modified):
+            self._set_response(304, content_type=None, cache_control=CATALOG_CACHE_CONTROL,
+                               headers=validators)
+            return
+        self._set_response(cache_control=CATALOG_CACHE_CONTROL, headers=validators)
+        self.wfile.write(entry.body)
+    
+    def _send_listing(self, spec, get_all, get_page):
+        """Send a catalog listing: the full list, or a page if paging/filter parameters were given"""
+        try:
+            query = spec.parse(self._query_params())
+        except QueryError as e:
+            self._send_json({"error": str(e)}, 400)
+            return
+        self._send_cached(get_all() if query is None else get_page(query))
+    
+    def handle_list_artworks(self):
+        self._send_listing(ARTWORK_LIST, get_cached_artworks, get_cached_artwork_page)
+    
+    def handle_get_artwork(self, artwork_id):
+        self._send_cached(get_cached_artwork(artwork_id))
+    
+    def handle_list_exhibitions(self):
+        self._send_listing(EXHIBITION_LIST, get_cached_exhibitions, get_cached_exhibition_page)
+    
+    def handle_get_exhibition(self, exhibition_id):
+        self._send_cached(get_cached_exhibition(exhibition_id))
+    
+    def handle_list_messages(self):
+        """GET /messages (admin only)"""
+        print("Processing GET /messages request")
+        auth_header = self.headers.get('Authorization', '')
+        print(f"Authorization header: {auth_header[:20]}... (truncated)")
         
-        # User login
-        elif path == '/login':
-            if not post_data:
-                self._set_response(400)
-                self.wfile.write(json_dumps({"error": "Missing login data"}).encode())
-                return
-            
-            # Check required fields
-            if 'email' not in post_data or 'password' not in post_data:
-                self._set_response(400)
-                self.wfile.write(json_dumps({"error": "Email and password required"}).encode())
-                return
-            
-            # Login the user
-            response = login_user(post_data['email'], post_data['password'])
-            
-            if "error" in response:
-                self._set_response(401)
-                self.wfile.write(json_dumps(response).encode())
-                return
-            
-            self._set_response(200)
-            self.wfile.write(json_dumps(response).encode())
+        # Get messages
+        response = get_messages(auth_header)
+        print(f"Get messages response: {response}")
+        
+        if "error" in response:
+            self._send_json({"error": response["error"]}, 401)
             return
         
-        # Admin login - Fixed the endpoint
-        elif path == '/admin-login':
-            if not post_data:
-                self._set_response(400)
-                self.wfile.write(json_dumps({"error": "Missing login data"}).encode())
-                return
-            
-            # Check required fields
-            if 'email' not in post_data or 'password' not in post_data:
-                self._set_response(400)
-                self.wfile.write(json_dumps({"error": "Email and password required"}).encode())
+        self._send_json(response)
+    
+    def _check_tickets_access(self):
+        """True if the request may read tickets; otherwise sends the error"""
+        auth_header = self.headers.get('Authorization', '')
+        response = check_tickets_access(auth_header)
+        if "error" in response:
+            self._send_json({"error": response["error"]}, 401)
+            return False
+        return True
+    
+    def handle_list_tickets(self):
+        """GET /tickets (admin only)"""
+        print("Processing GET /tickets request")
+        if self._check_tickets_access():
+            self._send_admin_listing(TICKET_LIST, "tickets", get_tickets_page, stream_tickets)
+    
+    def handle_export_tickets(self):
+        """GET /tickets/export?format=ndjson|csv (admin only)"""
+        if self._check_tickets_access():
+            self._send_export(TICKET_LIST, "tickets", stream_tickets)
+    
+    def handle_generate_ticket(self, booking_id):
+        print(f"Processing generate ticket request for booking {booking_id}")
+        auth_header = self.headers.get('Authorization', '')
+        
+        # Generate ticket
+        response = generate_ticket(booking_id, auth_header)
+        
+        if "error" in response:
+            self._send_json({"error": response["error"]}, 401)
+            return
+        
+        self._send_json(response)
+    
+    def _check_admin_access(self):
+        """True if the request carries an admin token; otherwise sends the error"""
+        auth_header = self.headers.get('Authorization', '')
+        token = extract_auth_token(auth_header)
+        
+        if not token:
+            self._send_json({"error": "Authentication required"}, 401)
+            return False
+            
+        payload = verify_token(token)
+        if not payload.get("is_admin", False):
+            self._send_json({"error": "Admin access required"}, 403)
+            return False
+        return True
+    
+    def handle_admin_orders(self):
+        if self._check_admin_access():
+            self._send_admin_listing(ORDER_LIST, "orders", get_orders_page, stream_orders)
+    
+    def handle_export_orders(self):
+        """GET /admin/orders/export?format=ndjson|csv (admin only)"""
+        if self._check_admin_access():
+            self._send_export(ORDER_LIST, "orders", stream_orders)
+    
+    def _send_admin_listing(self, spec, key, get_page, stream):
+        """Send one page if paging/filter parameters were given, else stream the full list"""
+        params = self._query_params()
+        try:
+            query = spec.parse(params)
+            full_list = query is None
+            if full_list:
+                query = spec.export_query(params)
+        except QueryError as e:
+            self._send_json({"error": str(e)}, 400)
+            return
+        if not full_list:
+            response = get_page(query)
+            self._send_json(response, 500 if "error" in response else 200)
+            return
+        rows = stream(query)
+        self._stream_response('application/json', json_list_body(key, rows), rows)
+    
+    def _send_export(self, spec, name, stream):
+        """Stream every matching row as NDJSON or CSV"""
+        params = self._query_params()
+        export_format = params.get('format', 'ndjson')
+        if export_format not in EXPORT_FORMATS:
+            self._send_json({"error": f"format must be one of: {', '.join(EXPORT_FORMATS)}"}, 400)
+            return
+        try:
+            query = spec.export_query(params)
+        except QueryError as e:
+            self._send_json({"error": str(e)}, 400)
+            return
+        rows = stream(query)
+        content_type, body, extension = EXPORT_FORMATS[export_format]
+        self._stream_response(content_type, body(rows), rows, filename=f"{name}.{extension}")
+    
+    def _stream_response(self, content_type, body, rows, filename=None):
+        """Send a 200 response whose body is produced while it is sent
+
+        `rows` (a database.RowStream, which `body` iterates) is opened and
+        closed here, so its connection is released even if the query fails,
+        the body is never started or the client disconnects part way. Uses
+        chunked transfer encoding on HTTP/1.1 connections.
+        """
+        chunked = self.protocol_version == 'HTTP/1.1' and self.request_version == 'HTTP/1.1'
+        try:
+            error = rows.open()
+            if error:
+                self._send_json(error, 500)
                 return
+            self.send_response(200)
+            self.send_header('Content-type', content_type)
+            self.send_header('Access-Control-Allow-Origin', '*')
+            self.send_header('Cache-Control', 'no-store')
+            if filename:
+                self.send_header('Content-Disposition', f'attachment; filename="{filename}"')
+            if chunked:
+                self.send_header('Transfer-Encoding', 'chunked')
+            else:
+                # HTTP/1.0: the body ends when the connection closes
+                self.close_connection = True
+            self.end_headers()
             
-            # Login as admin
-            response = login_admin(post_data['email'], post_data['password'])
-            
-            if "error" in response:
-                self._set_response(401)
-                self.wfile.write(json_dumps(response).encode())
-                return
+            writer = ChunkedWriter(self.wfile, chunked)
+            for data in body:
+                writer.write(data)
+            writer.close()
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+        except Exception as e:
+            # The status line has been sent; ending the connection without the
+            # final chunk tells the client the body is incomplete
+            print(f"Error streaming response: {e}")
+            self.close_connection = True
+        finally:
+            rows.close()
+    
+    def handle_user_orders(self, user_id):
+        auth_header = self.headers.get('Authorization', '')
+        token = extract_auth_token(auth_header)
+        
+        if not token:
+            self._send_json({"error": "Authentication required"}, 401)
+            return
             
-            self._set_response(200)
-            self.wfile.write(json_dumps(response).encode())
+        payload = verify_token(token)
+        if str(payload.get("user_id")) != str(user_id):
+            self._send_json({"error": "Unauthorized access"}, 403)
             return
         
-        # Create artwork (admin only)
-        elif path == '/artworks':
-            auth_header = self.headers.get('Authorization', '')
-            response = create_artwork(auth_header, post_data)
-            
-            if "error" in response:
-                error_message = response["error"]
-                
-                if "Authentication" in error_message or "authorized" in error_message:
-                    self._set_response(401)
-                elif "Admin" in error_message:
-                    self._set_response(403)
-                else:
-                    self._set_response(400)
-                    
-                self.wfile.write(json_dumps({"error": error_message}).encode())
-                return
-            
-            self._set_response(201)
-            self.wfile.write(json_dumps(response).encode())
+        response = get_user_orders(user_id)
+        self._send_json(response, 500 if "error" in response else 200)
+    
+    def handle_metrics(self):
+        """GET /metrics (server internals for monitoring, admin only)"""
+        if not self._check_admin_access():
+            return
+        response = {
+            "db_pool": get_pool_stats(),
+            "catalog_cache": {
+                "artworks": artwork_cache.stats(),
+                "exhibitions": exhibition_cache.stats(),
+            },
+            "static_files": file_cache.stats(),
+            "image_pipeline": image_pipeline.stats(),
+            "auth_tokens": token_cache.stats(),
+            "mpesa_token": mpesa_tokens.stats(),
+            "daraja": daraja.stats(),
+            "payment_events": payment_events.stats(),
+            "mpesa_reconciler": reconciler.stats(),
+            "mpesa_alerts": dict(payment_alerts),
+        }
+        if hasattr(self.server, 'stats'):
+            response["http_workers"] = self.server.stats()
+        self._send_json(response)
+    
+    # POST routes
+    
+    def handle_register(self):
+        post_data = self.post_data
+        if not post_data:
+            self._send_json({"error": "Missing registration data"}, 400)
             return
         
-        # Create exhibition (admin only)
-        elif path == '/exhibitions':
-            auth_header = self.headers.get('Authorization', '')
-            response = create_exhibition(auth_header, post_data)
-            
-            if "error" in response:
-                error_message = response["error"]
-                
-                if "Authentication" in error_message or "authorized" in error_message:
-                    self._set_response(401)
-                elif "Admin" in error_message:
-                    self._set_response(403)
-                else:
-                    self._set_response(400)
-                    
-                self.wfile.write(json_dumps({"error": error_message}).encode())
-                return
-            
-            self._set_response(201)
-            self.wfile.write(json_dumps(response).encode())
+        print(f"Registration data: {post_data}")
+        
+        # Check required fields
+        required_fields = ['name', 'email', 'password']
+        missing_fields = [field for field in required_fields if field not in post_data]
+        
+        if missing_fields:
+            self._send_json({"error": f"Missing required fields: {', '.join(missing_fields)}"}, 400)
             return
         
-        # Create contact message
-        elif path == '/contact':
-            response = create_contact_message(post_data)
-            
-            if "error" in response:
-                self._set_response(400)
-            else:
-                self._set_response(201)
-            
-            self.wfile.write(json_dumps(response).encode())
+        # Register the user
+        response = register_user(
+            post_data['name'], 
+            post_data['email'], 
+            post_data['password'],
+            post_data.get('phone', '')  # Optional field
+        )
+        
+        self._send_json(response, 400 if "error" in response else 201)
+    
+    def handle_login(self):
+        post_data = self.post_data
+        if not post_data:
+            self._send_json({"error": "Missing login data"}, 400)
             return
         
-        # Update message status (admin only)
-        elif path.startswith('/messages/'):
-            message_id = path.split('/')[2]
-            token = extract_auth_token(self)
-            if not token:
-                self._set_response(401)
-                self.wfile.write(json_dumps({"error": "Authentication required"}).encode())
-                return
-            
-            payload = verify_token(token)
-            if isinstance(payload, dict) and "error" in payload:
-                self._set_response(401)
-                self.wfile.write(json_dumps({"error": payload["error"]}).encode())
-                return
-            
-            # Check if user is admin
-            if not payload.get("is_admin", False):
-                self._set_response(403)
-                self.wfile.write(json_dumps({"error": "Unauthorized access: Admin privileges required"}).encode())
-                return
-            
-            response = update_message(self.headers.get('Authorization', ''), message_id, post_data)
-            
-            if "error" in response:
-                self._set_response(400)
-            else:
-                self._set_response(200)
-            
-            self.wfile.write(json_dumps(response).encode())
+        # Check required fields
+        if 'email' not in post_data or 'password' not in post_data:
+            self._send_json({"error": "Email and password required"}, 400)
             return
         
-        # New M-Pesa STK Push endpoint
-        elif path == '/mpesa/stk-push':
-            print("Processing M-Pesa STK Push request")
-            response = handle_stk_push_request(post_data)
-            
-            if "error" in response:
-                self._set_response(400)
-                self.wfile.write(json_dumps(response).encode())
-                return
-            
-            self._set_response(200)
-            self.wfile.write(json_dumps(response).encode())
+        # Login the user
+        response = login_user(post_data['email'], post_data['password'])
+        self._send_json(response, 401 if "error" in response else 200)
+    
+    def handle_admin_login(self):
+        post_data = self.post_data
+        if not post_data:
+            self._send_json({"error": "Missing login data"}, 400)
             return
-            
-        # M-Pesa callback endpoint
-        elif path == '/mpesa/callback':
-            print("Processing M-Pesa callback")
-            response = handle_mpesa_callback(post_data)
-            
-            if "error" in response:
-                self._set_response(400)
-                self.wfile.write(json_dumps(response).encode())
-                return
-            
-            self._set_response(200)
-            self.wfile.write(json_dumps(response).encode())
+        
+        # Check required fields
+        if 'email' not in post_data or 'password' not in post_data:
+            self._send_json({"error": "Email and password required"}, 400)
             return
-            
-        # M-Pesa transaction status check endpoint
-        elif path.startswith('/mpesa/status/'):
-            checkout_request_id = path.split('/')[3]
-            print(f"Checking M-Pesa transaction status for: {checkout_request_id}")
-            
-            response = check_transaction_status(checkout_request_id)
-            
-            if "error" in response:
-                self._set_response(400)
-                self.wfile.write(json_dumps(response).encode())
-                return
-            
-            self._set_response(200)
-            self.wfile.write(json_dumps(response).encode())
+        
+        # Login as admin
+        response = login_admin(post_data['email'], post_data['password'])
+        self._send_json(response, 401 if "error" in response else 200)
+    
+    def handle_create_artwork(self):
+        """POST /artworks (admin only)"""
+        auth_header = self.headers.get('Authorization', '')
+        response = create_artwork(auth_header, self.post_data)
+        
+        if "error" in response:
+            # Not-found does not apply to creation
+            status = admin_error_status(response["error"])
+            self._send_json({"error": response["error"]}, 400 if status == 404 else status)
             return
         
-        # Default 404 response
-        self._set_response(404)
-        self.wfile.write(json_dumps({"error": "Resource not found"}).encode())
+        self._send_json(response, 201)
     
-    def do_PUT(self):
-        # Get content length
-        content_length = int(self.headers.get('Content-Length', 0))
+    @admin_required
+    def handle_upload(self):
+        """POST /uploads (admin only): stream an image to the uploads directory
+
+        The body is the raw image (Content-Type image/*) or base64 / a data URL,
+        sent with Content-Length or Transfer-Encoding: chunked. The returned
+        URL can be used as image_url when creating or updating an artwork or
+        exhibition.
+        """
+        response = save_upload_stream(self.rfile, self.headers)
+        if "error" in response:
+            self._send_json(response, upload_error_status(response["error"]))
+            return
+        self.body_consumed = True
+        image_pipeline.submit(response["url"], refresh_catalog_caches)
+        self._send_json(response, 201)
+    
+    def handle_create_exhibition(self):
+        """POST /exhibitions (admin only)"""
+        auth_header = self.headers.get('Authorization', '')
+        response = create_exhibition(auth_header, self.post_data)
         
-        # Parse JSON data
-        post_data = {}
-        if content_length > 0:
-            post_data = json.loads(self.rfile.read(content_length).decode('utf-8'))
+        if "error" in response:
+            status = admin_error_status(response["error"])
+            self._send_json({"error": response["error"]}, 400 if status == 404 else status)
+            return
         
-        # Process based on path
-        path = self.path
+        self._send_json(response, 201)
+    
+    def handle_create_contact_message(self):
+        response = create_contact_message(self.post_data)
+        self._send_json(response, 400 if "error" in response else 201)
+    
+    def handle_update_message(self, message_id):
+        """POST /messages/{id} - update message status (admin only)"""
+        token = extract_auth_token(self)
+        if not token:
+            self._send_json({"error": "Authentication required"}, 401)
+            return
         
-        # Update artwork (admin only)
-        if path.startswith('/artworks/') and len(path.split('/')) == 3:
-            artwork_id = path.split('/')[2]
-            auth_header = self.headers.get('Authorization', '')
-            
-            response = update_artwork(auth_header, artwork_id, post_data)
-            
-            if "error" in response:
-                error_message = response["error"]
-                
-                if "Authentication" in error_message or "authorized" in error_message:
-                    self._set_response(401)
-                elif "Admin" in error_message:
-                    self._set_response(403)
-                elif "not found" in error_message:
-                    self._set_response(404)
-                else:
-                    self._set_response(400)
-                    
-                self.wfile.write(json_dumps({"error": error_message}).encode())
-                return
-            
-            self._set_response(200)
-            self.wfile.write(json_dumps(response).encode())
+        payload = verify_token(token)
+        if isinstance(payload, dict) and "error" in payload:
+            self._send_json({"error": payload["error"]}, 401)
             return
         
-        # Update exhibition (admin only)
-        elif path.startswith('/exhibitions/') and len(path.split('/')) == 3:
-            exhibition_id = path.split('/')[2]
-            auth_header = self.headers.get('Authorization', '')
-            
-            response = update_exhibition(auth_header, exhibition_id, post_data)
-            
-            if "error" in response:
-                error_message = response["error"]
-                
-                if "Authentication" in error_message or "authorized" in error_message:
-                    self._set_response(401)
-                elif "Admin" in error_message:
-                    self._set_response(403)
-                elif "not found" in error_message:
-                    self._set_response(404)
-                else:
-                    self._set_response(400)
-                    
-                self.wfile.write(json_dumps({"error": error_message}).encode())
-                return
-            
-            self._set_response(200)
-            self.wfile.write(json_dumps(response).encode())
+        # Check if user is admin
+        if not payload.get("is_admin", False):
+            self._send_json({"error": "Unauthorized access: Admin privileges required"}, 403)
             return
         
-        # Default 404 response
-        self._set_response(404)
-        self.wfile.write(json_dumps({"error": "Resource not found"}).encode())
+        response = update_message(self.headers.get('Authorization', ''), message_id, self.post_data)
+        self._send_json(response, 400 if "error" in response else 200)
     
-    def do_DELETE(self):
-        # Process based on path
-        path = self.path
+    def handle_stk_push(self):
+        print("Processing M-Pesa STK Push request")
+        response = handle_stk_push_request(self.post_data)
+        self._send_json(response, 400 if "error" in response else 200)
+    
+    def handle_mpesa_callback_request(self):
+        print("Processing M-Pesa callback")
+        response = handle_mpesa_callback(self.post_data)
+        self._send_json(response, 400 if "error" in response else 200)
+    
+    def handle_mpesa_status(self, checkout_request_id):
+        print(f"Checking M-Pesa transaction status for: {checkout_request_id}")
+        response = check_transaction_status(checkout_request_id)
+        self._send_json(response, 400 if "error" in response else 200)
+    
+    def handle_mpesa_status_wait(self, checkout_request_id):
+        """POST /mpesa/status/{id}/wait (long poll, answered when the payment completes or fails)"""
+        post_data = self.post_data if isinstance(self.post_data, dict) else {}
+        timeout = wait_timeout(post_data.get('timeout', self._query_params().get('timeout')))
+        response = wait_for_transaction_status(checkout_request_id, timeout)
+        self._send_json(response, 400 if "error" in response else 200)
+    
+    # PUT routes
+    
+    def handle_update_artwork(self, artwork_id):
+        """PUT /artworks/{id} (admin only)"""
+        auth_header = self.headers.get('Authorization', '')
+        response = update_artwork(auth_header, artwork_id, self.post_data)
         
-        # Delete artwork (admin only)
-        if path.startswith('/artworks/') and len(path.split('/')) == 3:
-            artwork_id = path.split('/')[2]
-            auth_header = self.headers.get('Authorization', '')
-            
-            response = delete_artwork(auth_header, artwork_id)
-            
-            if "error" in response:
-                error_message = response["error"]
-                
-                if "Authentication" in error_message or "authorized" in error_message:
-                    self._set_response(401)
-                elif "Admin" in error_message:
-                    self._set_response(403)
-                elif "not found" in error_message:
-                    self._set_response(404)
-                else:
-                    self._set_response(400)
-                    
-                self.wfile.write(json_dumps({"error": error_message}).encode())
-                return
-            
-            self._set_response(200)
-            self.wfile.write(json_dumps(response).encode())
+        if "error" in response:
+            self._send_json({"error": response["error"]}, admin_error_status(response["error"]))
             return
         
-        # Delete exhibition (admin only)
-        elif path.startswith('/exhibitions/') and len(path.split('/')) == 3:
-            exhibition_id = path.split('/')[2]
-            auth_header = self.headers.get('Authorization', '')
-            
-            response = delete_exhibition(auth_header, exhibition_id)
-            
-            if "error" in response:
-                error_message = response["error"]
-                
-                if "Authentication" in error_message or "authorized" in error_message:
-                    self._set_response(401)
-                elif "Admin" in error_message:
-                    self._set_response(403)
-                elif "not found" in error_message:
-                    self._set_response(404)
-                else:
-                    self._set_response(400)
-                    
-                self.wfile.write(json_dumps({"error": error_message}).encode())
-                return
-            
-            self._set_response(200)
-            self.wfile.write(json_dumps(response).encode())
+        self._send_json(response)
+    
+    def handle_update_exhibition(self, exhibition_id):
+        """PUT /exhibitions/{id} (admin only)"""
+        auth_header = self.headers.get('Authorization', '')
+        response = update_exhibition(auth_header, exhibition_id, self.post_data)
+        
+        if "error" in response:
+            self._send_json({"error": response["error"]}, admin_error_status(response["error"]))
+            return
+        
+        self._send_json(response)
+    
+    # DELETE routes
+    
+    def handle_delete_artwork(self, artwork_id):
+        """DELETE /artworks/{id} (admin only)"""
+        auth_header = self.headers.get('Authorization', '')
+        response = delete_artwork(auth_header, artwork_id)
+        
+        if "error" in response:
+            self._send_json({"error": response["error"]}, admin_error_status(response["error"]))
             return
         
-        # Default 404 response
-        self._set_response(404)
-        self.wfile.write(json_dumps({"error": "Resource not found"}).encode())
+        self._send_json(response)
+    
+    def handle_delete_exhibition(self, exhibition_id):
+        """DELETE /exhibitions/{id} (admin only)"""
+        auth_header = self.headers.get('Authorization', '')
+        response = delete_exhibition(auth_header, exhibition_id)
+        
+        if "error" in response:
+            self._send_json({"error": response["error"]}, admin_error_status(response["error"]))
+            return
+        
+        self._send_json(response)
+
+def build_router():
+    """Compile ROUTES into a Router bound to RequestHandler methods"""
+    compiled = Router()
+    for method, template, handler_name in ROUTES:
+        compiled.add(method, template, getattr(RequestHandler, handler_name), name=handler_name)
+    return compiled
+
+router = build_router()
+
+class KeepAliveRequestHandler(KeepAliveMixin, RequestHandler):
+    """RequestHandler speaking HTTP/1.1 with keep-alive, used by the worker-pool mode"""
+    pass
+
+def parse_args(argv=None):
+    """Parse command line options for the server"""
+    parser = argparse.ArgumentParser(description="AfriArt API server")
+    parser.add_argument('--port', type=int, default=PORT, help="Port to listen on")
+    parser.add_argument('--mode', choices=['threading', 'pool', 'async'], default='threading',
+                        help="threading: one thread per connection; pool: fixed worker pool with keep-alive; "
+                             "async: asyncio event loop")
+    parser.add_argument('--threads', type=int, default=DEFAULT_THREADS,
+                        help="Worker threads in pool mode, or threads for blocking routes in async mode")
+    parser.add_argument('--queue-size', type=int, default=DEFAULT_QUEUE_SIZE,
+                        help="Connections allowed to wait for a worker before answering 503 (pool mode)")
+    parser.add_argument('--request-timeout', type=float, default=DEFAULT_REQUEST_TIMEOUT,
+                        help="Seconds allowed to receive a request once it has started (pool and async modes)")
+    parser.add_argument('--idle-timeout', type=float, default=DEFAULT_IDLE_TIMEOUT,
+                        help="Seconds an idle keep-alive connection is kept open (pool and async modes)")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Number of pre-forked worker processes sharing the port (SO_REUSEPORT)")
+    # Set by the supervisor on the workers it starts
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--list-routes', action='store_true', help="Print the route table and exit")
+    parser.add_argument('--bench-routes', action='store_true', help="Benchmark route lookups and exit")
+    return parser.parse_args(argv)
+
+def limit_payment_waiters(args):
+    """Keep waiting payment-status requests to a quarter of a fixed thread count"""
+    payment_events.max_blocking_waiters = min(payment_events.max_blocking_waiters,
+                                              max(1, args.threads // 4))
+
+def create_server(args, reuse_port=False):
+    """Build the HTTP server for the selected serving mode"""
+    if args.mode == 'pool':
+        limit_payment_waiters(args)
+        KeepAliveRequestHandler.request_timeout = args.request_timeout
+        KeepAliveRequestHandler.idle_timeout = args.idle_timeout
+        print(f"Using worker pool: {args.threads} threads, queue size {args.queue_size}")
+        httpd = WorkerPoolHTTPServer(("", args.port), KeepAliveRequestHandler,
+                                     threads=args.threads, queue_size=args.queue_size,
+                                     bind_and_activate=False)
+    else:
+        httpd = socketserver.ThreadingTCPServer(("", args.port), RequestHandler, bind_and_activate=False)
+    
+    try:
+        if reuse_port:
+            enable_reuse_port(httpd.socket)
+        httpd.server_bind()
+        httpd.server_activate()
+    except Exception:
+        httpd.server_close()
+        raise
+    return httpd
+
+def run_async_server(args, reuse_port=False):
+    """Serve the routes from an asyncio event loop"""
+    import asyncio
+    from async_server import AsyncHTTPServer
+    
+    print(f"Starting asyncio server on port {args.port}...")
+    # Bridged routes share the --threads executor
+    limit_payment_waiters(args)
+    server = AsyncHTTPServer(RequestHandler, args.port, threads=args.threads,
+                             request_timeout=args.request_timeout, idle_timeout=args.idle_timeout,
+                             reuse_port=reuse_port)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        print("\nShutting down server...")
+    finally:
+        print("Server closed")
 
-def main():
+def serve_worker(args):
+    """Run one pre-forked worker until it receives SIGTERM"""
+    # Every worker runs one; only the one holding the leader lock queries Safaricom
+    reconciler.start()
+    if args.mode == 'async':
+        run_async_server(args, reuse_port=True)
+        return
+    
+    httpd = create_server(args, reuse_port=True)
+    # Bound and listening: the supervisor may now stop the worker this one replaces
+    notify_ready()
+    
+    def handle_sigterm(signum, frame):
+        # shutdown() waits for serve_forever() to return, so call it from another thread
+        threading.Thread(target=httpd.shutdown, daemon=True).start()
+    
+    signal.signal(signal.SIGTERM, handle_sigterm)
+    try:
+        httpd.serve_forever()
+    finally:
+        # Waits for in-flight requests to finish
+        httpd.server_close()
+
+def bench_routes(iterations=20000):
+    """Print the mean lookup time for a mix of matching and unknown paths"""
+    sample = [
+        ('GET', '/artworks'),
+        ('GET', '/artworks/42'),
+        ('GET', '/exhibitions/7'),
+        ('GET', '/user/orders/15'),
+        ('POST', '/mpesa/status/ws_CO_123456789'),
+        ('PUT', '/exhibitions/3'),
+        ('GET', '/no/such/route'),
+    ]
+    for method, path in sample:
+        per_lookup = router.benchmark([(method, path)], iterations)
+        print(f"{method:<7} {path:<35} {per_lookup * 1e6:.2f} us")
+    print(f"{'all':<43} {router.benchmark(sample, iterations) * 1e6:.2f} us per lookup")
+
+def main(argv=None):
     """Start the server"""
+    args = parse_args(argv)
+    
+    if args.list_routes:
+        print(router.describe())
+        return
+    if args.bench_routes:
+        bench_routes()
+        return
+    if args.worker:
+        # Started by the supervisor below, which has already set up the database
+        serve_worker(args)
+        return
+    
     # Initialize the database
     print("Initializing database...")
     initialize_database()
@@ -721,10 +956,28 @@ def main():
     # Create default exhibition image
     create_default_exhibition_image()
     
+    if args.workers > 1:
+        if not reuse_port_supported():
+            print("--workers needs fork() and SO_REUSEPORT, which this platform lacks")
+            return
+        print(f"Starting {args.workers} {args.mode} workers on port {args.port} (pid {os.getpid()})...")
+        print("Send SIGHUP for a rolling reload of the workers, SIGTERM to stop")
+        # Workers run in fresh interpreters, so a reload picks up new code
+        worker_argv = [sys.executable, os.path.abspath(__file__)]
+        worker_argv += list(sys.argv[1:] if argv is None else argv) + ['--worker']
+        Supervisor(args.workers, worker_command=lambda slot: worker_argv).run()
+        print("Server closed")
+        return
+    
+    reconciler.start()
+    if args.mode == 'async':
+        run_async_server(args)
+        return
+    
     # Create an HTTP server
-    print(f"Starting server on port {PORT}...")
-    httpd = socketserver.ThreadingTCPServer(("", PORT), RequestHandler)
-    print(f"Server running on port {PORT}")
+    print(f"Starting server on port {args.port}...")
+    httpd = create_server(args)
+    print(f"Server running on port {args.port}")
     
     try:
         httpd.serve_forever()
@@ -0,0 +1,218 @@
+import mimetypes
+import os
+import re
+import socket
+import stat as stat_module
+import threading
+import urllib.parse
+from collections import OrderedDict
+from email.utils import formatdate, parsedate_tz, mktime_tz
+
+STATIC_ROOT = os.path.realpath(os.path.join(os.path.dirname(__file__), "static"))
+
+# Open file descriptors kept for frequently served files
+STATIC_FD_CACHE_SIZE = int(os.environ.get('STATIC_FD_CACHE_SIZE', '128'))
+# max-age for files whose name does not contain a content hash
+STATIC_MAX_AGE = int(os.environ.get('STATIC_MAX_AGE', '300'))
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# A run of at least 16 hex digits right before the extension marks a
+# content-addressed file name, e.g. 3f2a...9c.jpg or artwork.3f2a...9c.webp
+HASHED_NAME_RE = re.compile(r'(?:^|[._-])[0-9a-f]{16,}\.[A-Za-z0-9]+$')
+
+# Chunk size when the body cannot be sent with sendfile
+READ_CHUNK_SIZE = 64 * 1024
+
+
+def resolve_static_path(url_path):
+    """Map a /static/... URL path to a file under STATIC_ROOT
+
+    Returns None for paths that escape the static directory (../, encoded
+    separators, symlinks pointing elsewhere).
+    """
+    relative = urllib.parse.unquote(url_path[len('/static/'):])
+    if '\x00' in relative:
+        return None
+    file_path = os.path.realpath(os.path.join(STATIC_ROOT, relative))
+    if os.path.commonpath([STATIC_ROOT, file_path]) != STATIC_ROOT:
+        return None
+    return file_path
+
+
+def cache_control_for(file_path):
+    """Cache-Control for a static file: content-hashed names never change"""
+    if HASHED_NAME_RE.search(os.path.basename(file_path)):
+        return IMMUTABLE_CACHE_CONTROL
+    return f"public, max-age={STATIC_MAX_AGE}"
+
+
+def parse_range(header, size):
+    """Parse a Range header against a file of `size` bytes
+
+    Returns (start, end) inclusive for a single satisfiable range, None to
+    serve the whole file (no header, or a form we do not support such as
+    multiple ranges), or False if the range cannot be satisfied.
+    """
+    if not header or not header.startswith('bytes='):
+        return None
+    spec = header[len('bytes='):].strip()
+    if ',' in spec:
+        return None
+    first, sep, last = spec.partition('-')
+    if not sep:
+        return None
+    try:
+        if first:
+            start = int(first)
+            end = int(last) if last else size - 1
+        else:
+            # Suffix range: the last N bytes
+            length = int(last)
+            if length == 0:
+                return False
+            start = max(size - length, 0)
+            end = size - 1
+    except ValueError:
+        return None
+    if start >= size:
+        return False
+    if start < 0 or end < start:
+        return None
+    return start, min(end, size - 1)
+
+
+def modified_since(headers, mtime):
+    """False if If-Modified-Since shows the client's copy is current"""
+    value = headers.get('If-Modified-Since')
+    if not value or headers.get('If-None-Match') is not None:
+        return True
+    try:
+        return int(mtime) > mktime_tz(parsedate_tz(value))
+    except (TypeError, ValueError, OverflowError):
+        return True
+
+
+class OpenFile:
+    """An open static file shared between requests"""
+
+    __slots__ = ('path', 'file', 'size', 'mtime', 'identity', 'content_type', 'users', 'evicted',
+                 '_read_lock')
+
+    def __init__(self, path, stat):
+        self.path = path
+        self.file = open(path, 'rb', buffering=0)
+        self.size = stat.st_size
+        self.mtime = stat.st_mtime
+        self.identity = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        content_type, _ = mimetypes.guess_type(path)
+        self.content_type = content_type or 'application/octet-stream'
+        self.users = 0
+        self.evicted = False
+        self._read_lock = threading.Lock()
+
+    @property
+    def last_modified(self):
+        return formatdate(self.mtime, usegmt=True)
+
+    def read(self, offset, count):
+        """Read a range of the file; safe to call from several threads"""
+        if hasattr(os, 'pread'):
+            return os.pread(self.file.fileno(), count, offset)
+        with self._read_lock:
+            self.file.seek(offset)
+            return self.file.read(count)
+
+
+class FileCache:
+    """LRU of open static files
+
+    Each lookup stats the path, so a file replaced on disk is reopened. A
+    file evicted while a request is still sending it is closed once that
+    request releases it.
+    """
+
+    def __init__(self, max_entries=STATIC_FD_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._files = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def acquire(self, path):
+        """Return an OpenFile for path (raises OSError if it cannot be opened)"""
+        stat = os.stat(path)
+        if not stat_module.S_ISREG(stat.st_mode):
+            raise IsADirectoryError(path)
+        identity = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            entry = self._files.get(path)
+            if entry is not None and entry.identity == identity:
+                self._files.move_to_end(path)
+                entry.users += 1
+                self.hits += 1
+                return entry
+            self.misses += 1
+
+        opened = OpenFile(path, stat)
+        with self._lock:
+            stale = self._files.pop(path, None)
+            if stale is not None:
+                self._evict(stale)
+            self._files[path] = opened
+            while len(self._files) > self.max_entries:
+                _, oldest = self._files.popitem(last=False)
+                self._evict(oldest)
+            opened.users += 1
+        return opened
+
+    def release(self, entry):
+        with self._lock:
+            entry.users -= 1
+            if entry.evicted and entry.users == 0:
+                entry.file.close()
+
+    def _evict(self, entry):
+        entry.evicted = True
+        if entry.users == 0:
+            entry.file.close()
+
+    def clear(self):
+        with self._lock:
+            for entry in self._files.values():
+                self._evict(entry)
+            self._files.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "open_files": len(self._files),
+                "max_open_files": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+file_cache = FileCache()
+
+
+def send_body(connection, wfile, entry, offset, count):
+    """Write `count` bytes of entry starting at `offset`
+
+    Uses sendfile when the handler writes to a real socket, so the data never
+    passes through Python. Otherwise (e.g. the asyncio bridge, which collects
+    responses in memory) the file is copied in chunks.
+    """
+    if count <= 0:
+        return
+    if isinstance(connection, socket.socket) and hasattr(os, 'sendfile'):
+        wfile.flush()
+        # socket.sendfile waits for the socket when it has a timeout set
+        connection.sendfile(entry.file, offset, count)
+        return
+    end = offset + count
+    while offset < end:
+        chunk = entry.read(offset, min(READ_CHUNK_SIZE, end - offset))
+        if not chunk:
+            break
+        wfile.write(chunk)
+        offset += len(chunk)
@@ -0,0 +1,56 @@
+# Expiry decisions of the M-Pesa reconciler, with fake query/expire functions:
+#
+#   python -m unittest test_mpesa_reconciler
+import unittest
+
+from mpesa_reconciler import Reconciler
+
+
+class FakeReconciler(Reconciler):
+    """Reconciler whose pending transactions come from a dict, not MySQL"""
+
+    def __init__(self, answers, stale):
+        super().__init__(self._fake_query, self._fake_expire, interval=1, min_age=1, rate=1000)
+        self.answers = answers
+        self.stale = stale
+        self.queried = []
+        self.expired = []
+
+    def _fake_query(self, checkout_request_id):
+        self.queried.append(checkout_request_id)
+        answer = self.answers[checkout_request_id]
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+    def _fake_expire(self, checkout_request_id):
+        self.expired.append(checkout_request_id)
+
+    def _pending(self, older_than):
+        return list(self.stale) if older_than == self.expiry else []
+
+
+class StaleTransactionTest(unittest.TestCase):
+
+    def test_query_error_does_not_expire(self):
+        reconciler = FakeReconciler({"ws_1": RuntimeError("circuit open")}, ["ws_1"])
+        reconciler.run_pass()
+        self.assertEqual(reconciler.queried, ["ws_1"])
+        self.assertEqual(reconciler.expired, [])
+        self.assertEqual(reconciler.stats()["errors"], 1)
+
+    def test_still_in_progress_expires(self):
+        reconciler = FakeReconciler({"ws_1": None}, ["ws_1"])
+        reconciler.run_pass()
+        self.assertEqual(reconciler.expired, ["ws_1"])
+        self.assertEqual(reconciler.stats()["expired"], 1)
+
+    def test_settled_answer_does_not_expire(self):
+        reconciler = FakeReconciler({"ws_1": "completed", "ws_2": "failed"}, ["ws_1", "ws_2"])
+        reconciler.run_pass()
+        self.assertEqual(reconciler.queried, ["ws_1", "ws_2"])
+        self.assertEqual(reconciler.expired, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,88 @@
+# Keep-alive framing tests for the worker-pool mode:
+#
+#   python -m unittest test_pool_server
+import http.server
+import socket
+import threading
+import unittest
+
+from pool_server import KeepAliveMixin, WorkerPoolHTTPServer, MAX_DRAIN_SIZE
+
+
+class IgnoresBodyHandler(http.server.BaseHTTPRequestHandler):
+    """Answers every request with its path and never reads the request body"""
+
+    def _answer(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain')
+        self.end_headers()
+        self.wfile.write(self.path.encode())
+
+    do_GET = do_POST = _answer
+
+    def log_message(self, format, *args):
+        pass
+
+
+class KeepAliveIgnoresBodyHandler(KeepAliveMixin, IgnoresBodyHandler):
+    pass
+
+
+def _request(method, path, body=b""):
+    head = f"{method} {path} HTTP/1.1\r\nHost: test\r\nContent-Length: {len(body)}\r\n\r\n"
+    return head.encode() + body
+
+
+class UnreadBodyTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = WorkerPoolHTTPServer(("127.0.0.1", 0), KeepAliveIgnoresBodyHandler, threads=2)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.client = socket.create_connection(self.server.server_address, timeout=5)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close(timeout=5)
+
+    def _read_all(self):
+        chunks = []
+        while True:
+            try:
+                data = self.client.recv(65536)
+            except socket.timeout:
+                break
+            if not data:
+                break
+            chunks.append(data)
+        return b"".join(chunks)
+
+    def test_unread_body_is_not_parsed_as_a_request(self):
+        smuggled = _request("GET", "/metrics")
+        self.client.sendall(_request("POST", "/upload", smuggled) + _request("GET", "/next"))
+        self.client.settimeout(1)
+        responses = self._read_all()
+        self.assertEqual(responses.count(b"HTTP/1.1 200"), 2)
+        self.assertIn(b"/upload", responses)
+        self.assertIn(b"/next", responses)
+        self.assertNotIn(b"/metrics", responses)
+
+    def test_get_with_body_keeps_connection_usable(self):
+        self.client.sendall(_request("GET", "/first", b"x" * 100) + _request("GET", "/second"))
+        self.client.settimeout(1)
+        responses = self._read_all()
+        self.assertIn(b"/first", responses)
+        self.assertIn(b"/second", responses)
+
+    def test_large_unread_body_closes_connection(self):
+        body = _request("GET", "/metrics") + b"x" * (MAX_DRAIN_SIZE * 2)
+        self.client.sendall(_request("POST", "/upload", body)[:4096])
+        self.client.settimeout(5)
+        responses = self._read_all()
+        self.assertIn(b"Connection: close", responses)
+        self.assertEqual(responses.count(b"HTTP/1.1 200"), 1)
+        self.assertNotIn(b"/metrics", responses)
+
+
+if __name__ == "__main__":
+    unittest.main()
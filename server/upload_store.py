@@ -0,0 +1,162 @@
+# Reference counts and garbage collection for the uploads store.
+# Uploaded images are stored once under a name derived from their content (see
+# uploads.UploadWriter). A file's reference count is the number of artworks and
+# exhibitions whose image_url points at it; files with no references are
+# orphans, left behind when an image is replaced or its row deleted.
+#
+#   python upload_store.py stats            # reference counts and orphans
+#   python upload_store.py gc [--dry-run]   # delete orphans
+import argparse
+import os
+import sys
+import time
+
+from database import get_db_connection
+from uploads import UPLOADS_DIR
+from image_variants import VARIANTS_DIR
+
+# Files referenced by the frontend or used as fallbacks, never collected
+PROTECTED_FILES = {"placeholder.jpg", "default_exhibition.jpg"}
+# Orphans younger than this are kept: an image uploaded through POST /uploads
+# is not referenced until the artwork or exhibition using it is saved
+DEFAULT_GRACE_PERIOD = 24 * 60 * 60
+# Temp files of uploads that never finished
+STALE_TEMP_AGE = 60 * 60
+
+REFERENCE_QUERY = """
+SELECT image_url, COUNT(*) FROM artworks GROUP BY image_url
+UNION ALL
+SELECT image_url, COUNT(*) FROM exhibitions GROUP BY image_url
+"""
+
+
+def reference_counts():
+    """Map upload file name -> number of rows using it, or None if the database is unavailable"""
+    connection = get_db_connection()
+    if connection is None:
+        return None
+    cursor = connection.cursor()
+    try:
+        cursor.execute(REFERENCE_QUERY)
+        counts = {}
+        for image_url, count in cursor.fetchall():
+            if not image_url or image_url.startswith('data:') or 'base64' in image_url:
+                continue
+            # Same mapping the catalog uses: anything else resolves to the
+            # file of that name in the uploads directory
+            name = os.path.basename(image_url)
+            counts[name] = counts.get(name, 0) + count
+        return counts
+    finally:
+        cursor.close()
+        connection.close()
+
+
+def stored_files():
+    """Map file name -> (size, mtime) for every image in the store"""
+    files = {}
+    for entry in os.scandir(UPLOADS_DIR):
+        if entry.is_file() and not entry.name.startswith('.'):
+            stat = entry.stat()
+            files[entry.name] = (stat.st_size, stat.st_mtime)
+    return files
+
+
+def variant_files(name):
+    """Paths of the resized variants of an upload"""
+    stem = os.path.splitext(name)[0]
+    try:
+        names = os.listdir(VARIANTS_DIR)
+    except FileNotFoundError:
+        return []
+    return [os.path.join(VARIANTS_DIR, variant) for variant in names
+            if variant.partition('-')[2].rpartition('.')[0] == stem]
+
+
+def find_orphans(counts, files, grace_period, now=None):
+    """Names of unreferenced files older than the grace period"""
+    now = time.time() if now is None else now
+    return sorted(
+        name for name, (_, mtime) in files.items()
+        if name not in PROTECTED_FILES and not counts.get(name) and now - mtime >= grace_period
+    )
+
+
+def collect_garbage(grace_period=DEFAULT_GRACE_PERIOD, dry_run=False):
+    """Delete orphaned uploads, their variants and stale temp files
+
+    Returns {"deleted": [...], "bytes": n} or {"error": ...}.
+    """
+    counts = reference_counts()
+    if counts is None:
+        # Without the reference counts every file would look orphaned
+        return {"error": "Database connection failed"}
+
+    deleted = []
+    reclaimed = 0
+    for name in find_orphans(counts, stored_files(), grace_period):
+        path = os.path.join(UPLOADS_DIR, name)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        # Re-check: an identical upload refreshes the mtime of the existing file
+        if time.time() - stat.st_mtime < grace_period:
+            continue
+        for target in [path] + variant_files(name):
+            size = os.path.getsize(target) if os.path.exists(target) else 0
+            if not dry_run:
+                try:
+                    os.unlink(target)
+                except FileNotFoundError:
+                    continue
+            deleted.append(os.path.relpath(target, UPLOADS_DIR))
+            reclaimed += size
+
+    for entry in os.scandir(UPLOADS_DIR):
+        if entry.name.startswith('.upload-') and time.time() - entry.stat().st_mtime > STALE_TEMP_AGE:
+            if not dry_run:
+                os.unlink(entry.path)
+            deleted.append(entry.name)
+
+    return {"deleted": deleted, "bytes": reclaimed}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage the content-addressed uploads store")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("stats", help="Show reference counts and orphaned files")
+    gc_parser = subparsers.add_parser("gc", help="Delete files no artwork or exhibition references")
+    gc_parser.add_argument("--dry-run", action="store_true", help="List what would be deleted")
+    gc_parser.add_argument("--grace", type=float, default=DEFAULT_GRACE_PERIOD,
+                           help="Keep orphans modified within this many seconds")
+    args = parser.parse_args(argv)
+
+    if args.command == "stats":
+        counts = reference_counts()
+        if counts is None:
+            print("Database connection failed")
+            return 1
+        files = stored_files()
+        orphans = find_orphans(counts, files, 0)
+        for name in sorted(files):
+            print(f"{counts.get(name, 0):5d}  {files[name][0]:>10d}  {name}")
+        missing = sorted(name for name in counts if name not in files)
+        print(f"{len(files)} files, {len(orphans)} orphaned "
+              f"({sum(files[name][0] for name in orphans)} bytes)")
+        if missing:
+            print(f"Referenced but missing: {', '.join(missing)}")
+        return 0
+
+    result = collect_garbage(args.grace, args.dry_run)
+    if "error" in result:
+        print(result["error"])
+        return 1
+    for name in result["deleted"]:
+        print(("Would delete " if args.dry_run else "Deleted ") + name)
+    print(f"{'Would reclaim' if args.dry_run else 'Reclaimed'} {result['bytes']} bytes")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
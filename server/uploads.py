@@ -0,0 +1,271 @@
+import base64
+import binascii
+import hashlib
+import os
+import tempfile
+
+UPLOADS_DIR = os.path.join(os.path.dirname(__file__), "static", "uploads")
+UPLOADS_URL = "/static/uploads"
+
+# Largest decoded image accepted by the streaming upload endpoint (bytes)
+MAX_UPLOAD_SIZE = int(os.environ.get('MAX_UPLOAD_SIZE', str(20 * 1024 * 1024)))
+# Bytes read from the request (or base64 characters decoded) per step
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+_BASE64_CHARS = b"ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/="
+# Every byte that is not part of the base64 alphabet, removed before decoding
+# (b64decode ignores them too, so line-wrapped data still decodes)
+_NON_BASE64 = bytes(b for b in range(256) if b not in _BASE64_CHARS)
+
+
+class UploadError(Exception):
+    """The upload was rejected; the message is safe to return to the client"""
+
+
+def ensure_uploads_directory():
+    if not os.path.exists(UPLOADS_DIR):
+        os.makedirs(UPLOADS_DIR)
+        print(f"Created directory: {UPLOADS_DIR}")
+
+
+class Base64Decoder:
+    """Incremental base64 decoder
+
+    feed() accepts pieces of a base64 string at arbitrary boundaries and
+    returns the bytes decoded so far; finish() decodes the remainder.
+    """
+
+    def __init__(self):
+        self._pending = b""
+
+    def feed(self, data):
+        if isinstance(data, str):
+            data = data.encode('ascii', 'ignore')
+        data = self._pending + data.translate(None, _NON_BASE64)
+        usable = len(data) - len(data) % 4
+        self._pending = data[usable:]
+        return base64.b64decode(data[:usable]) if usable else b""
+
+    def finish(self):
+        pending, self._pending = self._pending, b""
+        return base64.b64decode(pending) if pending else b""
+
+
+# Leading bytes of the image formats we accept. Files are typed by content,
+# never by the client's declared type: anything else (SVG and HTML, which
+# would run scripts when served from our origin) is refused.
+_SIGNATURES = (
+    (b"\xff\xd8\xff", '.jpg'),
+    (b"\x89PNG\r\n\x1a\n", '.png'),
+    (b"GIF87a", '.gif'),
+    (b"GIF89a", '.gif'),
+)
+
+
+# Bytes needed to recognise every format above
+_SNIFF_SIZE = 12
+
+UNSUPPORTED_IMAGE_MESSAGE = "Unsupported image type: upload a JPEG, PNG, GIF or WebP image"
+
+
+def sniff_extension(head):
+    """Extension for the image whose first bytes are `head`, None if it is not JPEG, PNG, GIF or WebP"""
+    for signature, extension in _SIGNATURES:
+        if head.startswith(signature):
+            return extension
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return '.webp'
+    return None
+
+
+def content_url(filename):
+    return f"{UPLOADS_URL}/{filename}"
+
+
+class UploadWriter:
+    """Writes an upload into the content-addressed uploads store
+
+    Data goes to a temp file which commit() renames to <sha256 prefix><ext>,
+    so readers never see a partially written image and the same image
+    uploaded twice is stored once. The extension comes from the image's
+    leading bytes; other content raises UploadError as soon as they arrive. Files are not deleted when the artwork or
+    exhibition using them changes; `python upload_store.py gc` removes the
+    ones nothing references.
+    """
+
+    def __init__(self, max_size=None):
+        ensure_uploads_directory()
+        self.max_size = max_size
+        self.size = 0
+        self._head = b""
+        self._hash = hashlib.sha256()
+        fd, self._temp_path = tempfile.mkstemp(dir=UPLOADS_DIR, prefix='.upload-', suffix='.part')
+        self._file = os.fdopen(fd, 'wb')
+
+    def write(self, data):
+        if not data:
+            return
+        self.size += len(data)
+        if self.max_size is not None and self.size > self.max_size:
+            raise UploadError(f"Upload too large (limit {self.max_size} bytes)")
+        if len(self._head) < _SNIFF_SIZE:
+            self._head += data[:_SNIFF_SIZE]
+            if len(self._head) >= _SNIFF_SIZE and sniff_extension(self._head) is None:
+                raise UploadError(UNSUPPORTED_IMAGE_MESSAGE)
+        self._hash.update(data)
+        self._file.write(data)
+
+    def commit(self):
+        """Move the finished file into the store; returns its URL path"""
+        if self.size == 0:
+            raise UploadError("Upload is empty")
+        extension = sniff_extension(self._head)
+        if extension is None:
+            raise UploadError(UNSUPPORTED_IMAGE_MESSAGE)
+        filename = self._hash.hexdigest()[:32] + extension
+        target = os.path.join(UPLOADS_DIR, filename)
+        if os.path.exists(target):
+            # Already stored; refresh its mtime so a running gc treats it as new
+            self.abort()
+            os.utime(target)
+        else:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+            os.replace(self._temp_path, target)
+        return content_url(filename)
+
+    def abort(self):
+        self._file.close()
+        try:
+            os.unlink(self._temp_path)
+        except FileNotFoundError:
+            pass
+
+
+def split_data_url(value):
+    """Parse the "data:image/png;base64," prefix of a data URL
+
+    Returns (content type, offset of the base64 data); (None, 0) for bare
+    base64. Raises UploadError for a data URL that is not base64 encoded.
+    """
+    header, sep, _ = value[:256].partition(",")
+    if not sep:
+        return None, 0
+    if ';base64' not in header:
+        raise UploadError("Not a valid base64 image format")
+    content_type = header[5:].split(';', 1)[0] if header.startswith('data:') else None
+    return content_type, len(header) + 1
+
+
+def save_base64_image(base64_str):
+    """Decode a base64 string (or data URL) to a new file in the uploads directory
+
+    The string is decoded a slice at a time, so the decoded image is never
+    held in memory as a whole. Returns the image's URL path. Raises
+    UploadError for a data URL that is not base64, an empty image or one
+    that is not JPEG, PNG, GIF or WebP, and binascii.Error if the data
+    cannot be decoded.
+    """
+    _, offset = split_data_url(base64_str)
+    decoder = Base64Decoder()
+    writer = UploadWriter()
+    try:
+        for start in range(offset, len(base64_str), UPLOAD_CHUNK_SIZE):
+            writer.write(decoder.feed(base64_str[start:start + UPLOAD_CHUNK_SIZE]))
+        writer.write(decoder.finish())
+        return writer.commit()
+    except BaseException:
+        writer.abort()
+        raise
+
+
+def iter_request_body(rfile, headers, chunk_size=UPLOAD_CHUNK_SIZE):
+    """Yield the request body in pieces, for Content-Length or chunked requests"""
+    if 'chunked' in headers.get('Transfer-Encoding', '').lower():
+        while True:
+            line = rfile.readline(1024)
+            try:
+                size = int(line.split(b";", 1)[0].strip(), 16)
+            except ValueError:
+                raise UploadError("Malformed chunked body")
+            if size == 0:
+                # Skip any trailers up to the blank line ending the body
+                while rfile.readline(1024) not in (b"\r\n", b"\n", b""):
+                    pass
+                return
+            while size:
+                data = rfile.read(min(size, chunk_size))
+                if not data:
+                    raise UploadError("Upload ended early")
+                size -= len(data)
+                yield data
+            rfile.readline(1024)
+        return
+
+    length = headers.get('Content-Length')
+    if length is None:
+        raise UploadError("Length Required: send Content-Length or Transfer-Encoding: chunked")
+    try:
+        remaining = int(length)
+    except ValueError:
+        raise UploadError("Invalid Content-Length")
+    while remaining > 0:
+        data = rfile.read(min(remaining, chunk_size))
+        if not data:
+            raise UploadError("Upload ended early")
+        remaining -= len(data)
+        yield data
+
+
+def _start_base64_upload(head):
+    """Open the writer for a base64 body; returns (writer, base64 data in head)"""
+    _, offset = split_data_url(head[:256].decode('ascii', 'ignore'))
+    return UploadWriter(MAX_UPLOAD_SIZE), head[offset:]
+
+
+def save_upload_stream(rfile, headers):
+    """Stream a raw request body into the uploads directory
+
+    The body is either the image bytes (Content-Type image/*) or its base64
+    encoding, optionally as a data URL (any other Content-Type); either way
+    it must be a JPEG, PNG, GIF or WebP image. Only one chunk of the body is
+    in memory at a time. Returns {"url": ...} or {"error": ...}.
+    """
+    content_type = headers.get('Content-Type', '').split(';', 1)[0].strip().lower()
+    is_binary = content_type.startswith('image/')
+    body = iter_request_body(rfile, headers)
+    writer = None
+    try:
+        if is_binary:
+            writer = UploadWriter(MAX_UPLOAD_SIZE)
+            for data in body:
+                writer.write(data)
+        else:
+            decoder = Base64Decoder()
+            head = b""
+            for data in body:
+                if writer is None:
+                    # Wait for enough of the body to see a data URL prefix
+                    head += data
+                    if b"," not in head[:256] and len(head) < 256:
+                        continue
+                    writer, data = _start_base64_upload(head)
+                writer.write(decoder.feed(data))
+            if writer is None:
+                writer, data = _start_base64_upload(head)
+                writer.write(decoder.feed(data))
+            writer.write(decoder.finish())
+        return {"url": writer.commit()}
+    except UploadError as e:
+        if writer is not None:
+            writer.abort()
+        return {"error": str(e)}
+    except (binascii.Error, ValueError) as e:
+        if writer is not None:
+            writer.abort()
+        return {"error": f"Failed to decode base64 data: {e}"}
+    except BaseException:
+        if writer is not None:
+            writer.abort()
+        raise